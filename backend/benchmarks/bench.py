@@ -0,0 +1,395 @@
+"""
+Load test the real FastAPI app against the local fixture pages.
+
+    python benchmarks/bench.py                          # all scenarios, starts its own server
+    python benchmarks/bench.py --scenarios capture --concurrency 8 --requests 40
+    python benchmarks/bench.py --output benchmarks/baseline.json
+    python benchmarks/bench.py --baseline benchmarks/baseline.json   # diff, exit 1 on regression
+
+Scenarios:
+  capture     POST /capture
+  queue       POST /capture/queue, then poll /capture/status until the job is done
+  screenshot  GET /screenshot
+
+Each scenario starts from an empty screenshot cache and requests the
+fixtures round-robin, so from the second round on requests hit the cache
+(or join an identical capture that is still running). --no-cache makes
+every request a distinct, uncached capture instead. Reports throughput,
+latency percentiles, peak RSS of the server process tree (Chromium
+included) and the screenshot cache hit ratio.
+
+Nothing leaves the machine: the fixtures are served on 127.0.0.1 and the
+app is started with a fresh, temporary disk cache.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import shutil
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fixtures
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("capture", "queue", "screenshot")
+# Compared against the baseline; higher is better only for throughput
+COMPARED = (
+    ("throughput_rps", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("peak_rss_mb", False),
+)
+
+def http(method: str, url: str, body: Optional[Dict] = None, timeout: float = 180) -> Tuple[int, bytes]:
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def http_json(method: str, url: str, body: Optional[Dict] = None) -> Dict:
+    status, payload = http(method, url, body)
+    if status != 200:
+        raise RuntimeError(f"{method} {url} returned {status}: {payload[:200]!r}")
+    return json.loads(payload)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear interpolation between closest ranks"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class RssSampler:
+    """Peak summed RSS of a process and all its descendants (Linux /proc)"""
+    def __init__(self, pid: Optional[int], interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _children(pid: int) -> List[int]:
+        children = []
+        try:
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{tid}/children") as f:
+                    children.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        return children
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def sample(self) -> int:
+        total, stack = 0, [self.pid]
+        while stack:
+            pid = stack.pop()
+            total += self._rss(pid)
+            stack.extend(self._children(pid))
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.pid and os.path.exists(f"/proc/{self.pid}"):
+            self.peak = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak / 1024 / 1024, 1) if self.peak else None
+
+def start_app(port: int, env_overrides: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    cache_dir = tempfile.mkdtemp(prefix="dribble-bench-")
+    env = {
+        **os.environ,
+        "DISK_CACHE_DIR": cache_dir,
+        "STATE_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        **env_overrides,
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    return process, cache_dir
+
+def wait_until_ready(base_url: str, timeout: float = 180):
+    """The app answers and at least one browser instance accepts pages (/ready)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = http("GET", f"{base_url}/ready")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{base_url} did not become ready within {timeout:.0f}s")
+
+def cache_counters(base_url: str) -> Tuple[int, int]:
+    """(hits, lookups) over both screenshot cache tiers"""
+    stats = http_json("GET", f"{base_url}/cache/stats")
+    memory, disk = stats["memory"], stats["disk"]
+    hits = memory["hits"] + disk.get("hits", 0)
+    return hits, memory["hits"] + memory["misses"]
+
+def make_request(scenario: str, base_url: str, use_cache: bool) -> Callable[[str], None]:
+    def capture(url: str):
+        http_json("POST", f"{base_url}/capture", {"url": url, "use_cache": use_cache})
+
+    def queue(url: str):
+        job = http_json("POST", f"{base_url}/capture/queue", {"url": url, "use_cache": use_cache})
+        while True:
+            status = http_json("GET", f"{base_url}/capture/status/{job['job_id']}")
+            if status["status"] == "completed":
+                return
+            if status["status"] == "failed":
+                raise RuntimeError(status.get("error", "job failed"))
+            if status["status"] == "cancelled":
+                raise RuntimeError("job cancelled")
+            time.sleep(0.1)
+
+    def screenshot(url: str):
+        query = urllib.parse.urlencode({"url": url, "use_cache": str(use_cache).lower()})
+        status, payload = http("GET", f"{base_url}/screenshot?{query}")
+        if status != 200:
+            raise RuntimeError(f"/screenshot returned {status}: {payload[:200]!r}")
+
+    return {"capture": capture, "queue": queue, "screenshot": screenshot}[scenario]
+
+def run_scenario(scenario: str, base_url: str, fixture_url: str, pages: List[str], requests: int,
+                 concurrency: int, use_cache: bool, sampler: RssSampler) -> Dict:
+    http("DELETE", f"{base_url}/cache/clear")
+    hits_before, lookups_before = cache_counters(base_url)
+    send = make_request(scenario, base_url, use_cache)
+
+    def one(index: int) -> Tuple[str, float, Optional[str]]:
+        page = pages[index % len(pages)]
+        url = f"{fixture_url}/{page}"
+        if not use_cache:
+            url += f"?run={index}"  # Distinct URLs: no cache hits and no shared in-flight captures
+        started = time.perf_counter()
+        try:
+            send(url)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return page, (time.perf_counter() - started) * 1000, error
+
+    with sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            outcomes = list(executor.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    hits_after, lookups_after = cache_counters(base_url)
+    lookups = lookups_after - lookups_before
+    latencies = [ms for _, ms, error in outcomes if error is None]
+    errors = [error for _, _, error in outcomes if error is not None]
+    per_page = {}
+    for page in pages:
+        page_latencies = [ms for name, ms, error in outcomes if name == page and error is None]
+        per_page[page] = {"count": len(page_latencies), "p50_ms": round(percentile(page_latencies, 50), 1)}
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "min": round(min(latencies), 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+        },
+        "peak_rss_mb": sampler.peak_mb(),
+        "cache_hit_ratio": round((hits_after - hits_before) / lookups, 3) if lookups else None,
+        "pages": per_page,
+    }
+
+def lookup(data: Dict, path: str):
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print a diff against the baseline, return the regressions beyond threshold"""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline['meta'].get('timestamp', '?')} ({baseline['meta'].get('git_commit', '?')})")
+    for setting in ("use_cache", "pages", "env"):
+        if current["meta"].get(setting) != baseline["meta"].get(setting):
+            print(f"⚠️  {setting} differs from the baseline, the numbers are not directly comparable")
+    print(f"{'scenario':<12} {'metric':<16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for scenario, result in current["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario)
+        if not previous:
+            print(f"{scenario:<12} (not in baseline)")
+            continue
+        if (result["requests"], result["concurrency"]) != (previous["requests"], previous["concurrency"]):
+            print(f"⚠️  {scenario}: requests/concurrency differ from the baseline")
+        for metric, higher_is_better in COMPARED:
+            old, new = lookup(previous, metric), lookup(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = " !" if worse > threshold else ""
+            print(f"{scenario:<12} {metric:<16} {old:>10} {new:>10} {change:>+7.1%}{flag}")
+            if worse > threshold:
+                regressions.append(f"{scenario} {metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated: capture,queue,screenshot")
+    parser.add_argument("--pages", default=",".join(fixtures.PAGES), help="comma separated fixture pages")
+    parser.add_argument("--requests", type=int, default=20, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--no-cache", action="store_true", help="every request is a distinct uncached capture")
+    parser.add_argument("--server-url", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID of that app, to measure its RSS")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra settings for the started app")
+    parser.add_argument("--output", help="where to write the JSON result (default benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", help="earlier result to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    pages = [p for p in args.pages.split(",") if p]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+    for name in pages:
+        if name not in fixtures.PAGES:
+            parser.error(f"unknown fixture page {name!r}")
+
+    fixture_server = fixtures.start_server()
+    fixture_url = f"http://127.0.0.1:{fixture_server.server_address[1]}"
+    process, cache_dir = None, None
+    if args.server_url:
+        base_url, pid = args.server_url.rstrip("/"), args.server_pid
+    else:
+        port = free_port()
+        overrides = dict(item.split("=", 1) for item in args.env)
+        process, cache_dir = start_app(port, overrides)
+        base_url, pid = f"http://127.0.0.1:{port}", process.pid
+
+    sampler = RssSampler(pid)
+    results: Dict[str, Dict] = {}
+    try:
+        started = time.perf_counter()
+        wait_until_ready(base_url)
+        time_to_ready = round(time.perf_counter() - started, 2)
+        # One unmeasured capture so lazy start-up costs are not billed to the first scenario
+        http("POST", f"{base_url}/capture", {"url": f"{fixture_url}/short?warmup", "use_cache": False})
+        for scenario in scenarios:
+            print(f"▶ {scenario}: {args.requests} requests, concurrency {args.concurrency}", flush=True)
+            result = run_scenario(scenario, base_url, fixture_url, pages, args.requests,
+                                  args.concurrency, not args.no_cache, sampler)
+            results[scenario] = result
+            latency = result["latency_ms"]
+            print(f"  {result['throughput_rps']} req/s  p50 {latency['p50']}ms  p95 {latency['p95']}ms  "
+                  f"p99 {latency['p99']}ms  errors {result['errors']}  peak RSS {result['peak_rss_mb']}MB  "
+                  f"cache hit ratio {result['cache_hit_ratio']}", flush=True)
+    finally:
+        fixture_server.shutdown()
+        if process:
+            process.terminate()
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server_url or "started",
+            "time_to_ready_s": time_to_ready,
+            "pages": pages,
+            "use_cache": not args.no_cache,
+            "env": args.env,
+        },
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Local fixture site for the benchmark harness (no network access needed).
+
+Pages:
+  /short          one screen: header, hero image, two paragraphs
+  /tall           ~30000px of text sections and CSS backgrounds
+  /lazy-images    120 images, half loading="lazy", half swapped in by an IntersectionObserver
+  /slow-assets    stylesheet, web font and images that take 300-1500ms each
+  /script-heavy   builds its DOM in JS, burns CPU and keeps mutating it for ~2s
+
+Assets:
+  /img/<seed>.svg?w=&h=   deterministic generated image
+  /asset/style.css, /asset/app.js, /asset/font.woff2
+  /slow/<ms>/<path>       any of the above after <ms> milliseconds
+
+Run standalone with: python benchmarks/fixtures.py [port]
+"""
+import sys
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut "
+    "aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse."
+)
+
+def _color(seed: str, offset: int = 0) -> str:
+    digest = hashlib.md5(f"{seed}:{offset}".encode()).hexdigest()
+    return f"#{digest[:6]}"
+
+def _page(title: str, body: str, head: str = "") -> str:
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+  body {{ margin: 0; font-family: sans-serif; color: #222; }}
+  header {{ padding: 24px 48px; background: #111; color: #fff; }}
+  section {{ padding: 48px; }}
+  img {{ display: block; max-width: 100%; }}
+  .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(280px, 1fr)); gap: 16px; padding: 48px; }}
+</style>
+{head}</head><body>
+<header><h1>{title}</h1></header>
+{body}
+</body></html>"""
+
+def short_page() -> str:
+    return _page("Short fixture", f"""
+<section><img src="/img/hero.svg?w=1200&h=480" width="1200" height="480" alt=""></section>
+<section><p>{LOREM}</p><p>{LOREM}</p></section>""")
+
+def tall_page() -> str:
+    sections = "\n".join(
+        f'<section style="min-height: 600px; background: linear-gradient({_color("tall", i)}, {_color("tall", i + 1)})">'
+        f"<h2>Section {i}</h2><p>{LOREM}</p><p>{LOREM}</p></section>"
+        for i in range(50)
+    )
+    return _page("Tall fixture", sections)
+
+def lazy_images_page() -> str:
+    native = "\n".join(
+        f'<img loading="lazy" src="/img/lazy-{i}.svg?w=560&h=360" width="560" height="360" alt="">'
+        for i in range(60)
+    )
+    scripted = "\n".join(
+        f'<img class="js-lazy" data-src="/img/js-{i}.svg?w=560&h=360" width="560" height="360" alt="">'
+        for i in range(60)
+    )
+    script = """<script>
+const observer = new IntersectionObserver(entries => entries.forEach(entry => {
+  if (entry.isIntersecting) { entry.target.src = entry.target.dataset.src; observer.unobserve(entry.target); }
+}), { rootMargin: "200px" });
+document.querySelectorAll(".js-lazy").forEach(img => observer.observe(img));
+</script>"""
+    return _page("Lazy images fixture", f'<div class="grid">{native}</div><div class="grid">{scripted}</div>{script}')
+
+def slow_assets_page() -> str:
+    head = """<link rel="stylesheet" href="/slow/800/asset/style.css">
+<style>@font-face { font-family: "Fixture"; src: url("/slow/1200/asset/font.woff2") format("woff2"); }
+h1, h2 { font-family: "Fixture", sans-serif; }</style>"""
+    images = "\n".join(
+        f'<img src="/slow/{300 + (i % 5) * 300}/img/slow-{i}.svg?w=560&h=360" width="560" height="360" alt="">'
+        for i in range(12)
+    )
+    return _page("Slow assets fixture", f'<section><h2>Delayed stylesheet, font and images</h2><p>{LOREM}</p></section>'
+                                        f'<div class="grid">{images}</div>', head)
+
+def script_heavy_page() -> str:
+    script = """<script src="/asset/app.js"></script>
+<script>
+// Build the page client-side, then keep changing it for a while like a hydrating SPA
+const root = document.getElementById("root");
+const started = performance.now();
+while (performance.now() - started < 150) { Math.sqrt(Math.random()); }
+for (let i = 0; i < 400; i++) {
+  const card = document.createElement("div");
+  card.style.cssText = `padding:16px;margin:8px 48px;border-radius:8px;background:hsl(${i * 7 % 360},60%,85%)`;
+  card.textContent = `Card ${i} ` + "lorem ipsum ".repeat(12);
+  root.appendChild(card);
+}
+let ticks = 0;
+const timer = setInterval(() => {
+  root.children[ticks % root.children.length].textContent += " updated";
+  if (++ticks > 40) clearInterval(timer);
+}, 50);
+</script>"""
+    return _page("Script heavy fixture", '<div id="root"></div>' + script)
+
+PAGES: Dict[str, Callable[[], str]] = {
+    "short": short_page,
+    "tall": tall_page,
+    "lazy-images": lazy_images_page,
+    "slow-assets": slow_assets_page,
+    "script-heavy": script_heavy_page,
+}
+
+def _svg(seed: str, width: int, height: int) -> str:
+    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">
+<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">
+<stop offset="0" stop-color="{_color(seed)}"/><stop offset="1" stop-color="{_color(seed, 1)}"/></linearGradient></defs>
+<rect width="100%" height="100%" fill="url(#g)"/>
+<circle cx="{width // 3}" cy="{height // 2}" r="{min(width, height) // 4}" fill="{_color(seed, 2)}" opacity="0.7"/>
+</svg>"""
+
+ASSETS: Dict[str, Tuple[str, bytes]] = {
+    "style.css": ("text/css", b"section { line-height: 1.6; } h2 { letter-spacing: 0.02em; }"),
+    "app.js": ("application/javascript", ("window.fixtureData = [" + ",".join(str(i) for i in range(20000)) + "];").encode()),
+    # Not a real font: the browser rejects it and falls back, after having waited for it
+    "font.woff2": ("font/woff2", b"\x00" * 2048),
+}
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, content_type: str, body: bytes, cache: bool):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "public, max-age=3600" if cache else "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        if path.startswith("/slow/"):
+            _, _, delay, rest = path.split("/", 3)
+            time.sleep(int(delay) / 1000)
+            path = "/" + rest
+        name = path.strip("/")
+        if name in PAGES:
+            return self._send(200, "text/html; charset=utf-8", PAGES[name]().encode(), cache=False)
+        if name.startswith("img/") and name.endswith(".svg"):
+            query = parse_qs(parts.query)
+            width = int(query.get("w", ["400"])[0])
+            height = int(query.get("h", ["300"])[0])
+            return self._send(200, "image/svg+xml", _svg(name, width, height).encode(), cache=True)
+        if name.startswith("asset/") and name[6:] in ASSETS:
+            content_type, body = ASSETS[name[6:]]
+            return self._send(200, content_type, body, cache=True)
+        if name == "":
+            links = "".join(f'<li><a href="/{page}">{page}</a></li>' for page in PAGES)
+            return self._send(200, "text/html; charset=utf-8", _page("Fixtures", f"<ul>{links}</ul>").encode(), cache=False)
+        self._send(404, "text/plain", b"not found", cache=False)
+
+def start_server(port: int = 0) -> ThreadingHTTPServer:
+    """Serve the fixtures from a background thread on 127.0.0.1 (port 0 = any free port)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    server = start_server(int(sys.argv[1]) if len(sys.argv) > 1 else 8090)
+    print(f"Serving fixtures at http://127.0.0.1:{server.server_address[1]}/")
+    threading.Event().wait()
@@ -0,0 +1,92 @@
+"""
+Local stand-in for the ScreenshotOne API that main-vercel.py calls on Vercel
+(no network access or API key needed).
+
+GET /take?url=&viewport_width=&viewport_height=&device_scale_factor=&format=png&access_key=
+    answers after a fixed latency with a PNG of the requested viewport size
+    (times the scale factor), its colour derived from the URL
+GET /stats
+    {"requests": n, "in_flight": n, "max_in_flight": n} to check caching and concurrency
+
+Run standalone with: python benchmarks/screenshot_api.py [port] [latency_ms]
+and start the app with SCREENSHOT_API_URL=http://127.0.0.1:<port>/take VERCEL=1
+"""
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+def solid_png(width: int, height: int, rgb: bytes) -> bytes:
+    """Single-colour 8-bit RGB PNG, written with zlib only"""
+    row = b"\x00" + rgb * width
+    pixels = zlib.compress(row * height, 6)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", header) + _chunk(b"IDAT", pixels) + _chunk(b"IEND", b"")
+
+class ScreenshotAPIHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    lock = threading.Lock()
+    requests = 0
+    in_flight = 0
+    max_in_flight = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, delta: int):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += delta
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            if delta > 0:
+                cls.requests += 1
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/stats":
+            cls = type(self)
+            body = {"requests": cls.requests, "in_flight": cls.in_flight, "max_in_flight": cls.max_in_flight}
+            return self._send(200, "application/json", json.dumps(body).encode())
+        if parts.path != "/take":
+            return self._send(404, "text/plain", b"not found")
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if not query.get("url") or not query.get("access_key"):
+            return self._send(400, "application/json", b'{"error_code": "invalid_parameters"}')
+        self._count(1)
+        try:
+            time.sleep(self.latency)
+            scale = float(query.get("device_scale_factor", 1))
+            width = int(int(query.get("viewport_width", 1920)) * scale)
+            height = int(int(query.get("viewport_height", 1080)) * scale)
+            rgb = hashlib.md5(query["url"].encode()).digest()[:3]
+            self._send(200, "image/png", solid_png(width, height, rgb))
+        finally:
+            self._count(-1)
+
+def start_server(port: int = 0, latency_ms: int = 500) -> ThreadingHTTPServer:
+    """Serve the stand-in API from a background thread on 127.0.0.1 (port 0 = any free port)"""
+    handler = type("Handler", (ScreenshotAPIHandler,), {"latency": latency_ms / 1000})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    server = start_server(int(sys.argv[1]) if len(sys.argv) > 1 else 8091, int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+    print(f"Screenshot API stand-in at http://127.0.0.1:{server.server_address[1]}/take")
+    threading.Event().wait()
@@ -0,0 +1,385 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+from playwright.async_api import Browser
+from context_pool import ContextPool
+
+log = logging.getLogger(__name__)
+
+# Instance states: only "ready" instances receive new checkouts
+READY = "ready"
+DRAINING = "draining"  # Recycling: finishing its pages, a replacement is launching
+CRASHED = "crashed"
+CLOSED = "closed"
+
+def _process_rss(pid: int) -> int:
+    """Resident set size of one process in bytes (Linux /proc; 0 if unavailable)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+class BrowserInstance:
+    """One Chromium process with its own context pools"""
+    def __init__(self, slot: int, generation: int, browser: Browser, pools: Dict[str, ContextPool]):
+        self.slot = slot
+        self.generation = generation
+        self.browser = browser
+        self.pools = pools
+        self.state = READY
+        self.in_flight = 0
+        self.captures = 0
+        self.rss_bytes: Optional[int] = None
+        self.launched_at = time.monotonic()
+        self.retire_reason: Optional[str] = None
+
+    async def measure_rss(self) -> Optional[int]:
+        """Summed RSS of the browser, renderer and utility processes (None if unknown)"""
+        if not os.path.exists("/proc/self/status"):
+            return None
+        session = await self.browser.new_browser_cdp_session()
+        try:
+            info = await session.send("SystemInfo.getProcessInfo")
+        finally:
+            await session.detach()
+        self.rss_bytes = sum(_process_rss(process["id"]) for process in info.get("processInfo", []))
+        return self.rss_bytes
+
+    def stats(self) -> Dict:
+        return {
+            "slot": self.slot,
+            "generation": self.generation,
+            "state": self.state,
+            "connected": self.browser.is_connected(),
+            "in_flight": self.in_flight,
+            "captures": self.captures,
+            "rss_mb": round(self.rss_bytes / 1024 / 1024, 1) if self.rss_bytes is not None else None,
+            "uptime_s": round(time.monotonic() - self.launched_at),
+            "retire_reason": self.retire_reason,
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+        }
+
+class BrowserSupervisor:
+    """
+    Runs `instances` Chromium processes and hands out pooled contexts from
+    the least busy one.
+
+    An instance is recycled after max_captures checkouts or when its
+    processes use more than max_rss_bytes: it stops taking new pages, a
+    replacement is launched into its slot right away, and it is closed
+    once its in-flight pages are done. A browser that disconnects on its
+    own (crash, OOM kill) is relaunched with exponential backoff.
+
+    start_background() returns at once and boots in a task: checkouts made
+    meanwhile wait (up to boot_timeout) for the first instance instead of
+    failing. warm, if given, runs against a new instance's pools before it
+    takes pages, so the first real capture doesn't pay for cold caches.
+    """
+    def __init__(self, launch: Callable[[], Awaitable[Browser]], new_pools: Callable[[], Dict[str, ContextPool]],
+                 instances: int = 1, max_captures: int = 0, max_rss_bytes: int = 0,
+                 check_interval: float = 15, acquire_timeout: float = 60, boot_timeout: float = 180,
+                 warm: Optional[Callable[[Dict[str, ContextPool]], Awaitable[None]]] = None):
+        self.launch = launch
+        self.new_pools = new_pools
+        self.warm = warm
+        self.size = max(1, instances)
+        self.max_captures = max_captures
+        self.max_rss_bytes = max_rss_bytes
+        self.check_interval = check_interval
+        self.acquire_timeout = acquire_timeout
+        self.boot_timeout = boot_timeout
+        self.started = False
+        self.booting = False
+        self.boot_error: Optional[str] = None
+        self._boot_started: Optional[float] = None
+        self._boot: Optional[asyncio.Task] = None
+        self._boot_launched = False  # initial launches done (some may still be retrying)
+        self._slots: List[Optional[BrowserInstance]] = [None] * self.size
+        self._retiring: List[BrowserInstance] = []
+        self._generations = [0] * self.size
+        self._cond = asyncio.Condition()
+        self._tasks: set = set()
+        self._monitor: Optional[asyncio.Task] = None
+
+        # Stats
+        self.launches = 0
+        self.launch_failures = 0
+        self.launch_time_total = 0.0
+        self.warm_time_total = 0.0
+        self.time_to_first_ready: Optional[float] = None
+        self.time_to_ready: Optional[float] = None
+        self.crashes = 0
+        self.recycled: Dict[str, int] = {"captures": 0, "rss": 0, "unhealthy": 0}
+        self.waits = 0
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def start(self, prepare: Optional[Callable[[], Awaitable[None]]] = None):
+        """Launch every instance (failed slots keep retrying in the background)"""
+        self.start_background(prepare)
+        await asyncio.shield(self._boot)
+
+    def start_background(self, prepare: Optional[Callable[[], Awaitable[None]]] = None):
+        """Boot in a task; prepare (e.g. starting Playwright) runs before the first launch"""
+        self.started = True
+        self.booting = True
+        self.boot_error = None
+        self.time_to_first_ready = self.time_to_ready = None
+        self._boot_launched = False
+        self._boot_started = time.perf_counter()
+        self._boot = asyncio.create_task(self._run_boot(prepare))
+
+    async def _run_boot(self, prepare: Optional[Callable[[], Awaitable[None]]]):
+        try:
+            if prepare:
+                await prepare()
+            await asyncio.gather(*(self._fill(slot, retry=False) for slot in range(self.size)))
+        except Exception as e:
+            log.error("Browser start-up failed: %s", e)
+            self.boot_error = str(e)
+            self.started = False
+            self.booting = False
+            async with self._cond:
+                self._cond.notify_all()
+            return
+        self._boot_launched = True
+        if self.ready_count():
+            await self._finish_boot()
+        else:
+            # Still booting: checkouts keep waiting up to boot_timeout until a
+            # background retry brings the first instance up
+            log.warning("No browser instance launched yet, retrying in the background")
+
+    async def _finish_boot(self):
+        """Start-up is over once the initial launches are done and one instance is up"""
+        if not self.booting or not self.started:
+            return
+        self.booting = False
+        self.time_to_ready = time.perf_counter() - self._boot_started
+        self._monitor = asyncio.create_task(self._watch())
+        async with self._cond:
+            self._cond.notify_all()
+        log.info("Browser supervisor ready (%d/%d instances) in %.1fs", self.ready_count(), self.size, self.time_to_ready)
+
+    def is_ready(self) -> bool:
+        """Booted and at least one instance accepts pages"""
+        return self.started and not self.booting and self.ready_count() > 0
+
+    async def close(self):
+        self.started = False
+        if self._boot:
+            self._boot.cancel()
+        if self._monitor:
+            self._monitor.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        instances = [instance for instance in self._slots if instance] + self._retiring
+        self._slots = [None] * self.size
+        self._retiring = []
+        for instance in instances:
+            await self._close_instance(instance)
+        async with self._cond:
+            self._cond.notify_all()
+
+    def ready_count(self) -> int:
+        return sum(1 for instance in self._slots if instance and instance.state == READY)
+
+    async def _launch(self, slot: int) -> BrowserInstance:
+        started = time.perf_counter()
+        browser = await self.launch()
+        self._generations[slot] += 1
+        instance = BrowserInstance(slot, self._generations[slot], browser, self.new_pools())
+        try:
+            await asyncio.gather(*(pool.start(browser) for pool in instance.pools.values()))
+        except Exception:
+            await browser.close()
+            raise
+        if self.warm:
+            warm_started = time.perf_counter()
+            try:
+                await self.warm(instance.pools)
+            except Exception as e:
+                # A cold instance still captures correctly, just slower at first
+                log.warning("Browser %d: warm-up failed: %s", slot, e)
+            self.warm_time_total += time.perf_counter() - warm_started
+        browser.on("disconnected", lambda _: self._on_disconnected(instance))
+        self.launches += 1
+        self.launch_time_total += time.perf_counter() - started
+        return instance
+
+    async def _fill(self, slot: int, retry: bool = True):
+        """Launch an instance into a slot, retrying with backoff until it works"""
+        attempt = 0
+        while self.started:
+            try:
+                instance = await self._launch(slot)
+            except Exception as e:
+                self.launch_failures += 1
+                delay = min(30, 2 ** attempt)
+                attempt += 1
+                log.error("Browser %d: launch failed (%s), retrying in %ds", slot, e, delay)
+                if not retry:
+                    # Startup goes on; the slot keeps retrying in the background
+                    self._spawn(self._retry_fill(slot, delay))
+                    return
+                await asyncio.sleep(delay)
+                continue
+            if not self.started:
+                await self._close_instance(instance)
+                return
+            async with self._cond:
+                self._slots[slot] = instance
+                self._cond.notify_all()
+            if self.time_to_first_ready is None and self._boot_started is not None:
+                self.time_to_first_ready = time.perf_counter() - self._boot_started
+            log.info("Browser %d (generation %d) ready", slot, instance.generation)
+            if self._boot_launched:
+                # Every initial launch had failed; this retry ends start-up
+                await self._finish_boot()
+            return
+
+    async def _retry_fill(self, slot: int, delay: float):
+        await asyncio.sleep(delay)
+        await self._fill(slot)
+
+    def _on_disconnected(self, instance: BrowserInstance):
+        if instance.state in (CLOSED, CRASHED) or not self.started:
+            return
+        log.error("Browser %d (generation %d) disconnected", instance.slot, instance.generation)
+        was_draining = instance.state == DRAINING
+        instance.state = CRASHED
+        self.crashes += 1
+        self._spawn(self._close_instance(instance))
+        if instance in self._retiring:
+            self._retiring.remove(instance)
+        if not was_draining and self._slots[instance.slot] is instance:
+            # A draining instance already has its replacement
+            self._slots[instance.slot] = None
+            self._spawn(self._fill(instance.slot))
+
+    def _retire(self, instance: BrowserInstance, reason: str):
+        """Stop handing out an instance, launch its replacement and close it once idle"""
+        if instance.state != READY:
+            return
+        log.info("Recycling browser %d (generation %d): %s", instance.slot, instance.generation, reason)
+        instance.state = DRAINING
+        instance.retire_reason = reason
+        self.recycled[reason] += 1
+        self._retiring.append(instance)
+        if self._slots[instance.slot] is instance:
+            self._slots[instance.slot] = None
+        self._spawn(self._fill(instance.slot))
+        if instance.in_flight == 0:
+            self._spawn(self._drained(instance))
+
+    async def _drained(self, instance: BrowserInstance):
+        if instance.state != DRAINING:
+            return
+        if instance in self._retiring:
+            self._retiring.remove(instance)
+        await self._close_instance(instance)
+        log.info("Browser %d (generation %d) drained and closed", instance.slot, instance.generation)
+
+    async def _close_instance(self, instance: BrowserInstance):
+        if instance.state != CRASHED:
+            instance.state = CLOSED
+        for pool in instance.pools.values():
+            try:
+                await pool.close()
+            except Exception:
+                pass
+        try:
+            await instance.browser.close()
+        except Exception:
+            pass
+
+    async def _acquire(self) -> BrowserInstance:
+        """Least busy ready instance, waiting while every slot is (re)launching"""
+        if not self.started:
+            raise Exception("Browser not initialized")
+        async with self._cond:
+            ready = [instance for instance in self._slots if instance and instance.state == READY]
+            if not ready:
+                self.waits += 1
+                # Requests that arrive during start-up wait for the first launch
+                timeout = self.boot_timeout if self.booting else self.acquire_timeout
+                try:
+                    await asyncio.wait_for(self._cond.wait_for(
+                        lambda: not self.started or any(i and i.state == READY for i in self._slots)
+                    ), timeout)
+                except asyncio.TimeoutError:
+                    raise Exception("No browser instance available")
+                if not self.started:
+                    raise Exception("Browser not initialized")
+                ready = [instance for instance in self._slots if instance and instance.state == READY]
+            instance = min(ready, key=lambda i: (i.in_flight, i.captures))
+            instance.in_flight += 1
+            return instance
+
+    def _release(self, instance: BrowserInstance):
+        instance.in_flight -= 1
+        instance.captures += 1
+        if instance.state == READY and self.max_captures and instance.captures >= self.max_captures:
+            self._retire(instance, "captures")
+        elif instance.state == DRAINING and instance.in_flight == 0:
+            self._spawn(self._drained(instance))
+
+    @asynccontextmanager
+    async def checkout(self, pool: str):
+        """Usage: async with supervisor.checkout("desktop") as context: ..."""
+        instance = await self._acquire()
+        try:
+            async with instance.pools[pool].checkout() as context:
+                yield context
+        finally:
+            self._release(instance)
+
+    async def _watch(self):
+        """Periodic health and memory check of every ready instance"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for instance in list(self._slots):
+                if not instance or instance.state != READY:
+                    continue
+                if not instance.browser.is_connected():
+                    self._on_disconnected(instance)
+                    continue
+                try:
+                    rss = await asyncio.wait_for(instance.measure_rss(), 10)
+                except Exception as e:
+                    log.warning("Browser %d failed its health check: %s", instance.slot, e)
+                    self._retire(instance, "unhealthy")
+                    continue
+                if rss and self.max_rss_bytes and rss > self.max_rss_bytes:
+                    self._retire(instance, "rss")
+
+    def stats(self) -> Dict:
+        instances = [instance for instance in self._slots if instance] + self._retiring
+        return {
+            "instances": self.size,
+            "ready": self.ready_count(),
+            "booting": self.booting,
+            "boot_error": self.boot_error,
+            "time_to_first_ready_ms": round(self.time_to_first_ready * 1000, 1) if self.time_to_first_ready is not None else None,
+            "time_to_ready_ms": round(self.time_to_ready * 1000, 1) if self.time_to_ready is not None else None,
+            "max_captures": self.max_captures,
+            "max_rss_mb": self.max_rss_bytes // (1024 * 1024),
+            "launches": self.launches,
+            "launch_failures": self.launch_failures,
+            "avg_launch_ms": round(self.launch_time_total / self.launches * 1000, 1) if self.launches else 0.0,
+            "avg_warm_ms": round(self.warm_time_total / self.launches * 1000, 1) if self.launches else 0.0,
+            "crashes": self.crashes,
+            "recycled": dict(self.recycled),
+            "waits": self.waits,
+            "browsers": [instance.stats() for instance in sorted(instances, key=lambda i: (i.slot, i.generation))],
+        }
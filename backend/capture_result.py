@@ -0,0 +1,161 @@
+import os
+import base64
+import hashlib
+from typing import Dict, List, Optional
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from disk_cache import DiskCacheEntry
+from image_formats import content_type, extension, format_from_extension
+
+# The result model and image responses shared by main.py and main-vercel.py
+# (no Playwright or Pillow imports, so the serverless build stays small)
+
+def get_cache_key(url: str, scroll_to_bottom: bool, block_profile: str = "none", output_key: str = "") -> str:
+    """Generate a cache key from URL, scroll setting, request blocking profile and output format"""
+    cache_string = f"{url}:{scroll_to_bottom}"
+    if block_profile != "none":
+        cache_string += f":{block_profile}"
+    if output_key:
+        cache_string += f":{output_key}"
+    return hashlib.md5(cache_string.encode()).hexdigest()
+
+# Screenshots for one capture, shared by the cache and by jobs. Images are
+# held in memory (fresh captures) or as files in the disk cache tier, keyed
+# by device ("desktop", "tablet") or preview variant ("desktop_320"). The
+# cache holds one result per device; combine() joins them for a request.
+class CaptureResult:
+    def __init__(self, cache_key: str, page_title: str = "",
+                 images: Optional[Dict[str, bytes]] = None,
+                 files: Optional[Dict[str, str]] = None,
+                 hashes: Optional[Dict[str, str]] = None,
+                 sizes: Optional[Dict[str, int]] = None,
+                 metadata: Optional[Dict] = None,
+                 image_format: str = "jpeg",
+                 validators: Optional[Dict] = None):
+        self.cache_key = cache_key
+        self.page_title = page_title
+        self.image_format = image_format
+        # ETag / Last-Modified / HTML hash of the captured document, for revalidation
+        self.validators: Dict = validators or {}
+        self.images: Dict[str, bytes] = images or {}
+        self.files: Dict[str, str] = files or {}
+        if hashes is None:
+            hashes = {viewport: hashlib.sha256(data).hexdigest() for viewport, data in self.images.items()}
+        self.etags: Dict[str, str] = {viewport: make_etag(h) for viewport, h in hashes.items()}
+        if sizes is None:
+            sizes = {viewport: len(data) for viewport, data in self.images.items()}
+        self.sizes: Dict[str, int] = sizes
+        # Per-device capture details (settle timings, ...)
+        self.metadata: Dict = metadata or {}
+        # Device -> cache key of the entry its images came from (combined results)
+        self.parts: Dict[str, str] = {}
+    
+    @classmethod
+    def from_disk(cls, entry: DiskCacheEntry) -> "CaptureResult":
+        return cls(entry.cache_key, entry.page_title, files=entry.paths, hashes=entry.hashes, sizes=entry.sizes,
+                   image_format=entry.image_format, validators=entry.validators)
+    
+    @classmethod
+    def combine(cls, cache_key: str, results: List["CaptureResult"]) -> "CaptureResult":
+        """One result for several devices, each taken from its own cache entry (title and validators of the first)"""
+        first = results[0]
+        combined = cls(cache_key, first.page_title, hashes={}, sizes={}, image_format=first.image_format,
+                       validators=first.validators)
+        for result in results:
+            combined.images.update(result.images)
+            combined.files.update(result.files)
+            combined.etags.update(result.etags)
+            combined.sizes.update(result.sizes)
+            combined.metadata.update(result.metadata)
+            for device in result.devices():
+                combined.parts[device] = result.parts.get(device, result.cache_key)
+        return combined
+    
+    def devices(self) -> List[str]:
+        """Full-size images in capture order (preview variants are "<device>_<width>")"""
+        return [name for name in self.sizes if "_" not in name]
+    
+    def memory_size(self) -> int:
+        """Bytes held in memory (file-backed results only cost their metadata)"""
+        return sum(len(data) for data in self.images.values()) + 512
+    
+    def has(self, viewport: str) -> bool:
+        return viewport in self.images or viewport in self.files
+    
+    def read(self, viewport: str) -> bytes:
+        if viewport in self.images:
+            return self.images[viewport]
+        with open(self.files[viewport], "rb") as f:
+            return f.read()
+    
+    def to_json(self, base_path: Optional[str] = None, inline: bool = False) -> Dict:
+        """
+        Image URLs ("<device>_url") plus metadata; inline=True keeps the legacy
+        base64 shape. Without base_path images are addressed by the cache
+        entry they belong to (/cache/<key>/<name>).
+        """
+        devices = self.devices()
+        if inline:
+            data = {device: base64.b64encode(self.read(device)).decode('utf-8') for device in devices}
+            data["title"] = self.page_title
+            return data
+        ext = extension(self.image_format)
+        
+        def url(name: str) -> str:
+            device = name.partition("_")[0]
+            base = base_path or f"/cache/{self.parts.get(device, self.cache_key)}"
+            return f"{base}/{name}.{ext}"
+        
+        data = {}
+        for device in devices:
+            data[f"{device}_url"] = url(device)
+            data[f"{device}_size"] = self.sizes[device]
+        previews = []
+        for name in sorted(self.sizes):
+            if "_" not in name:
+                continue
+            device, _, width = name.partition("_")
+            previews.append({
+                "viewport": device,
+                "width": int(width),
+                "url": url(name),
+                "size": self.sizes[name]
+            })
+        data.update({
+            "devices": devices,
+            "content_type": content_type(self.image_format),
+            "previews": previews,
+            "cache_key": self.cache_key,
+            "title": self.page_title,
+            "metadata": self.metadata
+        })
+        return data
+
+def make_etag(content_hash: str) -> str:
+    """Strong ETag derived from the sha256 of the image bytes"""
+    return f'"{content_hash[:32]}"'
+
+def image_response(request: Request, result: CaptureResult, viewport: str, cache_control: str) -> Response:
+    """Serve one image, answering 304 when the client already has this ETag"""
+    etag = result.etags[viewport]
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates:
+            return Response(status_code=304, headers=headers)
+    media_type = content_type(result.image_format)
+    if viewport in result.images:
+        return Response(content=result.images[viewport], media_type=media_type, headers=headers)
+    # Disk tier: stream the file instead of loading it into memory
+    path = result.files[viewport]
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+def find_image(result: Optional[CaptureResult], filename: str) -> str:
+    """Map "desktop.webp" / "tablet_320.webp" to an image name of the result, or 404"""
+    name, _, ext = filename.rpartition(".")
+    if not result or not result.has(name) or format_from_extension(ext) != result.image_format:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return name
@@ -0,0 +1,180 @@
+import os
+import logging
+import tempfile
+
+# Runtime configuration, read once from the environment at import time.
+# Every value has a default that matches the Render free tier (1 vCPU / 512MB).
+
+log = logging.getLogger(__name__)
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        log.warning(f"Invalid value for {name}={value!r}, using default {default}")
+        return default
+
+# --- Logging ---
+# DEBUG adds per-step capture details; WARNING keeps only problems
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+if LOG_LEVEL not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+    log.warning(f"Invalid value for LOG_LEVEL={LOG_LEVEL!r}, using 'INFO'")
+    LOG_LEVEL = "INFO"
+# text (human readable) or json (one object per line for log collectors)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+if LOG_FORMAT not in ("text", "json"):
+    log.warning(f"Invalid value for LOG_FORMAT={LOG_FORMAT!r}, using 'text'")
+    LOG_FORMAT = "text"
+
+# --- Browser instances ---
+# Chromium processes run side by side; captures go to the least busy one
+BROWSER_INSTANCES = _env_int("BROWSER_INSTANCES", 1)
+# An instance is drained and replaced after this many captures (0 = never)
+BROWSER_MAX_CAPTURES = _env_int("BROWSER_MAX_CAPTURES", 500)
+# ... or once its processes together use more memory than this (0 = no limit)
+BROWSER_MAX_RSS_MB = _env_int("BROWSER_MAX_RSS_MB", 0)
+# How often every instance is checked for a lost connection and its memory use
+BROWSER_HEALTH_CHECK_SECONDS = _env_int("BROWSER_HEALTH_CHECK_SECONDS", 15)
+# The app serves requests while Chromium starts; captures that arrive
+# meanwhile wait up to this long for the first instance
+BROWSER_BOOT_TIMEOUT_SECONDS = _env_int("BROWSER_BOOT_TIMEOUT_SECONDS", 180)
+# Render a local page in every context pool of a new instance before it takes
+# captures (JIT, fonts, raster caches); 0 skips the warm-up
+BROWSER_PREWARM = os.getenv("BROWSER_PREWARM", "1") == "1"
+
+# --- Browser context pool ---
+# Number of pre-warmed contexts kept per viewport (in every browser instance)
+CONTEXT_POOL_DESKTOP_SIZE = _env_int("CONTEXT_POOL_DESKTOP_SIZE", 2)
+CONTEXT_POOL_MOBILE_SIZE = _env_int("CONTEXT_POOL_MOBILE_SIZE", 2)
+# A context is closed and replaced after this many checkouts
+CONTEXT_POOL_MAX_USES = _env_int("CONTEXT_POOL_MAX_USES", 50)
+
+# --- Devices ---
+# Extra or replacement device profiles: a JSON object of name -> {"width",
+# "height", "device_scale_factor", "user_agent", "is_mobile", "has_touch"},
+# inline or the path of a JSON file (built in: desktop, mobile, tablet)
+DEVICE_PROFILES = os.getenv("DEVICE_PROFILES", "")
+# Most devices one capture request may ask for
+CAPTURE_MAX_DEVICES = _env_int("CAPTURE_MAX_DEVICES", 4)
+# Capture the devices of a request that share a user agent from one page
+# load by switching device metrics; 0 loads the page once per device
+DEVICE_EMULATION = os.getenv("DEVICE_EMULATION", "1") == "1"
+
+# --- Concurrency ---
+# Number of queue_worker() tasks pulling from /capture/queue
+QUEUE_WORKERS = _env_int("QUEUE_WORKERS", 1)
+# Hard cap on Chromium pages open at once, across every capture entry point
+CAPTURE_MAX_PAGES = _env_int("CAPTURE_MAX_PAGES", 4)
+# Per-viewport caps (each is also bounded by CAPTURE_MAX_PAGES)
+CAPTURE_MAX_DESKTOP_PAGES = _env_int("CAPTURE_MAX_DESKTOP_PAGES", 2)
+CAPTURE_MAX_MOBILE_PAGES = _env_int("CAPTURE_MAX_MOBILE_PAGES", 2)
+# Time budget for one capture (every device, navigation, settling, encoding);
+# slow pages get less settling time and the capture fails once it runs out
+CAPTURE_TIMEOUT_SECONDS = _env_int("CAPTURE_TIMEOUT_SECONDS", 90)
+
+# --- Tall pages ---
+# Regions taller than this many output pixels are screenshotted in strips of
+# this height and stitched by the image workers
+CAPTURE_TILE_HEIGHT = _env_int("CAPTURE_TILE_HEIGHT", 4096)
+# Screenshots are cut off at this height (output pixels); the stitching canvas
+# needs width x height x 3 bytes
+CAPTURE_MAX_HEIGHT = _env_int("CAPTURE_MAX_HEIGHT", 16000)
+
+# --- Results ---
+# Embed base64 images in /capture and /capture/status JSON (legacy shape) instead of image URLs
+INLINE_BASE64_RESULTS = os.getenv("INLINE_BASE64_RESULTS", "0") == "1"
+
+# --- Disk cache tier ---
+# Directory for content-addressed screenshots and their SQLite index ("" disables the tier)
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dribble-shots-cache"))
+DISK_CACHE_MAX_MB = _env_int("DISK_CACHE_MAX_MB", 512)
+DISK_CACHE_TTL_HOURS = _env_int("DISK_CACHE_TTL_HOURS", 24)
+
+# --- Memory cache tier ---
+# Byte ceiling of the in-memory LRU (screenshot bytes, not entry count)
+MEMORY_CACHE_MAX_MB = _env_int("MEMORY_CACHE_MAX_MB", 128)
+# Default lifetime of an entry; requests can override it with cache_ttl_seconds
+MEMORY_CACHE_TTL_SECONDS = _env_int("MEMORY_CACHE_TTL_SECONDS", 3600)
+
+# --- Stale-while-revalidate ---
+# Expired entries (both tiers) are still served this long while a background
+# refresh checks the origin and recaptures only if the page changed (0 = off)
+CACHE_STALE_SECONDS = _env_int("CACHE_STALE_SECONDS", 86400)
+# Timeout of the conditional request to the origin
+REVALIDATE_TIMEOUT_SECONDS = _env_int("REVALIDATE_TIMEOUT_SECONDS", 10)
+
+# --- Jobs ---
+# Finished jobs (and their result references) are forgotten after this long
+JOB_RETENTION_SECONDS = _env_int("JOB_RETENTION_SECONDS", 3600)
+# memory: jobs and queue live in this process; sqlite: shared by every process
+# on the host that points at the same STATE_DB_PATH (needs the disk cache tier)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+if STATE_BACKEND not in ("memory", "sqlite"):
+    log.warning(f"Invalid value for STATE_BACKEND={STATE_BACKEND!r}, using 'memory'")
+    STATE_BACKEND = "memory"
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(DISK_CACHE_DIR or tempfile.gettempdir(), "jobs.db"))
+# A job whose process stops renewing its lease for this long is picked up by another one
+JOB_LEASE_SECONDS = _env_int("JOB_LEASE_SECONDS", 30)
+
+# --- Page settling ---
+# Total time a page may spend scrolling and settling before it is captured anyway
+SETTLE_MAX_MS = _env_int("SETTLE_MAX_MS", 4000)
+# DOM must be free of mutations / layout shifts this long to count as stable
+SETTLE_QUIET_MS = _env_int("SETTLE_QUIET_MS", 300)
+# Longest wait for lazy content after each scroll step
+SETTLE_STEP_MAX_MS = _env_int("SETTLE_STEP_MAX_MS", 400)
+
+# --- Request blocking ---
+# Profile used when a request does not pick one: none, trackers or aggressive.
+# Anything but none changes the screenshots and cache keys of every request
+# that does not set block_profile, so deployments opt in.
+DEFAULT_BLOCK_PROFILE = os.getenv("DEFAULT_BLOCK_PROFILE", "none")
+if DEFAULT_BLOCK_PROFILE not in ("none", "trackers", "aggressive"):
+    log.warning(f"Invalid value for DEFAULT_BLOCK_PROFILE={DEFAULT_BLOCK_PROFILE!r}, using 'none'")
+    DEFAULT_BLOCK_PROFILE = "none"
+
+# --- Subresource cache ---
+# job: desktop and mobile loads of one capture share scripts, styles, fonts and images
+# shared: one process-wide cache that follows Cache-Control; off: no interception
+RESOURCE_CACHE_MODE = os.getenv("RESOURCE_CACHE_MODE", "job")
+if RESOURCE_CACHE_MODE not in ("off", "job", "shared"):
+    log.warning(f"Invalid value for RESOURCE_CACHE_MODE={RESOURCE_CACHE_MODE!r}, using 'job'")
+    RESOURCE_CACHE_MODE = "job"
+# Byte ceiling of the process-wide cache, or of all job caches alive at once together
+RESOURCE_CACHE_MAX_MB = _env_int("RESOURCE_CACHE_MAX_MB", 64)
+# Larger responses are passed through without being kept
+RESOURCE_CACHE_MAX_ENTRY_KB = _env_int("RESOURCE_CACHE_MAX_ENTRY_KB", 4096)
+
+# --- Image output ---
+# Workers that transcode, resize and hash screenshots off the event loop
+IMAGE_WORKERS = _env_int("IMAGE_WORKERS", 2)
+# thread (default, Pillow releases the GIL) or process
+IMAGE_EXECUTOR = os.getenv("IMAGE_EXECUTOR", "thread")
+if IMAGE_EXECUTOR not in ("thread", "process"):
+    log.warning(f"Invalid value for IMAGE_EXECUTOR={IMAGE_EXECUTOR!r}, using 'thread'")
+    IMAGE_EXECUTOR = "thread"
+
+# --- Mockups ---
+# Directory with templates/, fonts/ and the device frames (the frontend's public/ folder)
+MOCKUP_ASSETS_DIR = os.getenv(
+    "MOCKUP_ASSETS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dribble shots fronend", "public")
+)
+# Worker processes that composite mockups
+MOCKUP_WORKERS = _env_int("MOCKUP_WORKERS", 2)
+# Byte ceiling of the rendered mockup cache
+MOCKUP_CACHE_MAX_MB = _env_int("MOCKUP_CACHE_MAX_MB", 64)
+
+# --- Batches ---
+# Most URLs accepted by one POST /capture/batch
+BATCH_MAX_URLS = _env_int("BATCH_MAX_URLS", 100)
+
+# --- Serverless (main-vercel.py) ---
+# Screenshot service used on Vercel; point it at benchmarks/screenshot_api.py to run without the network
+SCREENSHOT_API_URL = os.getenv("SCREENSHOT_API_URL", "https://api.screenshotone.com/take")
+SCREENSHOT_API_KEY = os.getenv("SCREENSHOT_API_KEY", "demo")
+# Connections kept open to it by the shared client (both viewports of a few captures at once)
+SCREENSHOT_API_MAX_CONNECTIONS = _env_int("SCREENSHOT_API_MAX_CONNECTIONS", 8)
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Set
+from urllib.parse import urlsplit
+from playwright.async_api import Browser, BrowserContext
+from metrics import CONTEXT_CREATE_SECONDS
+
+log = logging.getLogger(__name__)
+
+# --- STEALTH: Hide Automation ---
+# This prevents websites from knowing you are a robot via the 'navigator.webdriver' flag
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+"""
+
+class PooledContext:
+    """A browser context owned by a ContextPool"""
+    def __init__(self, context: BrowserContext):
+        self.context = context
+        self.uses = 0
+        self.created_at = time.monotonic()
+        # Origins that loaded a document since the last reset, and whether one
+        # of them was a cross-origin frame (its storage is partitioned by the
+        # top-level site and cannot be cleared by origin)
+        self.origins: Set[str] = set()
+        self.third_party_frames = False
+        context.on("page", lambda page: page.on("framenavigated", self._frame_navigated))
+
+    def _frame_navigated(self, frame):
+        origin = frame_origin(frame.url)
+        if not origin:
+            return
+        self.origins.add(origin)
+        if frame.parent_frame is not None and origin != frame_origin(frame.page.main_frame.url):
+            self.third_party_frames = True
+
+def frame_origin(url: str) -> Optional[str]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+class ContextPool:
+    """
+    Pool of pre-configured browser contexts for one viewport.
+
+    Contexts are created up-front with the stealth script (plus any extra
+    init scripts) applied, handed out with checkout(), wiped (cookies,
+    storage, pages) when they come back and closed once they have served
+    max_uses captures.
+    """
+    def __init__(self, name: str, context_options: Dict, size: int, max_uses: int,
+                 init_scripts: Optional[List[str]] = None):
+        self.name = name
+        self.context_options = context_options
+        self.init_scripts = [STEALTH_SCRIPT] + (init_scripts or [])
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.browser: Optional[Browser] = None
+        self._idle: List[PooledContext] = []
+        self._total = 0  # idle + checked out + being created
+        self._cond = asyncio.Condition()
+        self._closed = False
+        # Background replacements of retired contexts
+        self._tasks: set = set()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.created = 0
+        self.recycled = 0
+        self.discarded = 0
+        self.create_time_total = 0.0
+
+    async def start(self, browser: Browser):
+        """Attach to a browser and pre-warm the pool to full size"""
+        self.browser = browser
+        self._closed = False
+        await asyncio.gather(*(self._add_idle() for _ in range(self.size)))
+        log.info("%s context pool ready (%d contexts)", self.name, len(self._idle))
+
+    async def close(self):
+        """Close every idle context; checked out ones are closed on release"""
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        idle, self._idle = self._idle, []
+        for item in idle:
+            await self._close_context(item)
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _create(self) -> PooledContext:
+        started = time.perf_counter()
+        context = await self.browser.new_context(**self.context_options)
+        for script in self.init_scripts:
+            await context.add_init_script(script)
+        elapsed = time.perf_counter() - started
+        self.create_time_total += elapsed
+        CONTEXT_CREATE_SECONDS.labels(self.name.lower()).observe(elapsed)
+        self.created += 1
+        return PooledContext(context)
+
+    async def _add_idle(self):
+        self._total += 1
+        item = None
+        try:
+            item = await self._create()
+        except Exception as e:
+            log.error("%s pool: failed to create context: %s", self.name, e)
+        finally:
+            if item is None:
+                # Failed or cancelled: give the slot back to waiting checkouts
+                self._total -= 1
+                async with self._cond:
+                    self._cond.notify()
+        if item is None:
+            return
+        async with self._cond:
+            self._idle.append(item)
+            self._cond.notify()
+
+    def _replace(self):
+        """Create a context in the background for one that was retired"""
+        if self._closed:
+            return
+        task = asyncio.create_task(self._add_idle())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _close_context(self, item: PooledContext):
+        self._total -= 1
+        try:
+            await item.context.close()
+        except Exception:
+            pass
+
+    async def acquire(self) -> PooledContext:
+        """Check out a context, creating one if the pool is not full yet"""
+        if self.browser is None or self._closed:
+            raise Exception("Browser not initialized")
+
+        waited = None
+        async with self._cond:
+            while not self._idle and self._total >= self.size:
+                if waited is None:
+                    waited = time.perf_counter()
+                await self._cond.wait()
+                if self._closed:
+                    raise Exception("Browser not initialized")
+
+            if waited is not None:
+                elapsed = time.perf_counter() - waited
+                self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+
+            if self._idle:
+                self.hits += 1
+                item = self._idle.pop()
+                item.uses += 1
+                return item
+
+            # Pool has room but nothing warm: create on demand
+            self.misses += 1
+            self._total += 1
+
+        try:
+            item = await self._create()
+        except Exception:
+            self._total -= 1
+            async with self._cond:
+                self._cond.notify()
+            raise
+        item.uses += 1
+        return item
+
+    async def release(self, item: PooledContext):
+        """Reset a context and return it to the pool, or retire it"""
+        if self._closed:
+            await self._close_context(item)
+            return
+
+        if item.uses >= self.max_uses or item.third_party_frames:
+            self.recycled += 1
+            await self._close_context(item)
+            # Replace it in the background so the next checkout stays warm
+            self._replace()
+            return
+
+        returned = False
+        try:
+            await self._reset(item)
+            async with self._cond:
+                self._idle.append(item)
+                self._cond.notify()
+            returned = True
+        except Exception as e:
+            log.warning("%s pool: reset failed, discarding context: %s", self.name, e)
+        finally:
+            if not returned:
+                # Reset failed or the release was cancelled half-way
+                self.discarded += 1
+                await asyncio.shield(self._close_context(item))
+                self._replace()
+
+    async def _reset(self, item: PooledContext):
+        """Wipe everything a capture may have left behind"""
+        context = item.context
+        pages = list(context.pages)
+        if item.origins and pages:
+            cdp = await context.new_cdp_session(pages[0])
+            try:
+                for origin in item.origins:
+                    await cdp.send("Storage.clearDataForOrigin", {
+                        "origin": origin,
+                        "storageTypes": "all",
+                    })
+            finally:
+                await cdp.detach()
+        for page in pages:
+            await page.close()
+        await context.clear_cookies()
+        await context.clear_permissions()
+        item.origins.clear()
+
+    @asynccontextmanager
+    async def checkout(self):
+        """Usage: async with pool.checkout() as context: ..."""
+        item = await self.acquire()
+        try:
+            yield item.context
+        finally:
+            await self.release(item)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "max_uses": self.max_uses,
+            "idle": len(self._idle),
+            "in_use": self._total - len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.wait_time_total / self.waits * 1000, 1) if self.waits else 0.0,
+            "max_wait_ms": round(self.wait_time_max * 1000, 1),
+            "created": self.created,
+            "recycled": self.recycled,
+            "discarded": self.discarded,
+            "avg_create_ms": round(self.create_time_total / self.created * 1000, 1) if self.created else 0.0,
+            # Every hit skipped one new_context() + add_init_script() round trip
+            "estimated_saved_ms": round(self.hits * (self.create_time_total / self.created) * 1000, 1) if self.created else 0.0,
+        }
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+# Device names end up in image names ("tablet", "tablet_320") and URLs
+NAME_PATTERN = re.compile(r"^[a-z0-9-]{1,32}$")
+
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+IPHONE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1"
+IPAD_USER_AGENT = "Mozilla/5.0 (iPad; CPU OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1"
+
+class DeviceProfile:
+    """Viewport, pixel ratio, user agent and touch support of one device a page is captured as"""
+    def __init__(self, name: str, width: int, height: int, device_scale_factor: float = 1,
+                 user_agent: str = DESKTOP_USER_AGENT, is_mobile: bool = False, has_touch: bool = False):
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid device name {name!r} (lowercase letters, digits and '-')")
+        if width < 1 or height < 1 or device_scale_factor <= 0:
+            raise ValueError(f"Invalid size for device {name!r}")
+        self.name = name
+        self.width = width
+        self.height = height
+        self.device_scale_factor = device_scale_factor
+        self.user_agent = user_agent
+        self.is_mobile = is_mobile
+        self.has_touch = has_touch
+
+    @property
+    def pool(self) -> str:
+        """Context pool (and page slot limit) the profile's captures use"""
+        return "mobile" if self.is_mobile else "desktop"
+
+    def key(self) -> str:
+        """Everything that changes the screenshot, for cache keys (editing a profile invalidates its entries)"""
+        ua = hashlib.md5(self.user_agent.encode()).hexdigest()[:8]
+        return f"{self.name}:{self.width}x{self.height}@{self.device_scale_factor:g}:{int(self.is_mobile)}{int(self.has_touch)}:{ua}"
+
+    def context_options(self) -> Dict:
+        """browser.new_context() options"""
+        options = {
+            "viewport": {"width": self.width, "height": self.height},
+            "device_scale_factor": self.device_scale_factor,
+            "user_agent": self.user_agent,
+        }
+        if self.is_mobile:
+            options["is_mobile"] = True
+        if self.has_touch:
+            options["has_touch"] = True
+        return options
+
+    def emulates(self, other: "DeviceProfile") -> bool:
+        """Same viewport, pixel ratio, user agent and touch support (a context of one needs no overrides for the other)"""
+        return self.to_json() == other.to_json()
+
+    async def apply(self, cdp):
+        """Switch an open page to this device through a CDP session (see Emulation in the DevTools protocol)"""
+        await cdp.send("Emulation.setDeviceMetricsOverride", {
+            "width": self.width,
+            "height": self.height,
+            "deviceScaleFactor": self.device_scale_factor,
+            "mobile": self.is_mobile,
+            "screenWidth": self.width,
+            "screenHeight": self.height,
+        })
+        await cdp.send("Emulation.setTouchEmulationEnabled", {"enabled": self.has_touch, "maxTouchPoints": 5 if self.has_touch else 0})
+        # Before navigation this changes the document request too; afterwards only
+        # navigator.userAgent and the requests that follow
+        await cdp.send("Emulation.setUserAgentOverride", {"userAgent": self.user_agent})
+
+    def to_json(self) -> Dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "device_scale_factor": self.device_scale_factor,
+            "user_agent": self.user_agent,
+            "is_mobile": self.is_mobile,
+            "has_touch": self.has_touch,
+        }
+
+BUILTIN_PROFILES = {
+    "desktop": DeviceProfile("desktop", 1920, 1080, 1, DESKTOP_USER_AGENT),
+    # iPhone 14 Pro
+    "mobile": DeviceProfile("mobile", 390, 844, 3, IPHONE_USER_AGENT, is_mobile=True, has_touch=True),
+    # iPad Air
+    "tablet": DeviceProfile("tablet", 820, 1180, 2, IPAD_USER_AGENT, is_mobile=True, has_touch=True),
+}
+
+def load_profiles(spec: str = "") -> Dict[str, DeviceProfile]:
+    """
+    The built-in profiles plus those of spec: a JSON object (inline or the
+    path of a file) of name -> DeviceProfile fields. A name that is already
+    defined replaces that profile. Invalid definitions are skipped with a
+    warning.
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    if not spec.strip():
+        return profiles
+    try:
+        if os.path.isfile(spec):
+            with open(spec) as f:
+                definitions = json.load(f)
+        else:
+            definitions = json.loads(spec)
+        if not isinstance(definitions, dict):
+            raise ValueError("expected an object of name -> profile")
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring DEVICE_PROFILES: %s", e)
+        return profiles
+    for name, fields in definitions.items():
+        try:
+            profiles[name] = DeviceProfile(name, **fields)
+        except (TypeError, ValueError) as e:
+            log.warning("Ignoring device profile %r: %s", name, e)
+    return profiles
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Iterable, List, Set
+
+class DiskCacheEntry:
+    """Index row for one cached capture; images stay on disk"""
+    def __init__(self, cache_key: str, hashes: Dict[str, str], sizes: Dict[str, int],
+                 paths: Dict[str, str], page_title: str, created_at: float, expires_at: float,
+                 image_format: str = "jpeg", validators: Optional[Dict] = None):
+        self.cache_key = cache_key
+        self.image_format = image_format
+        self.hashes = hashes
+        self.sizes = sizes
+        self.paths = paths
+        self.page_title = page_title
+        self.created_at = created_at
+        self.expires_at = expires_at
+        # How the origin identified the page when it was captured (see revalidation.py)
+        self.validators = validators or {}
+
+class DiskCache:
+    """
+    Second screenshot cache tier on local disk.
+
+    Images are stored content-addressed (blobs/<sha[:2]>/<sha>) so
+    identical screenshots are kept once, and a SQLite index maps cache
+    keys to blobs (one or more devices and any preview variants) with a TTL.
+    entry_blobs indexes which entries reference a blob, so removing an
+    entry only checks its own blobs for orphans. Total blob size is bounded by evicting the
+    least recently used entries. Methods are synchronous and thread-safe;
+    callers run writes off the event loop with asyncio.to_thread.
+    Expired entries are kept stale_seconds longer for get(allow_stale=True).
+    """
+    def __init__(self, root: str, max_bytes: int, ttl_seconds: int, stale_seconds: int = 0):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._drop_legacy_index()
+        has_references = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entry_blobs'"
+        ).fetchone() is not None
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                cache_key TEXT PRIMARY KEY,
+                images TEXT NOT NULL,
+                page_title TEXT NOT NULL DEFAULT '',
+                image_format TEXT NOT NULL DEFAULT 'jpeg',
+                validators TEXT NOT NULL DEFAULT '{}',
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entry_blobs (
+                cache_key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (cache_key, hash)
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access);
+            CREATE INDEX IF NOT EXISTS entry_blobs_hash ON entry_blobs(hash);
+        """)
+        if not has_references:
+            # Indexes from before entry_blobs existed
+            self._db.execute(
+                "INSERT OR IGNORE INTO entry_blobs (cache_key, hash) "
+                "SELECT cache_key, value FROM entries, json_each(entries.images)"
+            )
+        self._db.commit()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop_legacy_index(self):
+        """Indexes from before per-device entries (fixed desktop/mobile columns) are simply discarded"""
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(entries)")]
+        if columns and "images" not in columns:
+            self._db.executescript("DROP TABLE entries; DROP TABLE IF EXISTS blobs; DROP TABLE IF EXISTS entry_blobs;")
+            shutil.rmtree(self.blob_dir, ignore_errors=True)
+            os.makedirs(self.blob_dir, exist_ok=True)
+
+    def blob_path(self, blob_hash: str) -> str:
+        return os.path.join(self.blob_dir, blob_hash[:2], blob_hash)
+
+    def _write_blob(self, data: bytes) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(blob_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self._db.execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (blob_hash, len(data)))
+        return blob_hash
+
+    def get(self, cache_key: str, allow_stale: bool = False) -> Optional[DiskCacheEntry]:
+        """
+        Look up a cache key; expired or broken entries count as misses.
+        allow_stale also returns entries inside the stale window (not counted).
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT images, image_format, page_title, created_at, expires_at, validators "
+                "FROM entries WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                if not allow_stale:
+                    self.misses += 1
+                return None
+
+            images, image_format, page_title, created_at, expires_at, validators = row
+            hashes = json.loads(images)
+            paths = {viewport: self.blob_path(h) for viewport, h in hashes.items()}
+            now = time.time()
+            if expires_at < now - self.stale_seconds or not all(os.path.exists(p) for p in paths.values()):
+                self._delete_entries([cache_key])
+                self._db.commit()
+                if not allow_stale:
+                    self.misses += 1
+                return None
+            if expires_at < now and not allow_stale:
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE entries SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+            self._db.commit()
+            if expires_at >= now:
+                self.hits += 1
+            sizes = {viewport: os.path.getsize(p) for viewport, p in paths.items()}
+            return DiskCacheEntry(cache_key, hashes, sizes, paths, page_title, created_at, expires_at, image_format,
+                                  json.loads(validators))
+
+    def contains(self, cache_key: str, allow_stale: bool = False) -> bool:
+        """Whether get() would find the entry, without counting a hit or miss or touching its access time"""
+        with self._lock:
+            row = self._db.execute("SELECT expires_at FROM entries WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None:
+            return False
+        return row[0] >= time.time() - (self.stale_seconds if allow_stale else 0)
+
+    def refresh(self, cache_key: str, ttl_seconds: Optional[int] = None) -> bool:
+        """Give an entry a new TTL (its page was revalidated as unchanged)"""
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE entries SET expires_at = ? WHERE cache_key = ?", (expires_at, cache_key)
+            ).rowcount
+            self._db.commit()
+            return updated > 0
+
+    def put(self, cache_key: str, images: Dict[str, bytes], page_title: str = "",
+            ttl_seconds: Optional[int] = None, image_format: str = "jpeg",
+            validators: Optional[Dict] = None) -> DiskCacheEntry:
+        """Store every image of a capture and point the cache key at them"""
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            hashes = {name: self._write_blob(data) for name, data in images.items()}
+            # Blobs of the entry being replaced may no longer be referenced
+            replaced = self._referenced_blobs([cache_key])
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(cache_key, images, validators, image_format, page_title, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, json.dumps(hashes), json.dumps(validators or {}), image_format, page_title,
+                 now, expires_at, now)
+            )
+            self._db.execute("DELETE FROM entry_blobs WHERE cache_key = ?", (cache_key,))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO entry_blobs (cache_key, hash) VALUES (?, ?)",
+                [(cache_key, h) for h in set(hashes.values())]
+            )
+            self._delete_orphan_blobs(replaced - set(hashes.values()))
+            self._evict_to_fit()
+            self._db.commit()
+
+        return DiskCacheEntry(
+            cache_key, hashes, {name: len(data) for name, data in images.items()},
+            {name: self.blob_path(h) for name, h in hashes.items()},
+            page_title, now, expires_at, image_format, validators
+        )
+
+    def _referenced_blobs(self, cache_keys: List[str]) -> Set[str]:
+        blobs = set()
+        for cache_key in cache_keys:
+            blobs.update(row[0] for row in self._db.execute(
+                "SELECT hash FROM entry_blobs WHERE cache_key = ?", (cache_key,)
+            ))
+        return blobs
+
+    def _delete_entries(self, cache_keys: List[str]):
+        candidates = self._referenced_blobs(cache_keys)
+        self._db.executemany("DELETE FROM entries WHERE cache_key = ?", [(k,) for k in cache_keys])
+        self._db.executemany("DELETE FROM entry_blobs WHERE cache_key = ?", [(k,) for k in cache_keys])
+        self._delete_orphan_blobs(candidates)
+
+    def _delete_orphan_blobs(self, candidates: Iterable[str]):
+        """Remove those of the candidate blobs that no entry references any more"""
+        orphans = [
+            (blob_hash,) for blob_hash in candidates
+            if self._db.execute("SELECT 1 FROM entry_blobs WHERE hash = ? LIMIT 1", (blob_hash,)).fetchone() is None
+        ]
+        for (blob_hash,) in orphans:
+            try:
+                os.remove(self.blob_path(blob_hash))
+            except FileNotFoundError:
+                pass
+        self._db.executemany("DELETE FROM blobs WHERE hash = ?", orphans)
+
+    def _total_bytes(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _evict_to_fit(self):
+        """Drop least recently used entries until the blobs fit in max_bytes"""
+        while self._total_bytes() > self.max_bytes:
+            row = self._db.execute("SELECT cache_key FROM entries ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._delete_entries([row[0]])
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Remove every entry past its TTL and stale window, returns how many were removed"""
+        with self._lock:
+            expired = [row[0] for row in self._db.execute(
+                "SELECT cache_key FROM entries WHERE expires_at < ?", (time.time() - self.stale_seconds,)
+            )]
+            if expired:
+                self._delete_entries(expired)
+                self._db.commit()
+            return len(expired)
+
+    def delete(self, cache_key: str):
+        with self._lock:
+            self._delete_entries([cache_key])
+            self._db.commit()
+
+    def clear(self) -> int:
+        """Remove every entry and blob, returns how many entries were removed"""
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM entry_blobs")
+            self._delete_orphan_blobs([row[0] for row in self._db.execute("SELECT hash FROM blobs").fetchall()])
+            self._db.commit()
+            return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.time()
+            total = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            expired = self._db.execute("SELECT COUNT(*) FROM entries WHERE expires_at < ?", (now,)).fetchone()[0]
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.root,
+            "total_entries": total,
+            "active_entries": total - expired,
+            "expired_entries": expired,
+            "blobs": blobs,
+            "bytes_used": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
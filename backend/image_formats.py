@@ -0,0 +1,21 @@
+from typing import Optional
+
+# format -> (content type, file extension)
+FORMATS = {
+    "jpeg": ("image/jpeg", "jpg"),
+    "webp": ("image/webp", "webp"),
+    "avif": ("image/avif", "avif"),
+    "png": ("image/png", "png"),
+}
+
+def content_type(image_format: str) -> str:
+    return FORMATS[image_format][0]
+
+def extension(image_format: str) -> str:
+    return FORMATS[image_format][1]
+
+def format_from_extension(ext: str) -> Optional[str]:
+    for image_format, (_, format_ext) in FORMATS.items():
+        if ext == format_ext or ext == image_format:
+            return image_format
+    return None
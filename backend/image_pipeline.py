@@ -0,0 +1,281 @@
+import io
+import time
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from PIL import Image, features
+from image_formats import FORMATS
+LOSSY_FORMATS = {"jpeg", "webp", "avif"}
+# One encoded image, or PNG strips of one (top to bottom) to stitch, see tiling.py
+Screenshot = Union[bytes, List[bytes]]
+# Largest height each encoder accepts (pixels)
+MAX_HEIGHTS = {"jpeg": 65535, "webp": 16383, "avif": 65536, "png": 2 ** 31 - 1}
+
+DEFAULT_FORMAT = "jpeg"
+DEFAULT_QUALITY = 85
+# Lowest quality the byte-budget search will go down to
+MIN_QUALITY = 30
+
+def supported_formats() -> List[str]:
+    """Formats this Pillow build can write (AVIF needs libavif)"""
+    return [fmt for fmt in FORMATS if fmt != "avif" or features.check("avif")]
+
+def max_height(image_format: str) -> int:
+    return MAX_HEIGHTS[image_format]
+
+def raw_size(data: Screenshot) -> int:
+    return sum(len(strip) for strip in data) if isinstance(data, list) else len(data)
+
+class OutputOptions:
+    """What the stored images should look like: format, quality or byte budget, preview widths"""
+    def __init__(self, image_format: str = DEFAULT_FORMAT, quality: Optional[int] = None,
+                 target_bytes: Optional[int] = None, previews: Sequence[int] = ()):
+        self.image_format = image_format
+        self.quality = quality or DEFAULT_QUALITY
+        # A byte budget only means something for lossy formats
+        self.target_bytes = target_bytes if image_format in LOSSY_FORMATS else None
+        self.previews = sorted(set(previews))
+
+    def needs_transcode(self) -> bool:
+        """False when the browser can produce the final image itself"""
+        if self.previews or self.target_bytes:
+            return True
+        return self.image_format not in ("jpeg", "png")
+
+    def screenshot_args(self) -> Dict:
+        """Arguments for page.screenshot(): final JPEG/PNG, or lossless PNG to transcode"""
+        if not self.needs_transcode() and self.image_format == "jpeg":
+            return {"type": "jpeg", "quality": self.quality}
+        return {"type": "png"}
+
+    def key(self) -> str:
+        """Cache key suffix; empty for the default JPEG output"""
+        if self.image_format == DEFAULT_FORMAT and self.quality == DEFAULT_QUALITY \
+                and not self.target_bytes and not self.previews:
+            return ""
+        parts = [self.image_format, f"q{self.quality}"]
+        if self.target_bytes:
+            parts.append(f"t{self.target_bytes}")
+        if self.previews:
+            parts.append("p" + "-".join(str(w) for w in self.previews))
+        return ",".join(parts)
+
+def _write(image: Image.Image, image_format: str, quality: int, fp):
+    if image_format == "jpeg":
+        image.convert("RGB").save(fp, "JPEG", quality=quality)
+    elif image_format == "webp":
+        image.save(fp, "WEBP", quality=quality)
+    elif image_format == "avif":
+        image.save(fp, "AVIF", quality=quality)
+    else:
+        image.save(fp, "PNG", compress_level=6)
+
+def _save(image: Image.Image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    _write(image, image_format, quality, buffer)
+    return buffer.getvalue()
+
+def _open(data: Screenshot) -> Image.Image:
+    """
+    Decode a screenshot. Strips are pasted onto one RGB canvas a strip at a
+    time, so besides the canvas only one decoded strip is ever in memory.
+    """
+    if not isinstance(data, list):
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+    strips = [Image.open(io.BytesIO(strip)) for strip in data]  # Headers only until pasted
+    canvas = Image.new("RGB", (strips[0].width, sum(strip.height for strip in strips)), "white")
+    top = 0
+    for strip in strips:
+        canvas.paste(strip.convert("RGB"), (0, top))
+        top += strip.height
+        strip.close()
+    return canvas
+
+class _ChunkWriter:
+    """File object that hands every chunk the encoder writes to a callback"""
+    def __init__(self, write: Callable[[bytes], None]):
+        self._write = write
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        self._write(chunk)
+        return len(chunk)
+
+    def flush(self):
+        pass
+
+    def tell(self) -> int:
+        return self.size
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+class StitchAborted(Exception):
+    """Raised from the write callback to stop an encoder whose output is no longer wanted"""
+
+def stitch_strips(strips: List[bytes], image_format: str, quality: int,
+                  write: Optional[Callable[[bytes], None]] = None) -> Dict:
+    """
+    Stitch strips into one image and encode it. The encoded bytes go to
+    write() as the encoder produces them; without write they are returned
+    as "data" (process pools cannot call back).
+    """
+    started = time.perf_counter()
+    chunks: List[bytes] = []
+    image = _open(strips)
+    sink = _ChunkWriter(write or chunks.append)
+    _write(image, image_format, quality, sink)
+    result = {
+        "hash": sink.hexdigest(),
+        "bytes": sink.size,
+        "width": image.width,
+        "height": image.height,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if write is None:
+        result["data"] = b"".join(chunks)
+    return result
+
+def _encode_within(image: Image.Image, image_format: str, quality: int, target_bytes: int) -> Tuple[bytes, int]:
+    """Highest quality (binary search, at most ~6 encodes) whose output fits target_bytes"""
+    data = _save(image, image_format, quality)
+    if len(data) <= target_bytes:
+        return data, quality
+    best = None
+    low, high = MIN_QUALITY, quality - 1
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = _save(image, image_format, mid)
+        if len(candidate) <= target_bytes:
+            best = (candidate, mid)
+            low = mid + 1
+        else:
+            high = mid - 1
+            data, quality = candidate, mid
+    # Nothing fits: return the smallest attempt
+    return best or (data, quality)
+
+def encode_variants(data: Screenshot, image_format: str, quality: int, target_bytes: Optional[int],
+                    previews: Sequence[int], transcode: bool) -> Dict[str, Dict]:
+    """
+    Turn one raw screenshot (or its strips) into the stored image plus
+    downscaled previews. Runs in the worker pool; returns {variant: {data,
+    hash, quality, ms}} where "" is the full-size image and previews are
+    keyed by width.
+    """
+    started = time.perf_counter()
+    variants: Dict[str, Dict] = {}
+    if not transcode and not isinstance(data, list):
+        variants[""] = {"data": data, "quality": quality if image_format in LOSSY_FORMATS else None}
+    else:
+        image = _open(data)
+        if target_bytes:
+            encoded, used_quality = _encode_within(image, image_format, quality, target_bytes)
+        else:
+            encoded, used_quality = _save(image, image_format, quality), quality
+        variants[""] = {"data": encoded, "quality": used_quality if image_format in LOSSY_FORMATS else None}
+        for width in previews:
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            preview = image.resize((width, height), Image.LANCZOS)
+            variants[str(width)] = {"data": _save(preview, image_format, used_quality), "quality": used_quality}
+    for variant in variants.values():
+        variant["hash"] = hashlib.sha256(variant["data"]).hexdigest()
+    variants[""]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return variants
+
+class ImagePipeline:
+    """
+    Worker pool for everything that touches image bytes (decode, resize,
+    encode, hash) so the event loop only passes buffers around. A thread
+    pool is enough since Pillow releases the GIL while coding; "process"
+    isolates it completely at the cost of copying the buffers.
+    """
+    def __init__(self, workers: int, kind: str = "thread"):
+        self.workers = max(1, workers)
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self.jobs = 0
+        self.encode_time_total = 0.0
+
+    def start(self):
+        if self.kind == "process":
+            # spawn: never fork a process that is running an event loop and a browser driver
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="image")
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def process(self, data: Screenshot, output: OutputOptions) -> Dict[str, Dict]:
+        if self._executor is None:
+            self.start()
+        variants = await asyncio.get_running_loop().run_in_executor(
+            self._executor, encode_variants,
+            data, output.image_format, output.quality, output.target_bytes,
+            output.previews, output.needs_transcode()
+        )
+        self.jobs += 1
+        self.encode_time_total += variants[""]["ms"] / 1000
+        return variants
+
+    async def stitch(self, strips: List[bytes], image_format: str, quality: int) -> AsyncIterator[bytes]:
+        """Stitched and encoded strips, yielded while the encoder is still writing (at once in process mode)"""
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        if self.kind == "process":
+            result = await loop.run_in_executor(self._executor, stitch_strips, strips, image_format, quality)
+            self.jobs += 1
+            self.encode_time_total += result["ms"] / 1000
+            yield result["data"]
+            return
+        chunks: asyncio.Queue = asyncio.Queue()
+        aborted = threading.Event()
+
+        def write(chunk: bytes):
+            if aborted.is_set():
+                raise StitchAborted()
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+        future = loop.run_in_executor(self._executor, stitch_strips, strips, image_format, quality, write)
+        # Scheduled after every chunk the worker has handed over
+        future.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            result = await future
+        finally:
+            if not future.done():
+                # The consumer went away (client disconnected): a running worker
+                # cannot be cancelled, so stop it at its next write and let the
+                # stitched canvas be freed
+                aborted.set()
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.jobs += 1
+        self.encode_time_total += result["ms"] / 1000
+
+    def stats(self) -> Dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "images_processed": self.jobs,
+            "avg_encode_ms": round(self.encode_time_total / self.jobs * 1000, 1) if self.jobs else 0.0,
+            "formats": supported_formats(),
+        }
@@ -0,0 +1,642 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from job_store import JobStore
+
+log = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "processing")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+# Scheduling classes, highest first: a class is only served while every
+# class above it has nothing queued
+PRIORITIES = ("interactive", "batch", "prewarm")
+
+def priority_rank(priority: str) -> int:
+    return PRIORITIES.index(priority) if priority in PRIORITIES else 0
+
+class JobBackend:
+    """
+    Where jobs and the job queue live.
+
+    MemoryJobBackend keeps them in this process. SQLiteJobBackend shares
+    them between processes on one host (uvicorn --workers, several
+    containers on one volume). A networked backend (Redis, Postgres, ...)
+    implements the same methods:
+
+    - add(job): register a job; queued jobs become claimable by next_job()
+    - next_job(): wait for and claim the next queued job (None = stop):
+      highest priority class first, clients of a class take turns
+      (round robin, one job each), oldest job of the chosen client
+    - get(job_id): current state of any job, also ones run elsewhere
+    - started(job) / finish(job): record progress of a job run here
+    - withdraw(job): take a job out of the queue before anyone claims it
+    - request_cancel(job): ask the process running a job to cancel it
+      (it is handed to that process's on_cancel callback)
+    - position(job), active_count(), queued_count(), purge_expired(), stats()
+
+    get(), position() and stats() are awaited on every status poll and
+    event broadcast, so backends that do I/O run them off the event loop,
+    as does purge_expired(). active_count() and queued_count() are read by
+    /metrics and must not block; backends that do I/O return counts they
+    refresh in the background.
+
+    Jobs must provide job_id, status, seq, priority, client_id, to_record(), from_record() and
+    apply_record(), so shared backends can move them across processes as
+    JSON. Screenshots never go through the backend; finished jobs only
+    reference them by cache key, and the disk cache tier is what processes
+    share.
+    """
+    shared = False
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def add(self, job) -> int:
+        raise NotImplementedError
+
+    async def next_job(self):
+        raise NotImplementedError
+
+    async def stop_workers(self, count: int):
+        raise NotImplementedError
+
+    async def get(self, job_id: str):
+        raise NotImplementedError
+
+    async def started(self, job):
+        pass
+
+    async def finish(self, job):
+        raise NotImplementedError
+
+    async def withdraw(self, job) -> bool:
+        raise NotImplementedError
+
+    async def request_cancel(self, job):
+        pass
+
+    async def position(self, job) -> int:
+        raise NotImplementedError
+
+    def active_count(self) -> int:
+        raise NotImplementedError
+
+    def queued_count(self) -> int:
+        raise NotImplementedError
+
+    async def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    async def stats(self) -> Dict:
+        raise NotImplementedError
+
+class FairQueue:
+    """
+    Queued jobs by priority class, and within a class by client.
+
+    Each class maps client -> FIFO of that client's jobs; the dict order is
+    the turn order. pop() serves the first client of the highest non-empty
+    class and moves it to the back if it has more work, so a client with a
+    thousand jobs queued gets one worker turn per round like everybody else.
+    """
+    def __init__(self):
+        self._classes: Dict[str, OrderedDict] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, job):
+        clients = self._classes[job.priority]
+        clients.setdefault(job.client_id, deque()).append(job)
+        self._size += 1
+
+    def pop(self):
+        for clients in self._classes.values():
+            if clients:
+                client, queued = next(iter(clients.items()))
+                job = queued.popleft()
+                if queued:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                self._size -= 1
+                return job
+        return None
+
+    def remove(self, job) -> bool:
+        queued = self._classes[job.priority].get(job.client_id)
+        if queued is None or job not in queued:
+            return False
+        queued.remove(job)
+        if not queued:
+            del self._classes[job.priority][job.client_id]
+        self._size -= 1
+        return True
+
+    def position(self, job) -> int:
+        """1-based place in the order pop() will hand jobs out (0 if not queued)"""
+        ahead = 0
+        for priority, clients in self._classes.items():
+            if priority != job.priority:
+                ahead += sum(len(queued) for queued in clients.values())
+                continue
+            own = clients.get(job.client_id)
+            if own is None or job not in own:
+                return 0
+            index = own.index(job)
+            # Clients before ours in the turn order get index + 1 turns first, the rest index
+            before = True
+            for client, queued in clients.items():
+                if client == job.client_id:
+                    before = False
+                    ahead += index
+                else:
+                    ahead += min(len(queued), index + 1 if before else index)
+            return ahead + 1
+        return 0
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            priority: sum(len(queued) for queued in clients.values())
+            for priority, clients in self._classes.items()
+        }
+
+    def client_count(self) -> int:
+        return len({client for clients in self._classes.values() for client in clients})
+
+class MemoryJobBackend(JobBackend):
+    """Single-process default: a JobStore index plus a FairQueue"""
+    def __init__(self, retention_seconds: float):
+        self.store = JobStore(retention_seconds)
+        self.queue = FairQueue()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def add(self, job) -> int:
+        self.store.add(job)
+        if job.status == "queued":
+            self.queue.push(job)
+            self._wakeup.set()
+        return await self.position(job)
+
+    async def next_job(self):
+        while not self._stopping:
+            job = self.queue.pop()
+            if job is not None:
+                return job
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return None
+
+    async def stop_workers(self, count: int):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    async def finish(self, job):
+        self.store.finish(job)
+
+    async def withdraw(self, job) -> bool:
+        return self.queue.remove(job)
+
+    async def position(self, job) -> int:
+        """Jobs already processing, plus the job's place in the scheduling order"""
+        if job.status != "queued":
+            return self.store.position(job)
+        queued = self.queue.position(job)
+        if not queued:
+            return 0
+        return self.store.active_count() - len(self.queue) + queued
+
+    def active_count(self) -> int:
+        return self.store.active_count()
+
+    def queued_count(self) -> int:
+        return len(self.queue)
+
+    async def purge_expired(self) -> int:
+        return self.store.purge_expired()
+
+    async def stats(self) -> Dict:
+        return {
+            "backend": "memory",
+            **self.store.stats(),
+            "queued_by_priority": self.queue.counts(),
+            "queued_clients": self.queue.client_count(),
+        }
+
+class SQLiteJobBackend(JobBackend):
+    """
+    Jobs and queue in a SQLite database (WAL) shared by the processes of
+    one host.
+
+    Scheduling follows FairQueue: lowest priority rank first, then the
+    client that was served longest ago (client_turns), then the oldest job.
+
+    Claiming a job takes the database write lock (BEGIN IMMEDIATE, a file
+    lock), so exactly one process gets it, together with a lease. The owner
+    renews its leases every few seconds; a job whose lease ran out (its
+    process died) is claimed again by someone else. Jobs this process has
+    handed out are kept as live objects so event subscribers work, and the
+    ones it does not run itself are refreshed from the database once a
+    second while somebody is subscribed (on_remote_change is then called).
+    Live objects of finished jobs, wherever they ran, are dropped
+    retention_seconds after this process first sees them finished. The
+    active and queued counts are refreshed by the same once-a-second pass.
+    """
+    shared = True
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path: str, retention_seconds: float, lease_seconds: float, job_class,
+                 on_remote_change: Optional[Callable[[Any, str], Awaitable[None]]] = None,
+                 on_cancel: Optional[Callable[[Any], None]] = None):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.job_class = job_class
+        self.on_remote_change = on_remote_change
+        self.on_cancel = on_cancel
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT UNIQUE NOT NULL,
+                status TEXT NOT NULL,
+                record TEXT NOT NULL,
+                owner TEXT,
+                lease_expires REAL,
+                finished_at REAL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                client TEXT NOT NULL DEFAULT '',
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS client_turns (
+                client TEXT PRIMARY KEY,
+                last_served REAL NOT NULL
+            );
+        """)
+        # Databases created before priorities existed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "priority" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("ALTER TABLE jobs ADD COLUMN client TEXT NOT NULL DEFAULT ''")
+        if "cancel_requested" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        self._db.executescript("""
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, seq);
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, priority, client, seq);
+            CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished_at);
+        """)
+
+        self._jobs: Dict[str, Any] = {}  # Live objects handed out by this process
+        self._running: Dict[str, Any] = {}  # Jobs this process is executing
+        self._forget: Deque[Tuple[float, str]] = deque()
+        self._forgetting: Set[str] = set()  # Job ids in _forget
+        self._active_count = 0
+        self._queued_count = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self.claimed = 0
+        self.reclaimed = 0
+        self.evicted = 0
+
+    def _execute(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def start(self):
+        self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        with self._lock:
+            self._db.close()
+
+    def _live(self, job_id: str, record: Dict):
+        """The live object for a job, created or refreshed from its record"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self.job_class.from_record(record)
+            self._jobs[job_id] = job
+        elif job_id not in self._running:
+            job.apply_record(record)
+        if job_id not in self._running and job.status in FINISHED_STATUSES:
+            # Finished elsewhere (or before this process looked it up)
+            self._forget_later(job_id)
+        return job
+
+    def _forget_later(self, job_id: str):
+        """Drop the live object of a finished job once its retention period is over"""
+        if job_id not in self._forgetting:
+            self._forgetting.add(job_id)
+            self._forget.append((time.monotonic() + self.retention_seconds, job_id))
+
+    async def add(self, job) -> int:
+        record = json.dumps(job.to_record())
+        # Jobs that start right away are leased to this process immediately
+        running = job.status == "processing"
+
+        def insert() -> int:
+            with self._lock:
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (job_id, status, record, owner, lease_expires, priority, client) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job.job_id, job.status.value, record,
+                     self.owner if running else None,
+                     time.time() + self.lease_seconds if running else None,
+                     priority_rank(job.priority), job.client_id)
+                )
+                return cursor.lastrowid
+
+        job.seq = await asyncio.to_thread(insert)
+        self._jobs[job.job_id] = job
+        if running:
+            self._running[job.job_id] = job
+        self._wakeup.set()
+        return await self.position(job)
+
+    def _claim(self) -> Optional[Tuple[int, str, Dict, bool]]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT jobs.seq, jobs.job_id, jobs.record, jobs.status, jobs.client FROM jobs "
+                    "LEFT JOIN client_turns ON client_turns.client = jobs.client "
+                    "WHERE jobs.status = 'queued' OR (jobs.status = 'processing' AND jobs.lease_expires < ?) "
+                    "ORDER BY jobs.priority, COALESCE(client_turns.last_served, 0), jobs.seq LIMIT 1", (now,)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'processing', owner = ?, lease_expires = ? WHERE seq = ?",
+                        (self.owner, now + self.lease_seconds, row[0])
+                    )
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO client_turns (client, last_served) VALUES (?, ?)", (row[4], now)
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        seq, job_id, record, status, _ = row
+        return seq, job_id, json.loads(record), status == "processing"
+
+    async def next_job(self):
+        while not self._stopping:
+            claimed = await asyncio.to_thread(self._claim)
+            if claimed:
+                seq, job_id, record, abandoned = claimed
+                job = self._live(job_id, record)
+                job.seq = seq
+                self._running[job_id] = job
+                self.claimed += 1
+                if abandoned:
+                    self.reclaimed += 1
+                    log.warning("Reclaimed job from an expired lease", extra={"job_id": job_id})
+                return job
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    async def stop_workers(self, count: int):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def get(self, job_id: str):
+        if job_id in self._running:
+            return self._running[job_id]
+        rows = await asyncio.to_thread(self._execute, "SELECT seq, record FROM jobs WHERE job_id = ?", (job_id,))
+        if not rows:
+            self._jobs.pop(job_id, None)
+            return None
+        seq, record = rows[0]
+        job = self._live(job_id, json.loads(record))
+        job.seq = seq
+        return job
+
+    async def _save(self, job, finished: bool = False):
+        record = json.dumps(job.to_record())
+
+        def update():
+            with self._lock:
+                if finished:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, record = ?, owner = NULL, lease_expires = NULL, finished_at = ? "
+                        "WHERE job_id = ?", (job.status.value, record, time.time(), job.job_id)
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, record = ?, owner = ?, lease_expires = ? WHERE job_id = ?",
+                        (job.status.value, record, self.owner, time.time() + self.lease_seconds, job.job_id)
+                    )
+
+        await asyncio.to_thread(update)
+
+    async def started(self, job):
+        self._running[job.job_id] = job
+        await self._save(job)
+
+    async def withdraw(self, job) -> bool:
+        """Cancel a job that is still queued; False once some process has claimed it"""
+        def cancel() -> bool:
+            with self._lock:
+                return self._db.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                    (time.time(), job.job_id)
+                ).rowcount == 1
+
+        return await asyncio.to_thread(cancel)
+
+    async def request_cancel(self, job):
+        """Flag a running job; its owner picks the flag up on its next maintenance pass"""
+        await asyncio.to_thread(
+            self._execute, "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'processing'", (job.job_id,)
+        )
+
+    async def finish(self, job):
+        await self._save(job, finished=True)
+        self._running.pop(job.job_id, None)
+        self._forget_later(job.job_id)
+
+    async def position(self, job) -> int:
+        """
+        Jobs processing or in a higher class, plus the round-robin turns
+        ahead within the job's class. Turn order is not known per client
+        here, so every other client is assumed to go first in each round
+        (an upper bound, exact once the job is its client's oldest).
+        """
+        return await asyncio.to_thread(self._position, job.seq)
+
+    def _position(self, seq: int) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT status, priority, client FROM jobs WHERE seq = ?", (seq,)).fetchone()
+            if not row or row[0] not in ACTIVE_STATUSES:
+                return 0
+            status, priority, client = row
+            if status != "queued":
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'processing' AND seq <= ?", (seq,)
+                ).fetchone()[0]
+            ahead = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'processing' OR (status = 'queued' AND priority < ?)",
+                (priority,)
+            ).fetchone()[0]
+            index = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority = ? AND client = ? AND seq < ?",
+                (priority, client, seq)
+            ).fetchone()[0]
+            others = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority = ? AND client != ? GROUP BY client",
+                (priority, client)
+            ).fetchall()
+        return ahead + index + sum(min(count, index + 1) for (count,) in others) + 1
+
+    def active_count(self) -> int:
+        """As of the last maintenance pass (at most a second old)"""
+        return self._active_count
+
+    def queued_count(self) -> int:
+        """As of the last maintenance pass (at most a second old)"""
+        return self._queued_count
+
+    def _active_counts(self) -> Tuple[int, int]:
+        rows = dict(self._execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'processing') GROUP BY status"
+        ))
+        return rows.get("queued", 0) + rows.get("processing", 0), rows.get("queued", 0)
+
+    async def purge_expired(self) -> int:
+        """Forget finished jobs past their retention period (in every process)"""
+        now = time.monotonic()
+        while self._forget and self._forget[0][0] <= now:
+            _, job_id = self._forget.popleft()
+            self._forgetting.discard(job_id)
+            self._jobs.pop(job_id, None)
+        purged = await asyncio.to_thread(self._delete_expired)
+        self.evicted += purged
+        return purged
+
+    def _delete_expired(self) -> int:
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            purged = self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,)).rowcount
+            # A client that has not been served for that long starts over as a new one
+            self._db.execute("DELETE FROM client_turns WHERE last_served < ?", (cutoff,))
+        return purged
+
+    async def _maintain(self):
+        """Renew this process's leases, pass on cancel requests and refresh watched jobs run elsewhere"""
+        renew_every = max(1.0, self.lease_seconds / 3)
+        last_renewal = 0.0
+        while True:
+            try:
+                await asyncio.sleep(1)
+                if self._running and time.monotonic() - last_renewal >= renew_every:
+                    last_renewal = time.monotonic()
+                    await asyncio.to_thread(
+                        self._execute,
+                        "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = 'processing'",
+                        (time.time() + self.lease_seconds, self.owner)
+                    )
+                if self._running and self.on_cancel:
+                    await self._dispatch_cancels()
+                await self._refresh_watched()
+                self._active_count, self._queued_count = await asyncio.to_thread(self._active_counts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("Job backend maintenance error: %s", e)
+
+    async def _dispatch_cancels(self):
+        def take() -> List[str]:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT job_id FROM jobs WHERE owner = ? AND status = 'processing' AND cancel_requested = 1",
+                    (self.owner,)
+                ).fetchall()
+                job_ids = [job_id for (job_id,) in rows]
+                self._db.executemany("UPDATE jobs SET cancel_requested = 0 WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+            return job_ids
+
+        for job_id in await asyncio.to_thread(take):
+            job = self._running.get(job_id)
+            if job is not None and self.on_cancel:
+                self.on_cancel(job)
+
+    async def _refresh_watched(self):
+        watched = [
+            job for job_id, job in self._jobs.items()
+            if job.subscribers and job_id not in self._running and job.status in ACTIVE_STATUSES
+        ]
+        if not watched or not self.on_remote_change:
+            return
+        placeholders = ",".join("?" * len(watched))
+        rows = await asyncio.to_thread(
+            self._execute, f"SELECT job_id, record FROM jobs WHERE job_id IN ({placeholders})",
+            tuple(job.job_id for job in watched)
+        )
+        for job_id, record in rows:
+            job = self._jobs.get(job_id)
+            if job is None or job_id in self._running:
+                continue
+            previous = job.status.value
+            job.apply_record(json.loads(record))
+            if job.status in FINISHED_STATUSES:
+                self._forget_later(job_id)
+            await self.on_remote_change(job, previous)
+
+    def _counts(self) -> Tuple[Dict, Dict, int]:
+        with self._lock:
+            rows = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            queued = dict(self._db.execute(
+                "SELECT priority, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY priority"
+            ).fetchall())
+            clients = self._db.execute("SELECT COUNT(DISTINCT client) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return rows, queued, clients
+
+    async def stats(self) -> Dict:
+        rows, queued, clients = await asyncio.to_thread(self._counts)
+        active = sum(rows.get(status, 0) for status in ACTIVE_STATUSES)
+        finished = sum(rows.get(status, 0) for status in FINISHED_STATUSES)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "owner": self.owner,
+            "total_jobs": active + finished,
+            "active_jobs": active,
+            "queued_jobs": rows.get("queued", 0),
+            "queued_by_priority": {priority: queued.get(rank, 0) for rank, priority in enumerate(PRIORITIES)},
+            "queued_clients": clients,
+            "finished_jobs": finished,
+            "running_here": len(self._running),
+            "claimed": self.claimed,
+            "reclaimed": self.reclaimed,
+            "evicted_jobs": self.evicted,
+            "lease_seconds": self.lease_seconds,
+            "retention_seconds": self.retention_seconds,
+        }
@@ -0,0 +1,79 @@
+import time
+import bisect
+from collections import deque
+from typing import Any, Dict, List, Deque, Tuple
+
+class JobStore:
+    """
+    Job registry with an ordered index of active jobs.
+
+    Every job gets an increasing sequence number on add(). Active (queued
+    or processing) jobs are indexed in a sorted list of those numbers, so
+    a queue position is one bisect instead of a scan over every job ever
+    submitted. Finished jobs are dropped retention_seconds after they
+    complete; since jobs finish in time order, expiry pops from a deque.
+    """
+    def __init__(self, retention_seconds: float):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Any] = {}
+        self._active: List[int] = []  # Sorted sequence numbers of active jobs
+        self._finished: Deque[Tuple[float, str]] = deque()
+        self._seq = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def add(self, job) -> int:
+        """Register a new active job, returns its 1-based queue position"""
+        self.purge_expired()
+        self._seq += 1
+        job.seq = self._seq
+        self._jobs[job.job_id] = job
+        self._active.append(job.seq)  # Always the largest, list stays sorted
+        return len(self._active)
+
+    def get(self, job_id: str):
+        self.purge_expired()
+        return self._jobs.get(job_id)
+
+    def position(self, job) -> int:
+        """1-based position among active jobs (0 if the job is not active)"""
+        index = bisect.bisect_left(self._active, job.seq)
+        if index < len(self._active) and self._active[index] == job.seq:
+            return index + 1
+        return 0
+
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def finish(self, job):
+        """Move a job out of the active index and start its retention clock"""
+        index = bisect.bisect_left(self._active, job.seq)
+        if index < len(self._active) and self._active[index] == job.seq:
+            del self._active[index]
+            self._finished.append((time.monotonic() + self.retention_seconds, job.job_id))
+
+    def purge_expired(self) -> int:
+        """Forget finished jobs past their retention period"""
+        now = time.monotonic()
+        purged = 0
+        while self._finished and self._finished[0][0] <= now:
+            _, job_id = self._finished.popleft()
+            if self._jobs.pop(job_id, None) is not None:
+                purged += 1
+        self.evicted += purged
+        return purged
+
+    def stats(self) -> Dict:
+        self.purge_expired()
+        return {
+            "total_jobs": len(self._jobs),
+            "active_jobs": len(self._active),
+            "finished_jobs": len(self._finished),
+            "evicted_jobs": self.evicted,
+            "retention_seconds": self.retention_seconds,
+        }
@@ -1,21 +1,75 @@
 import os
-import sys
 import asyncio
-import base64
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Sequence, Tuple
 import httpx
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+import config
+from logs import configure_logging
+from capture_result import CaptureResult, find_image, get_cache_key, image_response
+from memory_cache import MemoryCache
+
+configure_logging(config.LOG_LEVEL, config.LOG_FORMAT)
+log = logging.getLogger("main-vercel")
 
 # Environment detection
 IS_VERCEL = os.getenv("VERCEL") == "1"
 
-app = FastAPI(title="Dribble Shots API")
+# Context options per viewport; the screenshot API gets the same size and scale
+VIEWPORTS: Dict[str, Dict] = {
+    "desktop": {"viewport": {"width": 1920, "height": 1080}, "device_scale_factor": 1},
+    # iPhone 14 Pro
+    "mobile": {"viewport": {"width": 390, "height": 844}, "device_scale_factor": 3, "is_mobile": True, "has_touch": True},
+}
+
+# Same result model and memory cache as main.py. A warm function instance
+# answers repeat URLs without calling the API; nothing is shared between
+# instances, so /capture returns the images inline by default.
+screenshot_cache = MemoryCache(config.MEMORY_CACHE_MAX_MB * 1024 * 1024, config.MEMORY_CACHE_TTL_SECONDS)
+# Identical captures running right now: later requests wait for the first
+inflight_captures: Dict[str, asyncio.Future] = {}
+
+# Created on first use and kept for the lifetime of the instance, so warm
+# invocations reuse open (keep-alive) connections to the screenshot API
+http_client: Optional[httpx.AsyncClient] = None
+
+# Local (non-Vercel) mode: one Chromium, launched on first use and reused
+playwright_instance = None
+browser = None
+browser_lock = asyncio.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(
+                max_connections=config.SCREENSHOT_API_MAX_CONNECTIONS,
+                max_keepalive_connections=config.SCREENSHOT_API_MAX_CONNECTIONS
+            )
+        )
+    return http_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    if http_client:
+        await http_client.aclose()
+    if browser:
+        await browser.close()
+    if playwright_instance:
+        await playwright_instance.stop()
+
+app = FastAPI(title="Dribble Shots API", lifespan=lifespan)
 
 class CaptureRequest(BaseModel):
     url: str
     scroll_to_bottom: bool = True
+    use_cache: bool = True
 
 @app.get("/")
 def read_root():
@@ -34,132 +88,130 @@ app.add_middleware(
 )
 
 # Vercel-compatible screenshot using external API
-async def capture_with_api(url: str, viewport_width: int, viewport_height: int, device_scale: int = 1):
+async def capture_with_api(url: str, viewport: str) -> bytes:
     """
     Use ScreenshotOne.com free tier API for serverless screenshots
     Free tier: 100 screenshots/month
     Alternative: Use your own API key for unlimited
     """
-    
-    api_key = os.getenv("SCREENSHOT_API_KEY", "demo")  # Use 'demo' for testing
-    
+    options = VIEWPORTS[viewport]
     params = {
         "url": url,
-        "viewport_width": viewport_width,
-        "viewport_height": viewport_height,
-        "device_scale_factor": device_scale,
+        "viewport_width": options["viewport"]["width"],
+        "viewport_height": options["viewport"]["height"],
+        "device_scale_factor": options["device_scale_factor"],
         "format": "png",
         "full_page": "true",
         "delay": "1000",  # Wait 1s for page load
-        "access_key": api_key
+        "access_key": config.SCREENSHOT_API_KEY  # 'demo' for testing
     }
-    
-    api_url = "https://api.screenshotone.com/take"
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.get(api_url, params=params)
-        
-        if response.status_code == 200:
-            return base64.b64encode(response.content).decode('utf-8')
-        else:
-            raise HTTPException(status_code=500, detail=f"Screenshot API error: {response.status_code}")
+    response = await get_http_client().get(config.SCREENSHOT_API_URL, params=params)
+    if response.status_code != 200:
+        raise Exception(f"Screenshot API error: {response.status_code}")
+    return response.content
+
+async def get_browser():
+    global playwright_instance, browser
+    async with browser_lock:
+        if browser is None or not browser.is_connected():
+            from playwright.async_api import async_playwright
+            if playwright_instance is None:
+                playwright_instance = await async_playwright().start()
+            browser = await playwright_instance.chromium.launch(
+                headless=True,
+                args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"]
+            )
+        return browser
+
+async def capture_with_browser(url: str, viewport: str, scroll_to_bottom: bool) -> Tuple[bytes, str]:
+    """Local Playwright (Docker/local development): one context per viewport on the shared browser"""
+    context = await (await get_browser()).new_context(**VIEWPORTS[viewport])
+    try:
+        page = await context.new_page()
+        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+        if scroll_to_bottom:
+            await asyncio.sleep(2)
+        return await page.screenshot(full_page=True), await page.title()
+    finally:
+        await context.close()
+
+async def capture_viewports(url: str, scroll_to_bottom: bool, viewports: Sequence[str]) -> Tuple[Dict[str, bytes], str]:
+    """PNG per viewport (all fetched concurrently) and the page title, if known"""
+    if IS_VERCEL:
+        images = await asyncio.gather(*(capture_with_api(url, viewport) for viewport in viewports))
+        return dict(zip(viewports, images)), ""
+    captures = await asyncio.gather(*(capture_with_browser(url, viewport, scroll_to_bottom) for viewport in viewports))
+    return {viewport: image for viewport, (image, _) in zip(viewports, captures)}, captures[0][1]
+
+async def get_capture(url: str, scroll_to_bottom: bool, use_cache: bool = True,
+                      viewports: Sequence[str] = ("desktop", "mobile")) -> CaptureResult:
+    """Cached result, a running identical capture, or a new one"""
+    cache_key = get_cache_key(url, scroll_to_bottom, "none", "png:" + "+".join(viewports))
+    if use_cache:
+        cached = screenshot_cache.get(cache_key)
+        if cached:
+            return cached
+    inflight = inflight_captures.get(cache_key)
+    if inflight:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    # Retrieve the error when no follower is waiting for it
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    inflight_captures[cache_key] = future
+    try:
+        log.info("Capturing %s", " + ".join(viewports), extra={"url": url})
+        images, page_title = await capture_viewports(url, scroll_to_bottom, viewports)
+        result = CaptureResult(cache_key, page_title, images=images, image_format="png")
+        screenshot_cache.put(cache_key, result, result.memory_size())
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+        inflight_captures.pop(cache_key, None)
+
+def normalize_url(url: str) -> str:
+    if not url.startswith("http"):
+        url = f"https://{url}"
+    return url
 
 @app.post("/capture")
-async def capture(request: CaptureRequest):
+async def capture(request: CaptureRequest, inline: bool = True):
     """
     Capture desktop and mobile screenshots
     Uses external API service on Vercel, Playwright locally
     """
-    url = request.url
-    
-    if not url.startswith("http"):
-        url = f"https://{url}"
-    
-    print(f"📸 Capturing screenshots for: {url}")
-    
-    if IS_VERCEL:
-        # Use external API service
-        try:
-            print("Using ScreenshotOne API (Vercel mode)")
-            
-            # Capture desktop (1920x1080)
-            desktop_base64 = await capture_with_api(url, 1920, 1080, 1)
-            
-            # Capture mobile (390x844, iPhone 14 Pro)
-            mobile_base64 = await capture_with_api(url, 390, 844, 3)
-            
-            return JSONResponse({
-                "desktop": desktop_base64,
-                "mobile": mobile_base64
-            })
-            
-        except Exception as e:
-            print(f"Error: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    else:
-        # Use local Playwright (Docker/local development)
-        from playwright.async_api import async_playwright
-        
-        try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"]
-                )
-                
-                # Desktop context
-                desktop_context = await browser.new_context(
-                    viewport={"width": 1920, "height": 1080},
-                    device_scale_factor=1
-                )
-                desktop_page = await desktop_context.new_page()
-                await desktop_page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                
-                if request.scroll_to_bottom:
-                    await asyncio.sleep(2)
-                    
-                desktop_bytes = await desktop_page.screenshot(full_page=True)
-                await desktop_context.close()
-                
-                # Mobile context
-                mobile_context = await browser.new_context(
-                    viewport={"width": 390, "height": 844},
-                    device_scale_factor=3,
-                    is_mobile=True,
-                    has_touch=True
-                )
-                mobile_page = await mobile_context.new_page()
-                await mobile_page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                
-                if request.scroll_to_bottom:
-                    await asyncio.sleep(2)
-                    
-                mobile_bytes = await mobile_page.screenshot(full_page=True)
-                await mobile_context.close()
-                await browser.close()
-                
-                return JSONResponse({
-                    "desktop": base64.b64encode(desktop_bytes).decode('utf-8'),
-                    "mobile": base64.b64encode(mobile_bytes).decode('utf-8')
-                })
-                
-        except Exception as e:
-            print(f"Error: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+    url = normalize_url(request.url)
+    try:
+        result = await get_capture(url, request.scroll_to_bottom, request.use_cache)
+    except Exception as e:
+        log.error("Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    # inline=false: image URLs, only served by the instance that holds the cache entry
+    return JSONResponse(result.to_json(f"/cache/{result.cache_key}", inline))
+
+@app.get("/cache/{cache_key}/{filename}")
+async def get_cached_image(cache_key: str, filename: str, request: Request):
+    result = screenshot_cache.get(cache_key, record_stats=False)
+    name = find_image(result, filename)
+    return image_response(request, result, name, "public, max-age=3600")
 
 # Legacy endpoints for backward compatibility
 @app.get("/screenshot")
-async def screenshot(url: str):
-    request = CaptureRequest(url=url, scroll_to_bottom=True)
-    result = await capture(request)
-    data = result.body.decode()
-    import json
-    screenshots = json.loads(data)
-    return Response(
-        content=base64.b64decode(screenshots['desktop']),
-        media_type="image/png"
-    )
+async def screenshot(url: str, request: Request):
+    """Desktop PNG; reuses a cached desktop + mobile capture, otherwise only desktop is taken"""
+    url = normalize_url(url)
+    both = screenshot_cache.get(get_cache_key(url, True, "none", "png:desktop+mobile"))
+    try:
+        result = both or await get_capture(url, True, viewports=("desktop",))
+    except Exception as e:
+        log.error("Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return image_response(request, result, "desktop", "public, max-age=3600")
 
 @app.get("/screenshot-both")
 async def screenshot_both(url: str):
@@ -1,71 +1,417 @@
 import sys
+import json
+import time
 import asyncio
-import base64
 import uuid
 import hashlib
+import logging
 from contextlib import asynccontextmanager
 from enum import Enum
-from typing import Optional, Dict
-from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException, Response
+from typing import Optional, Dict, List, Callable, Literal, Annotated, Tuple, Deque
+from collections import deque
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from playwright.async_api import async_playwright, Page, Browser, Playwright
+import config
+import metrics
+from logs import configure_logging
+from context_pool import ContextPool
+from browser_supervisor import BrowserSupervisor
+from disk_cache import DiskCache
+from memory_cache import MemoryCache
+from settle import SETTLE_SCRIPT, NetworkTracker, scroll_and_settle, settle_page
+from request_blocking import RequestBlocker
+from resource_cache import ResourceCache, ResourceBudget
+from revalidation import Revalidator, document_validators
+from image_formats import content_type, extension
+from image_pipeline import ImagePipeline, OutputOptions, Screenshot, max_height, raw_size, supported_formats
+from capture_result import CaptureResult, find_image, get_cache_key, image_response
+from tiling import screenshot_region
+from job_backend import FINISHED_STATUSES, PRIORITIES, JobBackend, MemoryJobBackend, SQLiteJobBackend
+from mockup import MockupRenderer, customization_hash
+from device_profiles import DeviceProfile, load_profiles
+
+configure_logging(config.LOG_LEVEL, config.LOG_FORMAT)
+log = logging.getLogger(__name__)
 
 # Fix for Windows Event Loop (Only affects local Windows testing)
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-# Global browser instance (reused across all requests)
+# Playwright driver shared by every supervised browser instance
 playwright_instance: Playwright = None
-browser: Browser = None
-
-# Cache system for screenshots (valid for 1 hour)
-class CacheEntry:
-    def __init__(self, desktop_base64: str, mobile_base64: str, page_title: str = ""):
-        self.desktop_base64 = desktop_base64
-        self.mobile_base64 = mobile_base64
-        self.page_title = page_title
-        self.timestamp = datetime.now()
-    
-    def is_expired(self) -> bool:
-        """Check if cache entry is older than 1 hour"""
-        return datetime.now() - self.timestamp > timedelta(hours=1)
-
-screenshot_cache: Dict[str, CacheEntry] = {}
-
-def get_cache_key(url: str, scroll_to_bottom: bool) -> str:
-    """Generate a cache key from URL and scroll setting"""
-    cache_string = f"{url}:{scroll_to_bottom}"
-    return hashlib.md5(cache_string.encode()).hexdigest()
-
-def get_from_cache(url: str, scroll_to_bottom: bool) -> Optional[Dict]:
-    """Try to get screenshot from cache"""
-    cache_key = get_cache_key(url, scroll_to_bottom)
-    
-    if cache_key in screenshot_cache:
-        entry = screenshot_cache[cache_key]
-        if not entry.is_expired():
-            print(f"✅ Cache hit for {url} (age: {(datetime.now() - entry.timestamp).seconds}s)")
-            return {
-                "desktop": entry.desktop_base64,
-                "mobile": entry.mobile_base64,
-                "title": entry.page_title
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+background_tasks: set = set()
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Devices a capture can be taken as (device_profiles.py plus DEVICE_PROFILES)
+DEVICE_PROFILES: Dict[str, DeviceProfile] = load_profiles(config.DEVICE_PROFILES)
+DEFAULT_DEVICES = ("desktop", "mobile")
+# Contexts of the "desktop" pool are created as the desktop profile and those
+# of the "mobile" pool as the mobile profile; other devices (and devices a
+# loaded page is switched to) are emulated on top through CDP
+POOL_PROFILES = {"desktop": DEVICE_PROFILES["desktop"], "mobile": DEVICE_PROFILES["mobile"]}
+
+def new_context_pools() -> Dict[str, ContextPool]:
+    """Pre-warmed contexts (stealth script already applied) for one browser instance, reset between uses"""
+    return {
+        "desktop": ContextPool("Desktop", POOL_PROFILES["desktop"].context_options(), config.CONTEXT_POOL_DESKTOP_SIZE, config.CONTEXT_POOL_MAX_USES, [SETTLE_SCRIPT]),
+        "mobile": ContextPool("Mobile", POOL_PROFILES["mobile"].context_options(), config.CONTEXT_POOL_MOBILE_SIZE, config.CONTEXT_POOL_MAX_USES, [SETTLE_SCRIPT]),
+    }
+
+async def launch_browser() -> Browser:
+    return await playwright_instance.chromium.launch(
+        headless=True,
+        args=[
+            "--no-sandbox",                # Essential for Docker
+            "--disable-dev-shm-usage",     # SAVES MEMORY (Critical for Free Tier)
+            "--disable-gpu",               # Saves CPU
+        ]
+    )
+
+async def start_playwright():
+    global playwright_instance
+    playwright_instance = await async_playwright().start()
+
+# Local page for the warm-up render: text in the bundled and fallback fonts,
+# a gradient, an SVG and a bit of script, never a network request
+WARMUP_PAGE = """<!doctype html><html><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1"></head>
+<body style="margin:0;font-family:sans-serif;background:linear-gradient(#fafafa,#dde)">
+<h1 style="font-family:serif">Warm-up</h1><p>The quick brown fox jumps over the lazy dog. 0123456789</p>
+<p style="font-family:monospace">ÀÉÎÕÜ ßçñ — “quotes” ✓</p>
+<svg width="200" height="80"><rect width="200" height="80" rx="12" fill="#8af"/></svg>
+<script>document.body.appendChild(document.createElement("div")).textContent = [1, 2, 3].map(n => n * 2).join(",");</script>
+</body></html>"""
+
+async def warm_contexts(pools: Dict[str, ContextPool]):
+    """Render WARMUP_PAGE once per viewport so a new instance's first capture starts warm"""
+    async def warm(pool: ContextPool):
+        async with pool.checkout() as context:
+            page = await context.new_page()
+            try:
+                await page.set_content(WARMUP_PAGE, wait_until="load")
+                await page.screenshot(type="jpeg", quality=85, full_page=True)
+            finally:
+                await page.close()
+    await asyncio.gather(*(warm(pool) for pool in pools.values()))
+
+# Chromium instances (each with its own context pools), recycled and relaunched as needed
+browsers = BrowserSupervisor(
+    launch_browser,
+    new_context_pools,
+    config.BROWSER_INSTANCES,
+    config.BROWSER_MAX_CAPTURES,
+    config.BROWSER_MAX_RSS_MB * 1024 * 1024,
+    config.BROWSER_HEALTH_CHECK_SECONDS,
+    boot_timeout=config.BROWSER_BOOT_TIMEOUT_SECONDS,
+    warm=warm_contexts if config.BROWSER_PREWARM else None
+)
+
+# First cache tier: byte-bounded LRU in memory with per-entry TTL; expired
+# entries stay CACHE_STALE_SECONDS longer to be served while they are refreshed
+screenshot_cache = MemoryCache(
+    config.MEMORY_CACHE_MAX_MB * 1024 * 1024,
+    config.MEMORY_CACHE_TTL_SECONDS,
+    config.CACHE_STALE_SECONDS
+)
+
+# Second tier: content-addressed JPEGs on local disk (survives restarts)
+disk_cache: Optional[DiskCache] = None
+if config.DISK_CACHE_DIR:
+    try:
+        disk_cache = DiskCache(
+            config.DISK_CACHE_DIR,
+            config.DISK_CACHE_MAX_MB * 1024 * 1024,
+            config.DISK_CACHE_TTL_HOURS * 3600,
+            config.CACHE_STALE_SECONDS
+        )
+    except Exception as e:
+        log.warning("Disk cache disabled: %s", e)
+
+# Subresources (scripts, styles, fonts, images) reused across page loads.
+# In "job" mode every capture gets its own cache for its devices, and the
+# caches of concurrent captures share one RESOURCE_CACHE_MAX_MB budget.
+shared_resource_cache: Optional[ResourceCache] = None
+job_resource_budget = ResourceBudget(config.RESOURCE_CACHE_MAX_MB * 1024 * 1024)
+if config.RESOURCE_CACHE_MODE == "shared":
+    shared_resource_cache = ResourceCache(
+        config.RESOURCE_CACHE_MAX_MB * 1024 * 1024,
+        config.RESOURCE_CACHE_MAX_ENTRY_KB * 1024,
+        shared=True
+    )
+
+# Transcoding, preview scaling and hashing of screenshots
+image_pipeline = ImagePipeline(config.IMAGE_WORKERS, config.IMAGE_EXECUTOR)
+
+# Server-side mockups, composited in worker processes and cached by
+# (capture, template, customization, output)
+mockup_renderer = MockupRenderer(config.MOCKUP_ASSETS_DIR, config.MOCKUP_WORKERS)
+mockup_cache = MemoryCache(config.MOCKUP_CACHE_MAX_MB * 1024 * 1024, config.MEMORY_CACHE_TTL_SECONDS)
+
+def new_job_resource_cache() -> Optional[ResourceCache]:
+    if config.RESOURCE_CACHE_MODE != "job":
+        return None
+    return ResourceCache(config.RESOURCE_CACHE_MAX_MB * 1024 * 1024, config.RESOURCE_CACHE_MAX_ENTRY_KB * 1024,
+                         budget=job_resource_budget)
+
+# Everything that changes what a capture produces (and therefore its cache key)
+class CaptureOptions:
+    def __init__(self, scroll_to_bottom: bool = True, block_profile: str = "none",
+                 output: Optional[OutputOptions] = None, devices: Tuple[str, ...] = DEFAULT_DEVICES):
+        self.scroll_to_bottom = scroll_to_bottom
+        self.block_profile = block_profile
+        self.output = output or OutputOptions()
+        self.devices = tuple(devices)
+    
+    @classmethod
+    def from_request(cls, request) -> "CaptureOptions":
+        output = OutputOptions(
+            request.format,
+            request.quality,
+            request.target_kb * 1024 if request.target_kb else None,
+            request.previews
+        )
+        return cls(request.scroll_to_bottom, request.block_profile, output, request.devices)
+    
+    def with_devices(self, devices: Tuple[str, ...]) -> "CaptureOptions":
+        return CaptureOptions(self.scroll_to_bottom, self.block_profile, self.output, devices)
+    
+    def cache_key(self, url: str) -> str:
+        """Key of the combined result (mockups are cached under it); the images are cached per device"""
+        return get_cache_key(url, self.scroll_to_bottom, self.block_profile, f"{self.output.key()}:{'+'.join(self.devices)}")
+    
+    def device_key(self, url: str, device: str) -> str:
+        """Cache entry of one device's screenshots, shared by every request that asks for that device"""
+        return get_cache_key(url, self.scroll_to_bottom, self.block_profile, f"{self.output.key()}:{DEVICE_PROFILES[device].key()}")
+    
+    def to_dict(self) -> Dict:
+        output = self.output
+        return {
+            "scroll_to_bottom": self.scroll_to_bottom,
+            "block_profile": self.block_profile,
+            "devices": list(self.devices),
+            "output": {
+                "format": output.image_format,
+                "quality": output.quality,
+                "target_bytes": output.target_bytes,
+                "previews": output.previews
             }
-        else:
-            # Remove expired entry
-            print(f"🗑️  Cache expired for {url}, removing...")
-            del screenshot_cache[cache_key]
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CaptureOptions":
+        output = data["output"]
+        return cls(
+            data["scroll_to_bottom"],
+            data["block_profile"],
+            OutputOptions(output["format"], output["quality"], output["target_bytes"], output["previews"]),
+            data.get("devices", DEFAULT_DEVICES)
+        )
+
+# A mockup to render from a capture: template plus editor customization
+class MockupSpec:
+    def __init__(self, template: str, customization: Dict, image_format: str = "jpeg", quality: int = 90):
+        self.template = template
+        self.customization = customization
+        self.image_format = image_format
+        self.quality = quality
+    
+    @classmethod
+    def from_request(cls, request) -> "MockupSpec":
+        customization = request.customization.model_dump(exclude_none=True)
+        return cls(request.template, customization, request.format, request.quality)
+    
+    def cache_key(self, capture_key: str) -> str:
+        spec = f"{capture_key}:{self.template}:{customization_hash(self.customization)}:{self.image_format}:{self.quality}"
+        return hashlib.md5(spec.encode()).hexdigest()
     
-    print(f"❌ Cache miss for {url}")
+    def to_dict(self) -> Dict:
+        return {
+            "template": self.template,
+            "customization": self.customization,
+            "image_format": self.image_format,
+            "quality": self.quality
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MockupSpec":
+        return cls(data["template"], data["customization"], data["image_format"], data["quality"])
+
+def get_from_cache(url: str, options: CaptureOptions, device: str) -> Optional[CaptureResult]:
+    """Try to get one device's screenshots from cache; a stale entry is returned and refreshed in the background"""
+    cache_key = options.device_key(url, device)
+    
+    result = screenshot_cache.get(cache_key)
+    if result:
+        log.debug("Memory cache hit (%s)", device, extra={"url": url})
+        return result
+    
+    result = get_from_disk_cache(cache_key)
+    if result:
+        log.debug("Disk cache hit (%s)", device, extra={"url": url})
+        return result
+    
+    result = get_stale(cache_key)
+    if result:
+        log.debug("Serving stale cache entry (%s)", device, extra={"url": url})
+        revalidator.stale_served += 1
+        schedule_revalidation(url, options, device, result)
+        return result
+    
+    log.debug("Cache miss (%s)", device, extra={"url": url})
     return None
 
-def save_to_cache(url: str, scroll_to_bottom: bool, desktop_base64: str, mobile_base64: str, page_title: str = ""):
-    """Save screenshot to cache"""
-    cache_key = get_cache_key(url, scroll_to_bottom)
-    screenshot_cache[cache_key] = CacheEntry(desktop_base64, mobile_base64, page_title)
-    print(f"💾 Cached screenshot for {url} (total cached: {len(screenshot_cache)})")
+def get_cached_result(url: str, options: CaptureOptions) -> Optional[CaptureResult]:
+    """Every requested device from the cache, combined into one result; None if any is missing"""
+    parts = []
+    for device in options.devices:
+        result = get_from_cache(url, options, device)
+        if not result:
+            return None
+        parts.append(result)
+    return CaptureResult.combine(options.cache_key(url), parts)
+
+def stored_result(url: str, options: CaptureOptions) -> Optional[CaptureResult]:
+    """Like get_cached_result, but stale entries count and no hit or miss is recorded (serving earlier results)"""
+    parts = []
+    for device in options.devices:
+        cache_key = options.device_key(url, device)
+        result = screenshot_cache.get(cache_key, record_stats=False, allow_stale=True) \
+            or get_from_disk_cache(cache_key, allow_stale=True)
+        if not result:
+            return None
+        parts.append(result)
+    return CaptureResult.combine(options.cache_key(url), parts)
+
+def get_stale(cache_key: str) -> Optional[CaptureResult]:
+    """An expired entry still inside the stale window (CACHE_STALE_SECONDS)"""
+    if not config.CACHE_STALE_SECONDS:
+        return None
+    return screenshot_cache.get(cache_key, record_stats=False, allow_stale=True) \
+        or get_from_disk_cache(cache_key, allow_stale=True)
+
+def get_from_disk_cache(cache_key: str, allow_stale: bool = False) -> Optional[CaptureResult]:
+    """Look up the disk tier and promote a hit (file references only) into memory"""
+    if not disk_cache:
+        return None
+    try:
+        entry = disk_cache.get(cache_key, allow_stale)
+    except Exception as e:
+        log.warning("Disk cache read failed: %s", e)
+        return None
+    if not entry:
+        return None
+    result = CaptureResult.from_disk(entry)
+    # Never keep the promoted copy around longer than the disk entry itself
+    # (a stale entry is promoted as stale)
+    ttl = min(screenshot_cache.default_ttl, entry.expires_at - time.time())
+    screenshot_cache.put(cache_key, result, result.memory_size(), ttl)
+    return result
+
+def save_to_cache(url: str, result: CaptureResult, ttl: Optional[int] = None):
+    """Save one device's screenshots to cache (memory now, disk in the background)"""
+    screenshot_cache.put(result.cache_key, result, result.memory_size(), ttl)
+    log.debug("Cached screenshot", extra={"url": url, "entries": len(screenshot_cache)})
+    if disk_cache and result.images:
+        spawn(save_to_disk_cache(result, ttl))
+
+async def save_to_disk_cache(result: CaptureResult, ttl: Optional[int] = None):
+    try:
+        await asyncio.to_thread(
+            disk_cache.put,
+            result.cache_key,
+            result.images,
+            result.page_title,
+            ttl,
+            result.image_format,
+            result.validators
+        )
+    except Exception as e:
+        log.warning("Disk cache write failed: %s", e)
+
+# Stale-while-revalidate: a stale entry is served at once, then a conditional
+# request to the origin decides whether it only needs a new TTL or a recapture
+revalidator = Revalidator(DEVICE_PROFILES["desktop"].user_agent, config.REVALIDATE_TIMEOUT_SECONDS)
+revalidating: set = set()  # Device cache keys with a refresh under way
+# URL + options (devices aside) -> stale devices waiting for their refresh to start
+stale_devices: Dict[str, Dict[str, CaptureResult]] = {}
+
+def schedule_revalidation(url: str, options: CaptureOptions, device: str, stale: CaptureResult):
+    """
+    Refresh a stale device entry in the background. Every device of the
+    same URL and options found stale before the refresh starts (i.e. in the
+    same request) is refreshed with it: one check, one recapture job.
+    """
+    if stale.cache_key in revalidating:
+        return
+    revalidating.add(stale.cache_key)
+    group = options.with_devices(()).cache_key(url)
+    if group not in stale_devices:
+        stale_devices[group] = {}
+        spawn(revalidate(url, options, group))
+    stale_devices[group][device] = stale
+
+async def revalidate(url: str, options: CaptureOptions, group: str):
+    """Give unchanged devices' entries a new TTL, and recapture the others together as one prewarm job"""
+    stale = stale_devices.pop(group)
+    try:
+        # Devices loaded with the same user agent recorded the same validators: one request each
+        checks: Dict[str, List[str]] = {}
+        for device, result in stale.items():
+            checks.setdefault(json.dumps(result.validators, sort_keys=True), []).append(device)
+        
+        async def check(validators: Dict) -> bool:
+            try:
+                return await revalidator.is_unchanged(url, validators)
+            except Exception as e:
+                log.debug("Revalidation request failed: %s", e, extra={"url": url})
+                return False
+        
+        outcomes = await asyncio.gather(*(check(stale[devices[0]].validators) for devices in checks.values()))
+        unchanged = [device for devices, same in zip(checks.values(), outcomes) if same for device in devices]
+        changed = tuple(device for device in stale if device not in unchanged)
+        
+        if unchanged:
+            for device in unchanged:
+                screenshot_cache.put(stale[device].cache_key, stale[device], stale[device].memory_size())
+            if disk_cache:
+                def refresh_disk():
+                    for device in unchanged:
+                        disk_cache.refresh(stale[device].cache_key)
+                await asyncio.to_thread(refresh_disk)
+            revalidator.unchanged += len(unchanged)
+            log.info("Cache entry revalidated, page unchanged (%s)", ", ".join(unchanged), extra={"url": url})
+        if not changed:
+            return
+        
+        # Behind interactive and batch work; the capture replaces the cache entries
+        job = Job(str(uuid.uuid4()), url, options.with_devices(changed), use_cache=False, priority="prewarm",
+                  client_id="revalidation")
+        events: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(events)
+        await enqueue_job(job)
+        while (await events.get())[0] != "done":
+            pass
+        if job.status == JobStatus.COMPLETED:
+            revalidator.recaptured += len(changed)
+        else:
+            revalidator.failed += len(changed)
+    except Exception as e:
+        revalidator.failed += 1
+        log.warning("Revalidation failed: %s", e, extra={"url": url})
+    finally:
+        for result in stale.values():
+            revalidating.discard(result.cache_key)
 
 # Queue system
 class JobStatus(str, Enum):
@@ -73,147 +419,519 @@ class JobStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class Job:
-    def __init__(self, job_id: str, url: str, scroll_to_bottom: bool, use_cache: bool = True):
+    def __init__(self, job_id: str, url: str, options: CaptureOptions, use_cache: bool = True, cache_ttl: Optional[int] = None,
+                 mockup: Optional[MockupSpec] = None, priority: str = "interactive", client_id: str = ""):
         self.job_id = job_id
         self.url = url
-        self.scroll_to_bottom = scroll_to_bottom
+        self.options = options
+        self.mockup = mockup
         self.use_cache = use_cache
+        self.cache_ttl = cache_ttl
+        # Scheduling class (PRIORITIES) and the submitter that takes turns with others in it
+        self.priority = priority
+        self.client_id = client_id
         self.status = JobStatus.QUEUED
         self.queue_position = 0
-        self.result: Optional[Dict] = None
+        self.result: Optional[CaptureResult] = None
+        self.mockup_result: Optional[CaptureResult] = None
+        self.batch_id: Optional[str] = None
         self.error: Optional[str] = None
         self.created_at = datetime.now()
         self.started_at: Optional[datetime] = None
         self.completed_at: Optional[datetime] = None
+        self.seq = 0  # Assigned by the job backend's add(), orders the queue
+        # Single-flight: job whose capture this one is sharing, and jobs sharing ours
+        self.coalesced_with: Optional[str] = None
+        self.piggybacking_jobs: List[str] = []
+        # Progress pushed to /capture/events subscribers
+        self.phases: Dict[str, str] = {}
+        self.subscribers: List[asyncio.Queue] = []
+    
+    def publish(self, event: str, data: Dict):
+        """Push an event to every open /capture/events stream for this job"""
+        for queue in self.subscribers:
+            queue.put_nowait((event, data))
+    
+    def set_phase(self, viewport: str, phase: str):
+        self.phases[viewport] = phase
+        self.publish("phase", {"viewport": viewport, "phase": phase})
+    
+    async def snapshot(self) -> Dict:
+        """Status fields shared by /capture/status and the event stream"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status.value,
+            "queue_position": await jobs.position(self) if self.status == JobStatus.QUEUED else 0,
+            "phases": dict(self.phases),
+        }
+    
+    def to_record(self) -> Dict:
+        """JSON-safe state for shared job backends; results are referenced by cache key"""
+        return {
+            "job_id": self.job_id,
+            "url": self.url,
+            "options": self.options.to_dict(),
+            "use_cache": self.use_cache,
+            "cache_ttl": self.cache_ttl,
+            "mockup": self.mockup.to_dict() if self.mockup else None,
+            "priority": self.priority,
+            "client_id": self.client_id,
+            "status": self.status.value,
+            "result_key": self.result.cache_key if self.result else None,
+            "mockup_key": self.mockup_result.cache_key if self.mockup_result else None,
+            "batch_id": self.batch_id,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "coalesced_with": self.coalesced_with,
+            "piggybacking_jobs": self.piggybacking_jobs,
+            "phases": self.phases,
+        }
+    
+    @classmethod
+    def from_record(cls, record: Dict) -> "Job":
+        mockup = MockupSpec.from_dict(record["mockup"]) if record["mockup"] else None
+        job = cls(record["job_id"], record["url"], CaptureOptions.from_dict(record["options"]),
+                  record["use_cache"], record["cache_ttl"], mockup, record["priority"], record["client_id"])
+        job.batch_id = record["batch_id"]
+        job.created_at = datetime.fromisoformat(record["created_at"])
+        job.apply_record(record)
+        return job
+    
+    def apply_record(self, record: Dict):
+        """Take over the progress another process recorded for this job"""
+        self.status = JobStatus(record["status"])
+        self.error = record["error"]
+        self.started_at = datetime.fromisoformat(record["started_at"]) if record["started_at"] else None
+        self.completed_at = datetime.fromisoformat(record["completed_at"]) if record["completed_at"] else None
+        self.coalesced_with = record["coalesced_with"]
+        self.piggybacking_jobs = record["piggybacking_jobs"]
+        self.phases = record["phases"]
+        # The images themselves come from the (shared) disk cache tier
+        result_key = record["result_key"]
+        if result_key and (not self.result or self.result.cache_key != result_key):
+            self.result = stored_result(normalize_url(self.url), self.options)
+        mockup_key = record["mockup_key"]
+        if mockup_key and not self.mockup_result:
+            self.mockup_result = mockup_cache.get(mockup_key, record_stats=False)
+
+# Single-flight: an identical capture that is already running is shared, not repeated.
+# The browser work runs in its own task, so the request or job that started
+# it can be cancelled without failing the others; it is only cancelled once
+# nobody is waiting for it any more.
+class InFlightCapture:
+    def __init__(self, leader: Optional[Job] = None):
+        self.task: Optional[asyncio.Task] = None
+        self.leader = leader
+        self.followers = 0
+        self.waiting = 0
+        self.abandoned = False
+        self.phases: Dict[str, str] = {}
+        self.jobs: List[Job] = [leader] if leader else []
+    
+    def start(self, coro):
+        self.task = asyncio.create_task(coro)
+        # Mark the exception as retrieved even if nobody ended up waiting on it
+        self.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    async def wait(self, job: Optional[Job] = None) -> "CaptureResult":
+        self.waiting += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiting -= 1
+            if not self.task.done():
+                if job in self.jobs:
+                    self.jobs.remove(job)
+                if self.waiting == 0:
+                    log.info("Capture abandoned by every waiting request, stopping it")
+                    self.abandoned = True
+                    self.task.cancel()
+    
+    def report(self, viewport: str, phase: str):
+        """Progress callback for the browser work, fanned out to every sharing job"""
+        self.phases[viewport] = phase
+        for job in self.jobs:
+            job.set_phase(viewport, phase)
+
+class Deadline:
+    """Time budget of one capture, shared by page slot wait, navigation, settling, screenshots and encoding"""
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def timeout_ms(self, limit_ms: int) -> int:
+        """A Playwright timeout within the budget (0 would mean no timeout at all)"""
+        return max(1, min(limit_ms, int(self.remaining() * 1000)))
+    
+    async def run(self, awaitable):
+        future = asyncio.ensure_future(awaitable)
+        # A cancelled gather() ends with a CancelledError exception that nobody would retrieve
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            return await asyncio.wait_for(future, self.remaining())
+        except asyncio.TimeoutError:
+            raise Exception(f"Capture exceeded its {self.seconds:g}s time budget")
+
+def report_phase(progress: Optional[Callable[[str, str], None]], viewport: str, phase: str):
+    if progress:
+        progress(viewport, phase)
+
+# Jobs with an open event stream, so queue movement is pushed only where someone listens
+watched_jobs: set = set()
+
+async def broadcast_positions():
+    """Push the new queue position to every watched job still waiting"""
+    for job in list(watched_jobs):
+        if job.status == JobStatus.QUEUED:
+            job.publish("position", {"queue_position": await jobs.position(job)})
+
+async def publish_remote_change(job: Job, previous_status: str):
+    """Forward progress of a job run by another process to its local subscribers"""
+    if job.status in FINISHED_STATUSES:
+        job.publish("done", await job_final_event(job))
+    elif job.status.value != previous_status:
+        job.publish("status", await job.snapshot())
+    elif job.status == JobStatus.QUEUED:
+        job.publish("position", {"queue_position": await jobs.position(job)})
+
+# Device cache key -> the running capture taking it (one capture covers all the devices it takes)
+inflight_captures: Dict[str, InFlightCapture] = {}
+coalesced_total = 0
+
+def captures_in_flight() -> int:
+    return len({id(inflight) for inflight in inflight_captures.values()})
+
+def create_job_backend() -> JobBackend:
+    """Jobs and queue: this process only, or shared through SQLite (see job_backend.py)"""
+    if config.STATE_BACKEND == "sqlite":
+        if not disk_cache:
+            # Other processes could not read the results
+            log.warning("STATE_BACKEND=sqlite needs the disk cache tier, using memory")
+        else:
+            try:
+                return SQLiteJobBackend(
+                    config.STATE_DB_PATH,
+                    config.JOB_RETENTION_SECONDS,
+                    config.JOB_LEASE_SECONDS,
+                    Job,
+                    publish_remote_change,
+                    # Cancel requests for jobs this process runs (DELETE on another process)
+                    lambda job: cancel_running_job(job)
+                )
+            except Exception as e:
+                log.warning("SQLite job backend disabled: %s", e)
+    # Jobs are indexed for O(log n) queue positions and forgotten
+    # JOB_RETENTION_SECONDS after they finish
+    return MemoryJobBackend(config.JOB_RETENTION_SECONDS)
 
 # Global job storage and queue
-job_queue: asyncio.Queue = asyncio.Queue()
-jobs: Dict[str, Job] = {}
-queue_worker_task: Optional[asyncio.Task] = None
+jobs = create_job_backend()
+queue_worker_tasks: List[asyncio.Task] = []
 
-async def queue_worker():
-    """Background worker that processes jobs from the queue"""
-    global browser, jobs
+# Capture concurrency limits - every entry point (/capture, /screenshot and the
+# queue workers) takes a slot here before opening a Chromium page
+capture_semaphore = asyncio.Semaphore(max(1, config.CAPTURE_MAX_PAGES))
+viewport_semaphores: Dict[str, asyncio.Semaphore] = {
+    "desktop": asyncio.Semaphore(max(1, config.CAPTURE_MAX_DESKTOP_PAGES)),
+    "mobile": asyncio.Semaphore(max(1, config.CAPTURE_MAX_MOBILE_PAGES)),
+}
+pages_in_flight: Dict[str, int] = {"desktop": 0, "mobile": 0}
+
+@asynccontextmanager
+async def capture_slot(viewport: str):
+    """Hold a page slot for one viewport (per-viewport limit, then global limit)"""
+    async with viewport_semaphores[viewport]:
+        async with capture_semaphore:
+            pages_in_flight[viewport] += 1
+            try:
+                yield
+            finally:
+                pages_in_flight[viewport] -= 1
+
+async def run_job(job: Job):
+    """Run a job to completion and record its result or error"""
+    job.status = JobStatus.PROCESSING
+    job.started_at = datetime.now()
+    await jobs.started(job)
+    job.publish("status", await job.snapshot())
+    log.info("Processing job", extra={"job_id": job.job_id, "url": job.url})
+    
+    try:
+        # Process the capture
+        result = await process_capture(job.url, job.options, job.use_cache, job, job.cache_ttl)
+        
+        if job.mockup:
+            job.set_phase("mockup", "compositing")
+            job.mockup_result = await build_mockup(job.url, result, job.mockup)
+        
+        # Other processes read the images from disk, so they must be there first
+        if jobs.shared and result.images:
+            await save_to_disk_cache(result, job.cache_ttl)
+        
+        # Store result
+        job.result = result
+        job.status = JobStatus.COMPLETED
+        job.completed_at = datetime.now()
+        log.info("Job completed", extra={"job_id": job.job_id})
+        
+    except asyncio.CancelledError:
+        # DELETE /capture/{job_id}; a capture shared with other jobs keeps running for them
+        job.status = JobStatus.CANCELLED
+        job.completed_at = datetime.now()
+        log.info("Job cancelled", extra={"job_id": job.job_id})
+        raise
     
-    print("🔄 Queue worker started")
+    except Exception as e:
+        job.status = JobStatus.FAILED
+        job.error = str(e)
+        job.completed_at = datetime.now()
+        log.warning("Job failed: %s", e, extra={"job_id": job.job_id})
+    
+    finally:
+        await record_job_end(job)
+
+async def record_job_end(job: Job):
+    try:
+        await jobs.finish(job)
+    except Exception as e:
+        log.error("Could not record the end of job: %s", e, extra={"job_id": job.job_id})
+    metrics.JOBS_FINISHED.labels(job.status.value).inc()
+    job.publish("done", await job_final_event(job))
+    await broadcast_positions()
+
+# Jobs being run by this process, so DELETE /capture/{job_id} can cancel them
+running_jobs: Dict[str, asyncio.Task] = {}
+
+def start_job(job: Job) -> asyncio.Task:
+    task = spawn(run_job(job))
+    running_jobs[job.job_id] = task
+    task.add_done_callback(lambda _: running_jobs.pop(job.job_id, None))
+    return task
+
+def cancel_running_job(job: Job) -> Optional[asyncio.Task]:
+    """Cancel a job this process is running (None if it runs elsewhere)"""
+    task = running_jobs.get(job.job_id)
+    if task:
+        task.cancel()
+    return task
+
+async def job_final_event(job: Job) -> Dict:
+    """Terminal event payload: result reference (URLs only) or error"""
+    data = await job.snapshot()
+    if job.status == JobStatus.COMPLETED and job.result:
+        data["result"] = job.result.to_json(f"/capture/{job.job_id}")
+    if job.mockup_result:
+        data["mockup"] = mockup_json(job.mockup_result)
+    if job.status == JobStatus.FAILED and job.error:
+        data["error"] = job.error
+    return data
+
+# How long queued jobs waited for a worker, per priority class (jobs that
+# skipped the queue are not counted); the recent window feeds /pool/stats
+queue_waits: Dict[str, Dict] = {
+    priority: {"jobs": 0, "recent": deque(maxlen=256)} for priority in PRIORITIES
+}
+
+def record_queue_wait(job: Job):
+    wait = max(0.0, (datetime.now() - job.created_at).total_seconds())
+    metrics.QUEUE_WAIT_SECONDS.labels(job.priority).observe(wait)
+    waits = queue_waits.setdefault(job.priority, {"jobs": 0, "recent": deque(maxlen=256)})
+    waits["jobs"] += 1
+    waits["recent"].append(wait)
+
+def queue_wait_stats() -> Dict:
+    stats = {}
+    for priority, waits in queue_waits.items():
+        recent: Deque[float] = waits["recent"]
+        ordered = sorted(recent)
+        stats[priority] = {
+            "jobs": waits["jobs"],
+            "recent_avg_ms": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+            "recent_p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1) if ordered else 0.0,
+            "recent_max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+        }
+    return stats
+
+async def queue_worker(worker_id: int = 0):
+    """Background worker that processes jobs from the queue"""
+    log.debug("Queue worker %d started", worker_id)
     
     while True:
         try:
             # Get next job from queue
-            job = await job_queue.get()
+            job = await jobs.next_job()
             
             if job is None:  # Shutdown signal
                 break
             
-            # Update job status
-            job.status = JobStatus.PROCESSING
-            job.started_at = datetime.now()
-            print(f"🔄 Processing job {job.job_id} for {job.url}")
-            
-            try:
-                # Process the capture
-                result = await process_capture(job.url, job.scroll_to_bottom, job.use_cache)
-                
-                # Store result
-                job.result = result
-                job.status = JobStatus.COMPLETED
-                job.completed_at = datetime.now()
-                print(f"✅ Job {job.job_id} completed successfully")
-                
-            except Exception as e:
-                job.status = JobStatus.FAILED
-                job.error = str(e)
-                job.completed_at = datetime.now()
-                print(f"❌ Job {job.job_id} failed: {e}")
-            
-            finally:
-                job_queue.task_done()
+            log.debug("Worker %d picked up job", worker_id, extra={"job_id": job.job_id})
+            record_queue_wait(job)
+            # A cancelled job ends its own task, not the worker
+            await asyncio.wait({start_job(job)})
                 
         except Exception as e:
-            print(f"❌ Queue worker error: {e}")
+            log.exception("Queue worker error: %s", e)
 
 async def cache_cleanup_worker():
-    """Background worker that cleans up expired cache entries every 30 minutes"""
-    global screenshot_cache
-    
-    print("🧹 Cache cleanup worker started")
+    """Background worker that expires cache entries (heap pops only, no full scan)"""
+    log.debug("Cache cleanup worker started")
     
     while True:
         try:
-            await asyncio.sleep(1800)  # 30 minutes
-            
-            # Remove expired entries
-            expired_keys = [
-                key for key, entry in screenshot_cache.items()
-                if entry.is_expired()
-            ]
-            
-            for key in expired_keys:
-                del screenshot_cache[key]
+            await asyncio.sleep(60)
             
-            if expired_keys:
-                print(f"🗑️  Cleaned up {len(expired_keys)} expired cache entries")
+            expired = screenshot_cache.purge_expired()
+            if expired:
+                log.info("Cleaned up %d expired cache entries", expired)
             
-            print(f"💾 Cache status: {len(screenshot_cache)} entries active")
+            evicted_jobs = await jobs.purge_expired()
+            if evicted_jobs:
+                log.info("Forgot %d finished jobs", evicted_jobs)
+
+            if shared_resource_cache:
+                shared_resource_cache.store.purge_expired()
+            mockup_cache.purge_expired()
+
+            if disk_cache:
+                disk_expired = await asyncio.to_thread(disk_cache.purge_expired)
+                if disk_expired:
+                    log.info("Cleaned up %d expired disk cache entries", disk_expired)
             
         except Exception as e:
-            print(f"❌ Cache cleanup error: {e}")
+            log.exception("Cache cleanup error: %s", e)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage browser lifecycle - start on app startup, close on shutdown"""
-    global playwright_instance, browser, queue_worker_task
-    
-    print("🚀 Starting browser instance (will be reused for all requests)...")
-    playwright_instance = await async_playwright().start()
-    browser = await playwright_instance.chromium.launch(
-        headless=True,
-        args=[
-            "--no-sandbox",                # Essential for Docker
-            "--disable-dev-shm-usage",     # SAVES MEMORY (Critical for Free Tier)
-            "--disable-gpu",               # Saves CPU
-        ]
-    )
-    print("✅ Browser instance ready and will stay running!")
+    log.info("Starting %d browser instance(s)", browsers.size)
+    # Launches every instance and pre-warms its contexts in the background:
+    # / answers right away, /ready once a browser takes pages, and captures
+    # submitted in between wait for it
+    browsers.start_background(start_playwright)
+    image_pipeline.start()
+    mockup_renderer.start()
+    jobs.start()
     
-    # Start queue worker
-    queue_worker_task = asyncio.create_task(queue_worker())
-    print("✅ Queue worker started")
+    # Start queue workers
+    for worker_id in range(max(1, config.QUEUE_WORKERS)):
+        queue_worker_tasks.append(asyncio.create_task(queue_worker(worker_id)))
+    log.info("%d queue worker(s) started", len(queue_worker_tasks))
     
     # Start cache cleanup worker
     cache_cleanup_task = asyncio.create_task(cache_cleanup_worker())
-    print("✅ Cache cleanup worker started")
     
     yield  # App runs here
     
     # Cleanup on shutdown
-    print("🛑 Shutting down...")
+    log.info("Shutting down")
     
-    # Stop queue worker
-    if queue_worker_task:
-        await job_queue.put(None)  # Signal shutdown
-        await queue_worker_task
+    # Stop queue workers (they finish the job they are running)
+    await jobs.stop_workers(len(queue_worker_tasks))
+    await asyncio.gather(*queue_worker_tasks)
+    queue_worker_tasks.clear()
+    await jobs.close()
     
-    # Close browser
-    if browser:
-        await browser.close()
+    # Close pooled contexts, then the browsers
+    await browsers.close()
+    image_pipeline.shutdown()
+    mockup_renderer.shutdown()
     if playwright_instance:
         await playwright_instance.stop()
-    print("✅ Browser instance closed")
+    log.info("Browser instances closed")
 
 app = FastAPI(lifespan=lifespan)
 
-class CaptureRequest(BaseModel):
+# Request interception profiles, see request_blocking.py
+BlockProfile = Literal["none", "trackers", "aggressive"]
+ImageFormat = Literal["jpeg", "webp", "avif", "png"]
+# Queue scheduling classes, highest first (job_backend.PRIORITIES)
+Priority = Literal["interactive", "batch", "prewarm"]
+PreviewWidth = Annotated[int, Field(ge=16, le=4096)]
+
+# Output fields (devices and image format) shared by the capture request models
+class OutputRequest(BaseModel):
+    # Device profiles to capture, see GET /devices; each is cached on its own
+    devices: List[str] = Field(default_factory=lambda: list(DEFAULT_DEVICES), min_length=1, max_length=config.CAPTURE_MAX_DEVICES)
+    format: ImageFormat = "jpeg"
+    quality: Optional[int] = Field(None, ge=1, le=100)  # Defaults to 85; starting point when target_kb is set
+    target_kb: Optional[int] = Field(None, gt=0)  # Byte budget per full-size image (lossy formats)
+    previews: List[PreviewWidth] = Field(default_factory=list, max_length=4)  # Extra downscaled widths in pixels
+
+    @field_validator("format")
+    @classmethod
+    def check_format(cls, value: str) -> str:
+        if value not in supported_formats():
+            raise ValueError(f"{value} output is not supported by this server")
+        return value
+    
+    @field_validator("devices")
+    @classmethod
+    def check_devices(cls, value: List[str]) -> List[str]:
+        for name in value:
+            if name not in DEVICE_PROFILES:
+                raise ValueError(f"Unknown device {name!r} (available: {', '.join(DEVICE_PROFILES)})")
+        return list(dict.fromkeys(value))
+
+class CaptureRequest(OutputRequest):
+    url: str
+    scroll_to_bottom: bool = True
+    use_cache: bool = True
+    cache_ttl_seconds: Optional[int] = None  # Defaults to MEMORY_CACHE_TTL_SECONDS
+    block_profile: BlockProfile = config.DEFAULT_BLOCK_PROFILE
+
+class QueueJobRequest(OutputRequest):
     url: str
     scroll_to_bottom: bool = True
     use_cache: bool = True
+    cache_ttl_seconds: Optional[int] = None  # Defaults to MEMORY_CACHE_TTL_SECONDS
+    block_profile: BlockProfile = config.DEFAULT_BLOCK_PROFILE
+    priority: Priority = "interactive"
+
+# Editor settings of App.jsx; unset fields use the editor defaults
+class MockupCustomization(BaseModel):
+    bg_color: Optional[str] = None
+    bg_color2: Optional[str] = None
+    use_gradient: Optional[bool] = None
+    gradient_direction: Optional[Literal[
+        "to right", "to left", "to bottom", "to top",
+        "to bottom right", "to bottom left", "to top right", "to top left"
+    ]] = None
+    text_color: Optional[str] = None
+    font_family: Optional[str] = None  # Only fonts bundled with the templates; others fall back to Aeonik
+    enable_shadow: Optional[bool] = None
+    enable_mockups: Optional[bool] = None
+    texts: Optional[Dict[str, str]] = None  # Element id -> text; title/subtitle default to page title/URL
 
-class QueueJobRequest(BaseModel):
+class MockupOptions(BaseModel):
+    template: str = "desktop-mobile"
+    customization: MockupCustomization = Field(default_factory=MockupCustomization)
+    format: Literal["jpeg", "png", "webp"] = "jpeg"
+    quality: int = Field(90, ge=1, le=100)
+
+class MockupRequest(MockupOptions):
     url: str
     scroll_to_bottom: bool = True
     use_cache: bool = True
+    cache_ttl_seconds: Optional[int] = None  # Defaults to MEMORY_CACHE_TTL_SECONDS
+    block_profile: BlockProfile = config.DEFAULT_BLOCK_PROFILE
+    priority: Priority = "interactive"  # /mockup/queue only
+
+class BatchRequest(OutputRequest):
+    urls: List[str] = Field(min_length=1, max_length=config.BATCH_MAX_URLS)
+    scroll_to_bottom: bool = True
+    use_cache: bool = True
+    cache_ttl_seconds: Optional[int] = None  # Defaults to MEMORY_CACHE_TTL_SECONDS
+    block_profile: BlockProfile = config.DEFAULT_BLOCK_PROFILE
+    mockup: Optional[MockupOptions] = None  # Also render this mockup for every URL
+    priority: Priority = "batch"
 
 # --- HEALTH CHECK (Required for Render) ---
 # Render pings the root URL to check if the app is alive.
@@ -221,33 +939,94 @@ class QueueJobRequest(BaseModel):
 def read_root():
     return {"status": "Active", "engine": "Chromium"}
 
+# Readiness: 503 while Chromium is starting (or every instance is down)
+@app.get("/ready")
+def readiness():
+    stats = browsers.stats()
+    body = {
+        "status": "ready" if browsers.is_ready() else "starting" if browsers.booting else "unavailable",
+        "browsers_ready": stats["ready"],
+        "browsers": stats["instances"],
+        "time_to_first_ready_ms": stats["time_to_first_ready_ms"],
+        "time_to_ready_ms": stats["time_to_ready_ms"],
+    }
+    if stats["boot_error"]:
+        body["error"] = stats["boot_error"]
+    return JSONResponse(body, status_code=200 if browsers.is_ready() else 503)
+
 @app.get("/cache/stats")
 def cache_stats():
-    """Get cache statistics"""
-    active_entries = 0
-    expired_entries = 0
-    
-    for entry in screenshot_cache.values():
-        if entry.is_expired():
-            expired_entries += 1
-        else:
-            active_entries += 1
-    
+    """Get cache statistics for both tiers"""
     return {
         "total_entries": len(screenshot_cache),
-        "active_entries": active_entries,
-        "expired_entries": expired_entries,
-        "cache_duration_hours": 1
+        "memory": screenshot_cache.stats(),
+        "disk": disk_cache.stats() if disk_cache else {"enabled": False},
+        "mockups": mockup_cache.stats(),
+        "resources": shared_resource_cache.stats() if shared_resource_cache else
+                     {"mode": config.RESOURCE_CACHE_MODE, **job_resource_budget.stats()},
+        "inflight_captures": captures_in_flight(),
+        "coalesced_requests": coalesced_total,
+        "revalidation": {**revalidator.stats(), "in_progress": len(revalidating)}
+    }
+
+@app.get("/pool/stats")
+async def pool_stats():
+    """Get browser instance, context pool and concurrency statistics"""
+    job_stats = await jobs.stats()
+    return {
+        "browsers": browsers.stats(),
+        "limits": {
+            "queue_workers": len(queue_worker_tasks),
+            "max_pages": config.CAPTURE_MAX_PAGES,
+            "max_desktop_pages": config.CAPTURE_MAX_DESKTOP_PAGES,
+            "max_mobile_pages": config.CAPTURE_MAX_MOBILE_PAGES,
+            "pages_in_flight": dict(pages_in_flight),
+            "queued_jobs": sum(job_stats["queued_by_priority"].values())
+        },
+        "jobs": job_stats,
+        "devices": {
+            "emulation": config.DEVICE_EMULATION
+        },
+        "queue_wait": queue_wait_stats(),
+        "images": image_pipeline.stats(),
+        "mockups": mockup_renderer.stats()
+    }
+
+@app.get("/devices")
+def list_devices():
+    """Device profiles a capture can ask for (the "devices" field), and the default set"""
+    return {
+        "default": list(DEFAULT_DEVICES),
+        "max_per_request": config.CAPTURE_MAX_DEVICES,
+        "devices": {name: profile.to_json() for name, profile in DEVICE_PROFILES.items()}
+    }
+
+def metric_sources() -> Dict:
+    return {
+        "caches": {"memory": screenshot_cache, "disk": disk_cache, "mockup": mockup_cache},
+        "revalidator": revalidator,
+        "browsers": browsers,
+        "pages_in_flight": pages_in_flight,
+        "queued_jobs": jobs.queued_count,
+        "active_jobs": jobs.active_count,
+        "captures_in_flight": captures_in_flight,
     }
 
+metrics.register_stats(metric_sources)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of latency histograms, counters and gauges"""
+    return Response(content=metrics.render(), headers={"Content-Type": metrics.content_type()})
+
 @app.delete("/cache/clear")
 def clear_cache():
     """Clear all cache entries"""
-    global screenshot_cache
-    count = len(screenshot_cache)
-    screenshot_cache.clear()
+    count = screenshot_cache.clear()
+    disk_count = disk_cache.clear() if disk_cache else 0
+    mockup_cache.clear()
     return {
-        "message": f"Cleared {count} cache entries",
+        "message": f"Cleared {count} cache entries ({disk_count} on disk)",
         "remaining_entries": len(screenshot_cache)
     }
 
@@ -260,297 +1039,815 @@ app.add_middleware(
 )
 
 # --- HELPER: SCROLL TRIGGER ---
-# This scrolls down the page to force lazy-loaded images and animations to appear
-async def scroll_to_percentage(page: Page, percentage: float = 0.5):
-    """Scroll to a percentage of the page height to load content"""
-    print(f"   -> Scrolling to {int(percentage * 100)}% of page...")
-    
-    # Get total page height
-    total_height = await page.evaluate("document.body.scrollHeight")
-    target_height = int(total_height * percentage)
-    
-    # Scroll in chunks to trigger lazy-loading
-    current_pos = 0
-    scroll_step = 500
-    
-    while current_pos < target_height:
-        await page.evaluate(f"window.scrollTo(0, {current_pos})")
-        await asyncio.sleep(0.1)  # Reduced from 0.2 to 0.1
-        current_pos += scroll_step
-    
-    # Scroll back to top for screenshot
-    print("   -> Scrolling back to top...")
-    await page.evaluate("window.scrollTo(0, 0)")
-    
-    # Reduced wait time for stability
-    await asyncio.sleep(0.5)  # Reduced from 1.0 to 0.5
-
-async def capture_desktop(url: str, scroll_to_bottom: bool) -> tuple[bytes, str, str]:
-    """Capture desktop screenshot and extract page title"""
-    print("🖥️  Creating desktop context...")
-    desktop_context = await browser.new_context(
-        viewport={"width": 1920, "height": 1080},
-        device_scale_factor=1,
-        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+# This scrolls down the page to force lazy-loaded images and animations to appear,
+# moving on as soon as each step's content has loaded (see settle.py)
+async def scroll_to_percentage(page: Page, percentage: float = 0.5, tracker: Optional[NetworkTracker] = None,
+                               budget_ms: int = config.SETTLE_MAX_MS) -> Dict:
+    """Scroll to a percentage of the page height to load content, then settle at the top"""
+    log.debug("Scrolling to %d%% of page", int(percentage * 100))
+    timings = await scroll_and_settle(
+        page, tracker, percentage,
+        budget_ms, config.SETTLE_QUIET_MS, config.SETTLE_STEP_MAX_MS
     )
+    log.debug("Settled in %.0fms", timings.get("scroll_ms", 0) + timings.get("settle_ms", 0))
+    return timings
+
+async def wait_for_settle(page: Page, tracker: Optional[NetworkTracker] = None,
+                          budget_ms: int = config.SETTLE_MAX_MS) -> Dict:
+    """Wait (without scrolling) until the page is visually stable"""
+    return await settle_page(page, tracker, budget_ms, config.SETTLE_QUIET_MS)
+
+def settle_budget_ms(deadline: Optional[Deadline]) -> int:
+    """SETTLE_MAX_MS, but never more than half of what is left of the capture budget"""
+    if not deadline:
+        return config.SETTLE_MAX_MS
+    return min(config.SETTLE_MAX_MS, int(deadline.remaining() * 500))
+
+async def capture_region(page: Page, width: int, height: int, output: OutputOptions) -> Screenshot:
+    """Screenshot of the top of a page, in strips when it is taller than CAPTURE_TILE_HEIGHT"""
+    return await screenshot_region(
+        page, width, height, output.screenshot_args(),
+        config.CAPTURE_TILE_HEIGHT, min(config.CAPTURE_MAX_HEIGHT, max_height(output.image_format))
+    )
+
+async def capture_page(url: str, options: CaptureOptions, profiles: List[DeviceProfile],
+                       progress: Optional[Callable[[str, str], None]] = None,
+                       resources: Optional[ResourceCache] = None,
+                       deadline: Optional[Deadline] = None) -> Tuple[str, Dict, Dict[str, Tuple[Screenshot, Dict]]]:
+    """
+    Load the page once as profiles[0] and screenshot it, then switch the
+    loaded page to each further profile (Emulation.setDeviceMetricsOverride),
+    scroll back to the top, let the responsive layout settle and screenshot
+    again. The profiles must share a user agent (see navigation_groups).
     
-    await desktop_context.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined
-        });
-    """)
-    
-    try:
-        desktop_page = await desktop_context.new_page()
-        print(f"🌐 Navigating to {url} (desktop)...")
-        await desktop_page.goto(url, wait_until="domcontentloaded", timeout=60000)
+    Returns the page title, the document validators, and screenshot and
+    metadata by device.
+    """
+    primary = profiles[0]
+    log.debug("Checking out %s context", primary.pool)
+    timer = metrics.PhaseTimer()
+    async with capture_slot(primary.pool), browsers.checkout(primary.pool) as context:
+        timer.lap("wait")
+        page = await context.new_page()
+        cdp = None
+        if len(profiles) > 1 or not primary.emulates(POOL_PROFILES[primary.pool]):
+            cdp = await context.new_cdp_session(page)
+            await primary.apply(cdp)
+        tracker = NetworkTracker(page)
+        # Route handlers run newest first: the blocker decides before the cache is consulted
+        resource_session = await resources.attach(page) if resources else None
+        blocker = RequestBlocker(options.block_profile)
+        await blocker.install(page)
+        report_phase(progress, primary.name, "navigating")
+        log.debug("Navigating (%s)", primary.name, extra={"url": url})
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=deadline.timeout_ms(60000) if deadline else 60000)
+        timer.lap("goto")
+        validators = await document_validators(response)
         
         # Extract page title
-        page_title = await desktop_page.title()
-        print(f"📝 Page title: {page_title}")
+        page_title = await page.title()
+        log.debug("Page title: %s", page_title)
         
-        if scroll_to_bottom:
-            await scroll_to_percentage(desktop_page, 0.5)  # Scroll to 50%
-        else:
-            await asyncio.sleep(0.5)  # Reduced from 2 to 0.5
-        
-        # Get page height and calculate 50% clip
-        page_height = await desktop_page.evaluate("document.documentElement.scrollHeight")
-        clip_height = int(page_height * 0.5)
+        image, metadata = await screenshot_device(page, primary, options, tracker, timer, progress, deadline)
+        metadata["blocking"] = blocker.stats()
+        if resource_session:
+            metadata["resource_cache"] = resource_session.stats()
+        shots = {primary.name: (image, metadata)}
         
-        # Ensure minimum height for desktop
-        clip_height = max(clip_height, 1080)  # At least viewport height
+        for profile in profiles[1:]:
+            timer = metrics.PhaseTimer()
+            log.debug("Switching page to %s", profile.name, extra={"url": url})
+            await profile.apply(cdp)
+            # Lazy content is loaded again for the new viewport from the top,
+            # and the screenshot must not start where the last profile left off
+            await page.evaluate("window.scrollTo(0, 0)")
+            timer.lap("emulate")
+            image, metadata = await screenshot_device(page, profile, options, tracker, timer, progress, deadline)
+            metadata["emulated_from"] = primary.name
+            shots[profile.name] = (image, metadata)
         
-        print(f"📷 Taking desktop screenshot (first 50%: {clip_height}px of {page_height}px)...")
-        desktop_bytes = await desktop_page.screenshot(
-            type="jpeg",
-            quality=85,
-            clip={"x": 0, "y": 0, "width": 1920, "height": min(clip_height, page_height)},
-        )
-        print(f"   ✅ Desktop screenshot captured: {len(desktop_bytes)} bytes")
-        
-        return desktop_bytes, base64.b64encode(desktop_bytes).decode('utf-8'), page_title
-    finally:
-        await desktop_context.close()
-
-async def capture_mobile(url: str, scroll_to_bottom: bool) -> tuple[bytes, str]:
-    """Capture mobile screenshot"""
-    print("📱 Creating mobile context...")
-    mobile_context = await browser.new_context(
-        viewport={"width": 390, "height": 844},
-        device_scale_factor=3,
-        user_agent="Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1",
-        has_touch=True,
-        is_mobile=True
-    )
+        return page_title, validators, shots
+
+async def screenshot_device(page: Page, profile: DeviceProfile, options: CaptureOptions, tracker: NetworkTracker,
+                            timer: metrics.PhaseTimer, progress: Optional[Callable[[str, str], None]] = None,
+                            deadline: Optional[Deadline] = None) -> Tuple[Screenshot, Dict]:
+    """Settle the page as it is laid out for profile and screenshot its first half (at least one viewport)"""
+    report_phase(progress, profile.name, "scrolling" if options.scroll_to_bottom else "settling")
+    if options.scroll_to_bottom:
+        settle_timings = await scroll_to_percentage(page, 0.5, tracker, settle_budget_ms(deadline))  # Scroll to 50%
+    else:
+        settle_timings = await wait_for_settle(page, tracker, settle_budget_ms(deadline))
+    timer.lap("settle")
     
-    await mobile_context.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined
-        });
-    """)
+    # Get page height and calculate 50% clip
+    page_height = await page.evaluate("document.documentElement.scrollHeight")
+    clip_height = int(page_height * 0.5)
     
-    try:
-        mobile_page = await mobile_context.new_page()
-        print(f"🌐 Navigating to {url} (mobile)...")
-        await mobile_page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        
-        if scroll_to_bottom:
-            await scroll_to_percentage(mobile_page, 0.5)  # Scroll to 50%
-        else:
-            await asyncio.sleep(0.5)  # Reduced from 2 to 0.5
-        
-        # Get page height and calculate 50% clip
-        page_height = await mobile_page.evaluate("document.documentElement.scrollHeight")
-        clip_height = int(page_height * 0.5)
+    # Ensure minimum height: at least the viewport
+    clip_height = max(clip_height, profile.height)
+    
+    report_phase(progress, profile.name, "screenshotting")
+    log.debug("Taking %s screenshot (first 50%%: %dpx of %dpx)", profile.name, clip_height, page_height)
+    image = await capture_region(page, profile.width, min(clip_height, page_height), options.output)
+    timer.lap("screenshot")
+    log.debug("%s screenshot captured: %d bytes", profile.name, raw_size(image))
+    
+    metadata = {"settle": settle_timings, "timings": timer.finish()}
+    if isinstance(image, list):
+        metadata["strips"] = len(image)
+    return image, metadata
+
+def navigation_groups(profiles: List[DeviceProfile]) -> List[List[DeviceProfile]]:
+    """
+    Profiles that share a page load: those with the same user agent, or
+    none if DEVICE_EMULATION is off. Sites that pick their document by
+    User-Agent rarely say so (Vary), and switching the user agent after
+    the load would leave e.g. a mobile screenshot of the desktop document.
+    """
+    if not config.DEVICE_EMULATION:
+        return [[profile] for profile in profiles]
+    groups: Dict[str, List[DeviceProfile]] = {}
+    for profile in profiles:
+        groups.setdefault(profile.user_agent, []).append(profile)
+    return list(groups.values())
+ 
+
+async def capture_fullpage(url: str, output: OutputOptions, deadline: Deadline) -> Tuple[str, Screenshot]:
+    """Page title and full-page desktop screenshot (strips for tall pages)"""
+    # Check out a pre-warmed desktop context (reset and returned to the pool afterwards)
+    async with capture_slot("desktop"), browsers.checkout("desktop") as context:
+        page = await context.new_page()
+        tracker = NetworkTracker(page)
+        await RequestBlocker(config.DEFAULT_BLOCK_PROFILE).install(page)
         
-        # Ensure minimum height for mobile
-        clip_height = max(clip_height, 844)  # At least viewport height
+        log.debug("Navigating", extra={"url": url})
+        await page.goto(url, wait_until="domcontentloaded", timeout=deadline.timeout_ms(60000))
         
-        print(f"📷 Taking mobile screenshot (first 50%: {clip_height}px of {page_height}px)...")
-        mobile_bytes = await mobile_page.screenshot(
-            type="jpeg",
-            quality=85,
-            clip={"x": 0, "y": 0, "width": 390, "height": min(clip_height, page_height)},
-        )
-        print(f"   ✅ Mobile screenshot captured: {len(mobile_bytes)} bytes")
+        # --- EXECUTE THE SCROLL ---
+        await scroll_to_percentage(page, 0.5, tracker, settle_budget_ms(deadline))
         
-        return mobile_bytes, base64.b64encode(mobile_bytes).decode('utf-8')
-    finally:
-        await mobile_context.close()
- 
+        page_title = await page.title()
+        page_height = await page.evaluate("document.documentElement.scrollHeight")
+        log.debug("Taking full-page screenshot (%dpx)", page_height)
+        return page_title, await capture_region(page, 1920, page_height, output)
 
 @app.get("/screenshot")
-async def screenshot(url: str):
-    print(f"📸 Received request for: {url}")
-
-    if not url.startswith("http"):
-        url = f"https://{url}"
+async def screenshot(url: str, request: Request, use_cache: bool = True):
+    """Full-page desktop JPEG; tall pages are captured in strips and streamed while they are stitched"""
+    log.info("Screenshot request", extra={"url": url})
+    url = normalize_url(url)
+    
+    # Memory tier only: the disk tier stores desktop/mobile pairs
+    cache_key = get_cache_key(url, True, config.DEFAULT_BLOCK_PROFILE, "fullpage")
+    if use_cache:
+        cached = screenshot_cache.get(cache_key)
+        if cached:
+            return image_response(request, cached, "fullpage", "public, max-age=3600")
 
-    # Use the global browser instance (reused, not launched each time)
-    if not browser:
+    # Use the supervised browser instances (reused, not launched each time)
+    if not browsers.started:
         raise HTTPException(status_code=503, detail="Browser not initialized")
     
-    # Create a new context for this request (lightweight, reuses browser)
-    context = await browser.new_context(
-        viewport={"width": 1920, "height": 1080},
-        device_scale_factor=1,
-        # Common User Agent to look like a real PC
-        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-
-    # --- STEALTH: Hide Automation ---
-    # This prevents websites from knowing you are a robot via the 'navigator.webdriver' flag
-    await context.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined
-        });
-    """)
-
-    page = await context.new_page()
-
+    output = OutputOptions("jpeg", 85)
+    # Same time budget and disconnect handling as /capture
+    deadline = Deadline(config.CAPTURE_TIMEOUT_SECONDS)
     try:
-        print(f"🌐 Navigating to {url}...")
-        # increased timeout to 60s for slow sites/scroll
-        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        
-        # --- EXECUTE THE SCROLL ---
-        await scroll_to_percentage(page, 0.5)
-        
-        print("📷 Taking Screenshot...")
-        image_bytes = await page.screenshot(full_page=True, type="jpeg", quality=85)
-        
-        print(f"✅ Success! Image size: {len(image_bytes)} bytes")
-        return Response(content=image_bytes, media_type="image/jpeg")
-        
+        page_title, image = await until_disconnected(request, deadline.run(capture_fullpage(url, output, deadline)))
+    except ClientDisconnected:
+        log.info("Client disconnected, screenshot abandoned", extra={"url": url})
+        return Response(status_code=499)
     except Exception as e:
-        print(f"❌ ERROR: {e}")
+        log.error("Screenshot failed: %s", e, extra={"url": url})
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Only close the context, not the browser (browser stays alive)
-        print("🧹 Cleaning up context...")
-        await context.close()
+    
+    def remember(data: bytes):
+        result = CaptureResult(cache_key, page_title, images={"fullpage": data}, image_format=output.image_format)
+        screenshot_cache.put(cache_key, result, result.memory_size())
+        return result
+    
+    if not isinstance(image, list):
+        log.info("Screenshot captured: %d bytes", len(image), extra={"url": url})
+        return image_response(request, remember(image), "fullpage", "public, max-age=3600")
+    
+    # The browser page is already released; encoding runs in the image workers
+    async def stream():
+        chunks = []
+        stitched = image_pipeline.stitch(image, output.image_format, output.quality)
+        try:
+            async for chunk in stitched:
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            log.error("Screenshot stitching failed: %s", e, extra={"url": url})
+            raise
+        finally:
+            # On a client disconnect this stops the encoder instead of leaving it to the GC
+            await stitched.aclose()
+        log.info("Screenshot captured in %d strips: %d bytes", len(image), sum(map(len, chunks)), extra={"url": url})
+        remember(b"".join(chunks))
+    
+    return StreamingResponse(stream(), media_type=content_type(output.image_format),
+                             headers={"Cache-Control": "public, max-age=3600"})
 
-async def process_capture(url: str, scroll_to_bottom: bool, use_cache: bool = True) -> Dict:
-    """Process a capture request - extracted for reuse in queue worker"""
+def normalize_url(url: str) -> str:
     if not url.startswith("http"):
         url = f"https://{url}"
+    return url
+
+async def process_capture(url: str, options: CaptureOptions, use_cache: bool = True, job: Optional[Job] = None, cache_ttl: Optional[int] = None) -> CaptureResult:
+    """
+    Process a capture request - extracted for reuse in queue worker. Every
+    device is served from its own cache entry, shared with a capture that is
+    already taking it, or captured; all devices still missing are captured
+    together.
+    """
+    url = normalize_url(url)
     
     # Check cache first if use_cache is True
+    parts: Dict[str, CaptureResult] = {}
     if use_cache:
-        cached_result = get_from_cache(url, scroll_to_bottom)
-        if cached_result:
-            return cached_result
+        for device in options.devices:
+            cached_result = get_from_cache(url, options, device)
+            if cached_result:
+                parts[device] = cached_result
     else:
-        print("⚠️  Cache disabled for this request")
+        log.debug("Cache disabled for this request", extra={"url": url})
+    
+    # Attach to identical captures that are already running
+    waits: List[InFlightCapture] = []
+    missing = []
+    for device in options.devices:
+        if device in parts:
+            continue
+        inflight = running_capture(options.device_key(url, device))
+        if not inflight:
+            missing.append(device)
+        elif inflight not in waits:
+            waits.append(inflight)
+            join_capture(inflight, job, url)
+    
+    if missing:
+        inflight = InFlightCapture(job)
+        keys = [options.device_key(url, device) for device in missing]
+        for cache_key in keys:
+            inflight_captures[cache_key] = inflight
+        inflight.start(run_capture(url, options, tuple(missing), cache_ttl, inflight.report))
+        
+        def release(_, inflight=inflight):
+            for cache_key in keys:
+                if inflight_captures.get(cache_key) is inflight:
+                    del inflight_captures[cache_key]
+        
+        inflight.task.add_done_callback(release)
+        waits.append(inflight)
     
-    if not browser:
+    for captured in await asyncio.gather(*(inflight.wait(job) for inflight in waits)):
+        for device, result in captured.items():
+            if device in options.devices and device not in parts:
+                parts[device] = result
+    return CaptureResult.combine(options.cache_key(url), [parts[device] for device in options.devices])
+
+def join_capture(inflight: InFlightCapture, job: Optional[Job], url: str):
+    """Share a running capture: progress goes to the job too, and it is counted as coalesced"""
+    global coalesced_total
+    inflight.followers += 1
+    coalesced_total += 1
+    if job and inflight.leader:
+        job.coalesced_with = job.coalesced_with or inflight.leader.job_id
+        inflight.leader.piggybacking_jobs.append(job.job_id)
+    elif job:
+        job.coalesced_with = job.coalesced_with or "direct"
+    if job:
+        inflight.jobs.append(job)
+        for viewport, phase in inflight.phases.items():
+            job.set_phase(viewport, phase)
+    log.info("Joining in-flight capture (%d waiting)", inflight.followers, extra={"url": url})
+
+def running_capture(cache_key: str) -> Optional[InFlightCapture]:
+    """The in-flight capture a new request can share (not one that is being stopped)"""
+    inflight = inflight_captures.get(cache_key)
+    return inflight if inflight and not inflight.abandoned else None
+
+async def run_capture(url: str, options: CaptureOptions, devices: Tuple[str, ...], cache_ttl: Optional[int] = None,
+                      progress: Optional[Callable[[str, str], None]] = None,
+                      deadline: Optional[Deadline] = None) -> Dict[str, CaptureResult]:
+    """Capture devices in the browser and cache each one's result, within CAPTURE_TIMEOUT_SECONDS"""
+    if not browsers.started:
         raise Exception("Browser not initialized")
+    deadline = deadline or Deadline(config.CAPTURE_TIMEOUT_SECONDS)
     
     try:
-        # ⚡ PARALLEL CAPTURE - Desktop and Mobile simultaneously
-        print("🚀 Starting parallel desktop + mobile capture...")
+        # ⚡ One page load per user agent; the loads run in parallel
+        groups = navigation_groups([DEVICE_PROFILES[device] for device in devices])
+        log.debug("Capturing %s in %d page load(s)", " + ".join(devices), len(groups), extra={"url": url})
         
-        desktop_result, mobile_result = await asyncio.gather(
-            capture_desktop(url, scroll_to_bottom),
-            capture_mobile(url, scroll_to_bottom)
-        )
-        
-        desktop_bytes, desktop_base64, page_title = desktop_result
-        mobile_bytes, mobile_base64 = mobile_result
+        # Whichever page load requests a subresource first fetches it for all of them
+        resources = shared_resource_cache or new_job_resource_cache()
+        shots: Dict[str, Tuple[Screenshot, Dict]] = {}
+        pages: Dict[str, Tuple[str, Dict]] = {}  # Device -> title and validators of the load it came from
+        try:
+            loads = await deadline.run(asyncio.gather(*(
+                capture_page(url, options, group, progress, resources, deadline) for group in groups
+            )))
+        finally:
+            if resources is not None and resources is not shared_resource_cache:
+                resources.close()
+        for page_title, validators, page_shots in loads:
+            shots.update(page_shots)
+            pages.update({device: (page_title, validators) for device in page_shots})
         
-        print(f"✅ Success! Desktop: {len(desktop_bytes)} bytes, Mobile: {len(mobile_bytes)} bytes")
-        print(f"📝 Website title: {page_title}")
+        log.info("Captured %s", ", ".join(f"{device} ({raw_size(shots[device][0])} bytes)" for device in devices),
+                 extra={"url": url, "title": pages[devices[0]][0]})
         
-        # Always save to cache (replace existing if any)
-        save_to_cache(url, scroll_to_bottom, desktop_base64, mobile_base64, page_title)
-        print(f"💾 Cache updated/replaced for {url}")
+        for device in devices:
+            report_phase(progress, device, "encoding")
+        output = options.output
+        encoded = await deadline.run(asyncio.gather(*(
+            image_pipeline.process(shots[device][0], output) for device in devices
+        )))
+        results = {}
+        for device, variants in zip(devices, encoded):
+            images, hashes = {}, {}
+            for variant, image in variants.items():
+                name = f"{device}_{variant}" if variant else device
+                images[name] = image["data"]
+                hashes[name] = image["hash"]
+            metadata = shots[device][1]
+            metadata["output"] = {
+                "format": output.image_format,
+                "quality": variants[""]["quality"],
+                "target_bytes": output.target_bytes,
+                "bytes": len(variants[""]["data"]),
+                "encode_ms": variants[""]["ms"]
+            }
+            timings = metadata["timings"]
+            timings["encode_ms"] = variants[""]["ms"]
+            timings["total_ms"] = round(timings["total_ms"] + variants[""]["ms"], 1)
+            metrics.observe_capture(device, timings)
+            
+            page_title, validators = pages[device]
+            result = CaptureResult(
+                options.device_key(url, device),
+                page_title,
+                images=images,
+                hashes=hashes,
+                metadata={device: metadata},
+                image_format=output.image_format,
+                validators=validators
+            )
+            # Always save to cache (replace existing if any)
+            save_to_cache(url, result, cache_ttl)
+            results[device] = result
         
-        # Return result with title
-        return {
-            "desktop": desktop_base64,
-            "mobile": mobile_base64,
-            "title": page_title
-        }
+        return results
         
     except Exception as e:
-        print(f"❌ Capture failed: {e}")
+        log.error("Capture failed: %s", e, extra={"url": url})
         raise
 
+def client_id(request: Request) -> str:
+    """Who a job is scheduled for: X-Client-Id, else the (proxied) caller address"""
+    client = request.headers.get("x-client-id") or request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+    if not client and request.client:
+        client = request.client.host
+    return client[:128] or "anonymous"
+
 @app.post("/capture/queue")
-async def queue_capture(request: QueueJobRequest):
+async def queue_capture(request: QueueJobRequest, http_request: Request):
     """Submit a capture job to the queue and return job ID and queue position"""
-    job_id = str(uuid.uuid4())
+    job = Job(str(uuid.uuid4()), request.url, CaptureOptions.from_request(request), request.use_cache,
+              request.cache_ttl_seconds, priority=request.priority, client_id=client_id(http_request))
+    return await submit_job(job)
+
+async def submit_job(job: Job) -> JSONResponse:
+    """Register a job and queue it, responding with its ID and queue position"""
+    queue_position = await enqueue_job(job)
+    body = {
+        "job_id": job.job_id,
+        "queue_position": queue_position,
+        "status": job.status.value
+    }
+    if job.status == JobStatus.COMPLETED:
+        body["result"] = job.result.to_json(f"/capture/{job.job_id}")
+        if job.mockup_result:
+            body["mockup"] = mockup_json(job.mockup_result)
+    return JSONResponse(body)
+
+def cached_job_result(job: Job) -> Optional[Tuple[CaptureResult, Optional[CaptureResult]]]:
+    """Capture (and mockup, if the job wants one) of a job whose devices are all cached"""
+    result = get_cached_result(normalize_url(job.url), job.options)
+    if not result:
+        return None
+    mockup = None
+    if job.mockup:
+        mockup = mockup_cache.get(job.mockup.cache_key(result.cache_key))
+        if not mockup:
+            return None
+    return result, mockup
+
+async def enqueue_job(job: Job, start_if_cached: bool = False) -> int:
+    """
+    Register a job and hand it to the queue workers. A job whose result is
+    already cached is completed on the spot. It starts right away instead
+    (queue position 0) when an identical capture is already running, or
+    with start_if_cached when its captures are cached but something else is
+    not (a mockup), i.e. no browser work is needed.
+    """
+    job_id = job.job_id
+    
+    # Cached: finished before it is registered, so it never waits behind live captures
+    in_cache = job.use_cache and await is_cached(job.url, job.options)
+    cached = cached_job_result(job) if in_cache else None
+    if cached:
+        job.result, job.mockup_result = cached
+        job.status = JobStatus.COMPLETED
+        job.started_at = job.completed_at = datetime.now()
+        await jobs.add(job)
+        await jobs.finish(job)
+        metrics.JOBS_FINISHED.labels(job.status.value).inc()
+        metrics.JOBS_FROM_CACHE.inc()
+        job.publish("done", await job_final_event(job))
+        log.info("Job completed from cache", extra={"job_id": job_id, "url": job.url})
+        return 0
     
-    # Calculate queue position (count queued and processing jobs)
-    queue_position = sum(1 for j in jobs.values() if j.status in [JobStatus.QUEUED, JobStatus.PROCESSING]) + 1
+    # An identical capture is already running: share it instead of taking a worker.
+    # Decided before add() so a shared backend never offers the job to another process.
+    url = normalize_url(job.url)
+    if (start_if_cached and in_cache) or all(running_capture(job.options.device_key(url, device))
+                                             for device in job.options.devices):
+        job.status = JobStatus.PROCESSING
     
-    # Create job
-    job = Job(job_id, request.url, request.scroll_to_bottom, request.use_cache)
+    # Queue position = active jobs including this one
+    queue_position = await jobs.add(job)
     job.queue_position = queue_position
-    jobs[job_id] = job
     
-    # Add to queue
-    await job_queue.put(job)
+    if job.status == JobStatus.PROCESSING:
+        job.queue_position = queue_position = 0
+        start_job(job)
+        log.info("Job started without queueing", extra={"job_id": job_id, "url": job.url})
+    else:
+        cache_msg = "with cache" if job.use_cache else "without cache"
+        log.info("Job queued at position %d (%s)", queue_position, cache_msg,
+                 extra={"job_id": job_id, "url": job.url, "priority": job.priority, "client": job.client_id})
+    
+    return queue_position
+
+async def is_cached(url: str, options: CaptureOptions) -> bool:
+    """
+    Whether every device is cached (stale entries count). Only peeks: hit/miss
+    counters, LRU order and disk access times are left to the real lookup.
+    """
+    url = normalize_url(url)
+    missing = [
+        cache_key for cache_key in (options.device_key(url, device) for device in options.devices)
+        if screenshot_cache.get_entry(cache_key) is None
+    ]
+    if not missing:
+        return True
+    if not disk_cache:
+        return False
+    allow_stale = bool(config.CACHE_STALE_SECONDS)
+    try:
+        return await asyncio.to_thread(lambda: all(disk_cache.contains(key, allow_stale) for key in missing))
+    except Exception as e:
+        log.warning("Disk cache read failed: %s", e)
+        return False
+
+@app.post("/capture/batch")
+async def capture_batch(request: BatchRequest, http_request: Request):
+    """
+    Queue many URLs as one unit and stream one NDJSON line per URL as soon
+    as it finishes. Repeated URLs are captured once; cached ones skip the queue.
+    """
+    options = CaptureOptions.from_request(request)
+    spec = MockupSpec.from_request(request.mockup) if request.mockup else None
+    if spec:
+        check_mockup(spec)
+        if not set(DEFAULT_DEVICES) <= set(options.devices):
+            raise HTTPException(status_code=422, detail="Mockups need the desktop and mobile devices")
+    batch_id = str(uuid.uuid4())
+    started = time.perf_counter()
+    
+    # One job per distinct URL, remembering every position it was requested at
+    indexes: Dict[str, List[int]] = {}
+    for index, url in enumerate(request.urls):
+        indexes.setdefault(normalize_url(url), []).append(index)
     
-    cache_msg = "with cache" if request.use_cache else "without cache"
-    print(f"📋 Job {job_id} queued at position {queue_position} ({cache_msg})")
+    # Subscribe before anything is queued so no "done" event can be missed
+    events: asyncio.Queue = asyncio.Queue()
+    batch_jobs: Dict[str, Job] = {}
+    client = client_id(http_request)
+    for url in indexes:
+        job = Job(str(uuid.uuid4()), url, options, request.use_cache, request.cache_ttl_seconds, spec,
+                  request.priority, client)
+        job.batch_id = batch_id
+        job.subscribers.append(events)
+        batch_jobs[job.job_id] = job
+    for job in batch_jobs.values():
+        await enqueue_job(job, start_if_cached=True)
+    log.info("Batch of %d jobs for %d URLs", len(batch_jobs), len(request.urls), extra={"batch_id": batch_id})
     
-    return JSONResponse({
-        "job_id": job_id,
-        "queue_position": queue_position,
-        "status": job.status.value
-    })
+    def line(data: Dict) -> bytes:
+        return (json.dumps(data) + "\n").encode("utf-8")
+    
+    async def stream():
+        pending = set(batch_jobs)
+        failed = cancelled = 0
+        try:
+            yield line({
+                "type": "batch",
+                "batch_id": batch_id,
+                "total": len(request.urls),
+                "jobs": [{"job_id": job.job_id, "url": job.url, "indexes": indexes[job.url]} for job in batch_jobs.values()]
+            })
+            while pending:
+                event, data = await events.get()
+                if event != "done" or data["job_id"] not in pending:
+                    continue
+                pending.discard(data["job_id"])
+                job = batch_jobs[data["job_id"]]
+                failed += job.status == JobStatus.FAILED
+                cancelled += job.status == JobStatus.CANCELLED
+                yield line({"type": "result", "url": job.url, "indexes": indexes[job.url], **data})
+            yield line({
+                "type": "done",
+                "batch_id": batch_id,
+                "completed": len(batch_jobs) - failed - cancelled,
+                "failed": failed,
+                "cancelled": cancelled,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            })
+        finally:
+            # The jobs keep running if the client goes away; only stop listening
+            for job in batch_jobs.values():
+                if events in job.subscribers:
+                    job.subscribers.remove(events)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+async def result_response(build: Callable[[Optional[str], bool], Dict], base_path: Optional[str], inline: bool) -> Response:
+    """JSON response for a result; the base64 (inline) shape is built and serialized in a worker thread"""
+    if not inline:
+        return JSONResponse(build(base_path, False))
+    body = await asyncio.to_thread(lambda: json.dumps(build(base_path, True)).encode("utf-8"))
+    return Response(content=body, media_type="application/json")
 
 @app.get("/capture/status/{job_id}")
-async def get_job_status(job_id: str):
-    """Get the status of a queued job"""
-    if job_id not in jobs:
+async def get_job_status(job_id: str, inline: bool = config.INLINE_BASE64_RESULTS):
+    """Get the status of a queued job (pass inline=true for base64 images in the result)"""
+    job = await jobs.get(job_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job = jobs[job_id]
-    
-    # Calculate current queue position
-    current_position = 0
-    if job.status == JobStatus.QUEUED:
-        # Count how many jobs are ahead (queued or processing)
-        ahead_count = sum(1 for j in jobs.values() 
-                         if j.status in [JobStatus.QUEUED, JobStatus.PROCESSING] 
-                         and j.created_at < job.created_at)
-        current_position = ahead_count + 1
-    elif job.status == JobStatus.PROCESSING:
-        current_position = 0  # Currently processing
-    
-    response = {
-        "job_id": job_id,
-        "status": job.status.value,
-        "queue_position": current_position,
-        "created_at": job.created_at.isoformat(),
-    }
+    # Queue position counts jobs ahead that are queued or processing, plus one
+    response = await job.snapshot()
+    response["created_at"] = job.created_at.isoformat()
     
     if job.started_at:
         response["started_at"] = job.started_at.isoformat()
     if job.completed_at:
         response["completed_at"] = job.completed_at.isoformat()
-    if job.status == JobStatus.COMPLETED and job.result:
-        response["result"] = job.result
     if job.status == JobStatus.FAILED and job.error:
         response["error"] = job.error
+    if job.mockup_result:
+        response["mockup"] = mockup_json(job.mockup_result)
+    if job.batch_id:
+        response["batch_id"] = job.batch_id
+    if job.coalesced_with:
+        response["coalesced_with"] = job.coalesced_with
+    if job.piggybacking_jobs:
+        response["piggybacking_jobs"] = job.piggybacking_jobs
+    if job.status == JobStatus.COMPLETED and job.result:
+        result = job.result
+        return await result_response(lambda *args: {**response, "result": result.to_json(*args)}, f"/capture/{job_id}", inline)
     
     return JSONResponse(response)
 
+@app.get("/capture/events/{job_id}")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events stream of queue position, phase changes and the final result"""
+    job = await jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    def format_event(event: str, data: Dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    async def stream():
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        watched_jobs.add(job)
+        try:
+            yield format_event("status", await job.snapshot())
+            if job.status in FINISHED_STATUSES:
+                yield format_event("done", await job_final_event(job))
+                return
+            
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(event, data)
+                if event == "done":
+                    return
+        finally:
+            job.subscribers.remove(queue)
+            if not job.subscribers:
+                watched_jobs.discard(job)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/capture")
-async def capture(request: CaptureRequest):
+async def capture(request: CaptureRequest, http_request: Request, inline: bool = config.INLINE_BASE64_RESULTS):
     """Direct capture endpoint (bypasses queue for backward compatibility)"""
     try:
-        result = await process_capture(request.url, request.scroll_to_bottom)
-        return JSONResponse(result)
+        result = await until_disconnected(http_request, process_capture(
+            request.url,
+            CaptureOptions.from_request(request),
+            request.use_cache,
+            cache_ttl=request.cache_ttl_seconds
+        ))
+        # Images are addressed by their per-device cache entries
+        return await result_response(result.to_json, None, inline)
+    except ClientDisconnected:
+        log.info("Client disconnected, capture abandoned", extra={"url": request.url})
+        return Response(status_code=499)
+    except Exception as e:
+        log.error("Capture failed: %s", e, extra={"url": request.url})
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/capture/{job_id}")
+async def cancel_job(job_id: str):
+    """Withdraw a queued job or stop a running one (a capture it shares with other jobs goes on for them)"""
+    job = await jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.value}")
+    
+    if job.status == JobStatus.QUEUED and await jobs.withdraw(job):
+        await finish_cancelled(job)
+        return {"job_id": job_id, "status": job.status.value}
+    
+    task = cancel_running_job(job)
+    if task:
+        await asyncio.wait({task})
+        # Cancelled before run_job got to record anything
+        if job.status not in FINISHED_STATUSES:
+            await finish_cancelled(job)
+        return {"job_id": job_id, "status": job.status.value}
+    
+    # Claimed by another process: it cancels the job on its next maintenance pass
+    await jobs.request_cancel(job)
+    return JSONResponse({"job_id": job_id, "status": "cancelling"}, status_code=202)
+
+async def finish_cancelled(job: Job):
+    job.status = JobStatus.CANCELLED
+    job.completed_at = datetime.now()
+    log.info("Job cancelled", extra={"job_id": job.job_id})
+    await record_job_end(job)
+
+class ClientDisconnected(Exception):
+    pass
+
+# How often a direct capture checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def until_disconnected(request: Request, awaitable):
+    """
+    Await a capture, cancelling it as soon as the HTTP client goes away so
+    its page slots are freed. Starlette only notices a disconnect when
+    asked, hence the polling.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                metrics.CAPTURES_ABANDONED.inc()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+@app.get("/capture/{job_id}/{filename}")
+async def get_job_image(job_id: str, filename: str, request: Request):
+    """Raw image of a completed job, e.g. desktop.jpg or mobile_320.webp"""
+    job = await jobs.get(job_id)
+    if not job or job.status != JobStatus.COMPLETED:
+        raise HTTPException(status_code=404, detail="Image not found")
+    name = find_image(job.result, filename)
+    return image_response(request, job.result, name, "private, max-age=3600")
+
+@app.get("/cache/{cache_key}/{filename}")
+async def get_cached_image(cache_key: str, filename: str, request: Request):
+    """Raw image addressed by cache key (memory tier, then disk tier, stale entries included)"""
+    result = screenshot_cache.get(cache_key, record_stats=False, allow_stale=True) \
+        or get_from_disk_cache(cache_key, allow_stale=True)
+    name = find_image(result, filename)
+    return image_response(request, result, name, "public, max-age=3600")
+
+def mockup_json(mockup: CaptureResult) -> Dict:
+    return {
+        "url": f"/mockup/{mockup.cache_key}/mockup.{extension(mockup.image_format)}",
+        "size": mockup.sizes["mockup"],
+        "content_type": content_type(mockup.image_format),
+        "metadata": mockup.metadata
+    }
+
+def check_mockup(spec: MockupSpec):
+    """Fail fast (before capturing) on a missing template or asset directory"""
+    if not mockup_renderer.available():
+        raise HTTPException(status_code=503, detail="Mockup templates are not available on this server")
+    try:
+        mockup_renderer.template(spec.template)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown template: {spec.template}")
+
+async def build_mockup(url: str, result: CaptureResult, spec: MockupSpec) -> CaptureResult:
+    """Composite a capture into a template, reusing an identical earlier render"""
+    mockup_key = spec.cache_key(result.cache_key)
+    cached = mockup_cache.get(mockup_key)
+    if cached:
+        return cached
+    
+    # Same text defaults as the editor: page title and URL
+    customization = dict(spec.customization)
+    customization["texts"] = {"title": result.page_title, "subtitle": normalize_url(url), **customization.get("texts", {})}
+    # Images on disk are handed over as paths so the worker reads them itself
+    screenshots = {
+        viewport: result.images.get(viewport) or result.files.get(viewport)
+        for viewport in ("desktop", "mobile")
+    }
+    rendered = await mockup_renderer.render(spec.template, screenshots, customization, spec.image_format, spec.quality)
+    log.info("Mockup rendered with %s in %.0fms", spec.template, rendered["ms"])
+    mockup = CaptureResult(
+        mockup_key,
+        result.page_title,
+        images={"mockup": rendered["data"]},
+        hashes={"mockup": rendered["hash"]},
+        metadata={"template": spec.template, "capture_key": result.cache_key, "render_ms": rendered["ms"]},
+        image_format=spec.image_format
+    )
+    mockup_cache.put(mockup_key, mockup, mockup.memory_size())
+    return mockup
+
+@app.post("/mockup")
+async def create_mockup(request: MockupRequest, http_request: Request):
+    """Capture a site (or reuse the cache) and return the finished mockup image"""
+    spec = MockupSpec.from_request(request)
+    check_mockup(spec)
+    
+    async def render() -> CaptureResult:
+        result = await process_capture(
+            request.url,
+            CaptureOptions(request.scroll_to_bottom, request.block_profile),
+            request.use_cache,
+            cache_ttl=request.cache_ttl_seconds
+        )
+        return await build_mockup(request.url, result, spec)
+    
+    try:
+        mockup = await until_disconnected(http_request, render())
+    except ClientDisconnected:
+        log.info("Client disconnected, mockup abandoned", extra={"url": request.url})
+        return Response(status_code=499)
     except Exception as e:
-        print(f"❌ ERROR: {e}")
+        log.error("Mockup failed: %s", e, extra={"url": request.url})
         raise HTTPException(status_code=500, detail=str(e))
+    response = image_response(http_request, mockup, "mockup", "public, max-age=3600")
+    response.headers["Content-Location"] = mockup_json(mockup)["url"]
+    return response
+
+@app.post("/mockup/queue")
+async def queue_mockup(request: MockupRequest, http_request: Request):
+    """Queued variant of /mockup; the finished job carries a mockup URL"""
+    spec = MockupSpec.from_request(request)
+    check_mockup(spec)
+    options = CaptureOptions(request.scroll_to_bottom, request.block_profile)
+    job = Job(str(uuid.uuid4()), request.url, options, request.use_cache, request.cache_ttl_seconds, spec,
+              request.priority, client_id(http_request))
+    return await submit_job(job)
+
+@app.get("/mockup/{mockup_key}/{filename}")
+async def get_mockup(mockup_key: str, filename: str, request: Request):
+    """A rendered mockup from the mockup cache"""
+    mockup = mockup_cache.get(mockup_key, record_stats=False)
+    find_image(mockup, filename)
+    return image_response(request, mockup, "mockup", "public, max-age=3600")
 
 # Keep old endpoint for backward compatibility
 @app.get("/screenshot-both")
-async def screenshot_both(url: str):
+async def screenshot_both(url: str, http_request: Request):
     request = CaptureRequest(url=url, scroll_to_bottom=True)
-    return await capture(request)
\ No newline at end of file
+    return await capture(request, http_request, inline=True)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import time
+import heapq
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Tuple
+
+class MemoryCacheEntry:
+    def __init__(self, value: Any, size: int, expires_at: float, seq: int):
+        self.value = value
+        self.size = size
+        self.created_at = time.time()
+        self.expires_at = expires_at
+        self.seq = seq  # Identifies the heap record that belongs to this entry
+
+class MemoryCache:
+    """
+    In-memory LRU cache bounded by total bytes.
+
+    Entries are kept in an OrderedDict (least recently used first) and
+    evicted from the front once max_bytes is exceeded. Expiry uses a
+    min-heap of (drop_at, seq, key): purge_expired() only pops records
+    that are due, so there is never a full scan. Heap records left behind
+    by overwritten or deleted entries are skipped when popped.
+
+    With stale_seconds, an entry past its TTL is kept that much longer:
+    get() no longer returns it, get(allow_stale=True) still does (for
+    stale-while-revalidate).
+    """
+    def __init__(self, max_bytes: int, default_ttl: float, stale_seconds: float = 0):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[str, MemoryCacheEntry]" = OrderedDict()
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self.bytes_used = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires_at > time.time()
+
+    def get(self, key: str, record_stats: bool = True, allow_stale: bool = False) -> Optional[Any]:
+        """Return a live (or, with allow_stale, expired but kept) value and mark it most recently used"""
+        self.purge_expired()
+        entry = self._entries.get(key)
+        if entry is None or (not allow_stale and entry.expires_at <= time.time()):
+            if record_stats:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if record_stats:
+            self.hits += 1
+        return entry.value
+
+    def get_entry(self, key: str) -> Optional[MemoryCacheEntry]:
+        """Entry metadata (age, expiry) without touching LRU order or stats"""
+        self.purge_expired()
+        return self._entries.get(key)
+
+    def put(self, key: str, value: Any, size: int, ttl: Optional[float] = None):
+        """Insert or replace a value; ttl defaults to default_ttl seconds"""
+        self._remove(key)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+
+        self._seq += 1
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        self._entries[key] = MemoryCacheEntry(value, size, expires_at, self._seq)
+        self.bytes_used += size
+        heapq.heappush(self._expiry_heap, (expires_at + self.stale_seconds, self._seq, key))
+
+        self.purge_expired()
+        while self.bytes_used > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        return self._remove(key)
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes_used -= entry.size
+        return True
+
+    def purge_expired(self) -> int:
+        """Drop every entry whose TTL (and stale window) has passed, returns how many were dropped"""
+        now = time.time()
+        purged = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.seq == seq:
+                self._remove(key)
+                self.expirations += 1
+                purged += 1
+        # Stale records pile up when entries are replaced; rebuild once they dominate
+        if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [(e.expires_at + self.stale_seconds, e.seq, k) for k, e in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+        return purged
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self._expiry_heap.clear()
+        self.bytes_used = 0
+        return count
+
+    def stats(self) -> Dict:
+        self.purge_expired()
+        lookups = self.hits + self.misses
+        return {
+            "total_entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "default_ttl_seconds": self.default_ttl,
+            "stale_seconds": self.stale_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,132 @@
+import time
+from typing import Callable, Dict, Iterable
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+# Everything served at /metrics. Event metrics (histograms, job outcomes)
+# are recorded where they happen; counters and gauges that the caches, the
+# queue and the browser supervisor already keep are read at scrape time by
+# StatsCollector instead of being counted twice on the hot path.
+REGISTRY = CollectorRegistry()
+
+# Seconds; captures range from ~100ms (cached contexts, static page) to a minute
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+CAPTURE_PHASE_SECONDS = Histogram(
+    "capture_phase_seconds",
+    "Time spent in one phase of a device capture (wait, goto, emulate, settle, screenshot, encode, total)",
+    ["viewport", "phase"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds",
+    "Time from job submission until a worker starts it, by priority class",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+CONTEXT_CREATE_SECONDS = Histogram(
+    "browser_context_create_seconds",
+    "new_context() plus init scripts for a pooled browser context",
+    ["pool"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+JOBS_FINISHED = Counter(
+    "jobs_finished",
+    "Jobs that reached a final status",
+    ["status"],
+    registry=REGISTRY,
+)
+JOBS_FROM_CACHE = Counter(
+    "jobs_served_from_cache",
+    "Queued submissions completed from the cache without a worker",
+    registry=REGISTRY,
+)
+CAPTURES_ABANDONED = Counter(
+    "captures_abandoned",
+    "Direct /capture and /mockup requests whose client disconnected before the result was ready",
+    registry=REGISTRY,
+)
+
+class PhaseTimer:
+    """Millisecond durations of consecutive phases: call lap("goto") as each one ends"""
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.timings[f"{phase}_ms"] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def finish(self) -> Dict[str, float]:
+        self.timings["total_ms"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return self.timings
+
+def observe_capture(viewport: str, timings: Dict[str, float]):
+    """Record the *_ms phase timings of one viewport capture"""
+    for phase, ms in timings.items():
+        CAPTURE_PHASE_SECONDS.labels(viewport, phase.removesuffix("_ms")).observe(ms / 1000)
+
+class StatsCollector(Collector):
+    """Counters and gauges derived from the stats objects of main.py at scrape time"""
+    def __init__(self, sources: Callable[[], Dict]):
+        self.sources = sources
+
+    def collect(self) -> Iterable:
+        sources = self.sources()
+
+        cache_hits = CounterMetricFamily("cache_hits", "Screenshot cache hits", labels=["tier"])
+        cache_misses = CounterMetricFamily("cache_misses", "Screenshot cache misses", labels=["tier"])
+        cache_evictions = CounterMetricFamily("cache_evictions", "Entries evicted to stay within the byte limit", labels=["tier"])
+        cache_bytes = GaugeMetricFamily("cache_bytes", "Bytes held by the cache tier", labels=["tier"])
+        for tier, cache in sources["caches"].items():
+            if cache is None:
+                continue
+            cache_hits.add_metric([tier], cache.hits)
+            cache_misses.add_metric([tier], cache.misses)
+            cache_evictions.add_metric([tier], cache.evictions)
+            if hasattr(cache, "bytes_used"):
+                cache_bytes.add_metric([tier], cache.bytes_used)
+        yield from (cache_hits, cache_misses, cache_evictions, cache_bytes)
+
+        revalidator = sources["revalidator"]
+        yield CounterMetricFamily("cache_stale_served", "Expired entries served while being refreshed", value=revalidator.stale_served)
+        revalidations = CounterMetricFamily("cache_revalidations", "Background refreshes of stale entries", labels=["result"])
+        revalidations.add_metric(["unchanged"], revalidator.unchanged)
+        revalidations.add_metric(["recaptured"], revalidator.recaptured)
+        revalidations.add_metric(["failed"], revalidator.failed)
+        yield revalidations
+
+        browsers = sources["browsers"]
+        yield CounterMetricFamily("browser_launches", "Chromium instances launched", value=browsers.launches)
+        yield CounterMetricFamily("browser_launch_failures", "Failed Chromium launches", value=browsers.launch_failures)
+        yield CounterMetricFamily("browser_crashes", "Chromium instances that disconnected on their own", value=browsers.crashes)
+        recycled = CounterMetricFamily("browser_recycles", "Chromium instances drained and replaced", labels=["reason"])
+        for reason, count in browsers.recycled.items():
+            recycled.add_metric([reason], count)
+        yield recycled
+        yield GaugeMetricFamily("browser_instances_ready", "Chromium instances accepting pages", value=browsers.ready_count())
+        if browsers.time_to_ready is not None:
+            yield GaugeMetricFamily("browser_time_to_ready_seconds", "Start-up until the initial launches were done and at least one instance was ready",
+                                    value=browsers.time_to_ready)
+
+        pages = GaugeMetricFamily("capture_pages_open", "Chromium pages currently open", labels=["viewport"])
+        for viewport, count in sources["pages_in_flight"].items():
+            pages.add_metric([viewport], count)
+        yield pages
+        yield GaugeMetricFamily("job_queue_depth", "Jobs waiting for a worker", value=sources["queued_jobs"]())
+        yield GaugeMetricFamily("jobs_active", "Jobs queued or processing", value=sources["active_jobs"]())
+        yield GaugeMetricFamily("captures_in_flight", "Distinct captures currently running", value=sources["captures_in_flight"]())
+
+def register_stats(sources: Callable[[], Dict]):
+    REGISTRY.register(StatsCollector(sources))
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+def content_type() -> str:
+    return CONTENT_TYPE_LATEST
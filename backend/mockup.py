@@ -0,0 +1,397 @@
+import io
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import hashlib
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+log = logging.getLogger(__name__)
+
+# Template ids are file names under templates/ (also keeps paths inside the assets dir)
+TEMPLATE_ID = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+
+MOCKUP_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Same defaults as the editor in App.jsx
+DEFAULT_CUSTOMIZATION = {
+    "bg_color": "#ffffff",
+    "bg_color2": "#8b5cf6",
+    "use_gradient": False,
+    "gradient_direction": "to bottom right",
+    "text_color": "#000000",
+    "font_family": "Aeonik",
+    "enable_shadow": True,
+    "enable_mockups": True,
+    "texts": {},
+}
+
+# Only fonts shipped in public/fonts can be used server-side
+FONT_FILES = {
+    ("Aeonik", "bold"): "AeonikTRIAL-Bold.otf",
+    ("Aeonik", "normal"): "AeonikTRIAL-Regular.otf",
+}
+DEFAULT_FONT_FAMILY = "Aeonik"
+# Characters the template font lacks (the trial fonts have no ":" or "/") are
+# drawn with this, like the canvas falls back to sans-serif
+FALLBACK_FONTS = {"bold": "DejaVuSans-Bold.ttf", "normal": "DejaVuSans.ttf"}
+
+# ctx.shadowColor = 'rgba(0, 0, 0, 0.3)', shadowBlur = 40, shadowOffsetY = 20
+SHADOW_ALPHA = 0.3
+SHADOW_SIGMA = 20
+SHADOW_OFFSET_Y = 20
+
+# Rounded-corner masks are drawn this many times larger and scaled down (anti-aliasing)
+SUPERSAMPLE = 4
+
+Source = Union[bytes, str]  # Encoded image bytes or a path to the file
+
+def customization_hash(customization: Dict) -> str:
+    return hashlib.sha256(json.dumps(customization, sort_keys=True).encode()).hexdigest()[:16]
+
+# --- Per-process asset caches (filled once per worker, then reused) ---
+
+_templates: Dict[Tuple[str, str], Dict] = {}
+_frames: Dict[Tuple[str, int, int], Image.Image] = {}
+_fonts: Dict[Tuple[str, str, int], ImageFont.FreeTypeFont] = {}
+_fallback_fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+_glyphs: Dict[Tuple[int, str], bool] = {}
+_notdef: Dict[int, bytes] = {}
+
+def template_ids(assets_dir: str) -> List[str]:
+    templates_dir = os.path.join(assets_dir, "templates")
+    if not os.path.isdir(templates_dir):
+        return []
+    return sorted(
+        name[:-5] for name in os.listdir(templates_dir)
+        if name.endswith(".json") and name != "index.json"
+    )
+
+def load_template(assets_dir: str, template_id: str) -> Dict:
+    """Parsed template JSON; raises KeyError for unknown ids"""
+    key = (assets_dir, template_id)
+    if key not in _templates:
+        path = os.path.join(assets_dir, "templates", f"{template_id}.json")
+        if not TEMPLATE_ID.match(template_id) or not os.path.isfile(path):
+            raise KeyError(template_id)
+        with open(path, encoding="utf-8") as f:
+            _templates[key] = json.load(f)
+    return _templates[key]
+
+def _asset_path(assets_dir: str, url_path: str) -> str:
+    # Templates reference frames by their public URL ("/Desktop.png")
+    path = os.path.normpath(os.path.join(assets_dir, url_path.lstrip("/")))
+    if not path.startswith(os.path.normpath(assets_dir) + os.sep):
+        raise ValueError(f"Asset outside the assets directory: {url_path}")
+    return path
+
+def _frame(assets_dir: str, url_path: str, width: int, height: int) -> Image.Image:
+    key = (url_path, width, height)
+    if key not in _frames:
+        with Image.open(_asset_path(assets_dir, url_path)) as frame:
+            _frames[key] = frame.convert("RGBA").resize((width, height), Image.LANCZOS)
+    return _frames[key]
+
+def _font(assets_dir: str, family: str, weight: str, size: int) -> ImageFont.FreeTypeFont:
+    weight = "bold" if weight == "bold" else "normal"
+    filename = FONT_FILES.get((family, weight)) or FONT_FILES[(DEFAULT_FONT_FAMILY, weight)]
+    key = (filename, weight, size)
+    if key not in _fonts:
+        _fonts[key] = ImageFont.truetype(os.path.join(assets_dir, "fonts", filename), size)
+    return _fonts[key]
+
+def _fallback_font(weight: str, size: int) -> ImageFont.FreeTypeFont:
+    key = (weight, size)
+    if key not in _fallback_fonts:
+        try:
+            _fallback_fonts[key] = ImageFont.truetype(FALLBACK_FONTS[weight], size)
+        except OSError:
+            _fallback_fonts[key] = ImageFont.load_default(size)
+    return _fallback_fonts[key]
+
+def _has_glyph(font: ImageFont.FreeTypeFont, char: str) -> bool:
+    """A missing character renders as the font's .notdef box"""
+    key = (id(font), char)
+    if key not in _glyphs:
+        if id(font) not in _notdef:
+            _notdef[id(font)] = bytes(font.getmask("\uffff"))
+        _glyphs[key] = char.isspace() or bytes(font.getmask(char)) != _notdef[id(font)]
+    return _glyphs[key]
+
+def _runs(text: str, font: ImageFont.FreeTypeFont, fallback: ImageFont.FreeTypeFont) -> List[Tuple[str, ImageFont.FreeTypeFont]]:
+    """Split text into runs of the template font and the fallback font"""
+    runs: List[Tuple[str, ImageFont.FreeTypeFont]] = []
+    for char in text:
+        run_font = font if _has_glyph(font, char) else fallback
+        if runs and runs[-1][1] is run_font:
+            runs[-1] = (runs[-1][0] + char, run_font)
+        else:
+            runs.append((char, run_font))
+    return runs
+
+def _text_length(text: str, font: ImageFont.FreeTypeFont, fallback: ImageFont.FreeTypeFont) -> float:
+    return sum(run_font.getlength(run) for run, run_font in _runs(text, font, fallback))
+
+def _devices(template: Dict) -> List[Tuple[str, Dict]]:
+    devices = [(name, device) for name, device in (template.get("devices") or {}).items() if device]
+    # Extra devices always show the mobile screenshot
+    devices += [("mobile", device) for device in template.get("extraDevices") or []]
+    return devices
+
+def warm_up(assets_dir: str):
+    """Worker initializer: decode every frame and font and build the masks the templates use"""
+    for template_id in template_ids(assets_dir):
+        try:
+            template = load_template(assets_dir, template_id)
+            for _, device in _devices(template):
+                width, height, radius = round(device["width"]), round(device["height"]), device.get("borderRadius", 0)
+                _rounded_mask(width, height, radius)
+                if device.get("shadow"):
+                    _shadow_layer(width, height, radius)
+                if device.get("mockupImage"):
+                    _rounded_mask(width, height, radius * 0.7)
+                    config = device.get("mockupConfig") or {}
+                    _frame(assets_dir, device["mockupImage"],
+                           round(config.get("width", device["width"])), round(config.get("height", device["height"])))
+            for element in template.get("elements") or []:
+                if element.get("type") == "text":
+                    _font(assets_dir, element.get("fontFamily", DEFAULT_FONT_FAMILY),
+                          element.get("fontWeight", "normal"), int(element["fontSize"]))
+        except Exception as e:
+            log.warning("Mockup template %s could not be preloaded: %s", template_id, e)
+
+# --- Drawing ---
+
+def _gradient_mask(width: int, height: int, direction: str) -> Image.Image:
+    """0 at the start colour, 255 at the end, projected along the canvas diagonal like createLinearGradient"""
+    x = Image.linear_gradient("L").rotate(90).resize((width, height))
+    y = Image.linear_gradient("L").resize((width, height))
+    if "left" in direction:
+        x = ImageChops.invert(x)
+    if "top" in direction:
+        y = ImageChops.invert(y)
+    horizontal = "left" in direction or "right" in direction
+    vertical = "top" in direction or "bottom" in direction
+    if horizontal and not vertical:
+        return x
+    if vertical and not horizontal:
+        return y
+    # Diagonal: t = (x*W^2 + y*H^2) / (W^2 + H^2) with x, y normalised
+    wx = width * width / (width * width + height * height)
+    return ImageChops.add(x.point(lambda v: v * wx), y.point(lambda v: v * (1 - wx)))
+
+def _background(width: int, height: int, customization: Dict) -> Image.Image:
+    canvas = Image.new("RGBA", (width, height), customization["bg_color"])
+    if customization["use_gradient"]:
+        end = Image.new("RGBA", (width, height), customization["bg_color2"])
+        canvas = Image.composite(end, canvas, _gradient_mask(width, height, customization["gradient_direction"]))
+    return canvas
+
+# Masks and shadows only depend on template geometry, so they are built once per worker
+@lru_cache(maxsize=64)
+def _rounded_mask(width: int, height: int, radius: float) -> Image.Image:
+    mask = Image.new("L", (width * SUPERSAMPLE, height * SUPERSAMPLE), 0)
+    ImageDraw.Draw(mask).rounded_rectangle(
+        (0, 0, width * SUPERSAMPLE - 1, height * SUPERSAMPLE - 1), radius=radius * SUPERSAMPLE, fill=255
+    )
+    return mask.resize((width, height), Image.LANCZOS)
+
+@lru_cache(maxsize=16)
+def _border(width: int, height: int, radius: float) -> Image.Image:
+    """2px rgba(0, 0, 0, 0.1) rounded outline"""
+    outline = Image.new("L", (width * SUPERSAMPLE, height * SUPERSAMPLE), 0)
+    ImageDraw.Draw(outline).rounded_rectangle(
+        (0, 0, width * SUPERSAMPLE - 1, height * SUPERSAMPLE - 1),
+        radius=radius * SUPERSAMPLE, outline=255, width=SUPERSAMPLE
+    )
+    border = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    border.putalpha(outline.resize((width, height), Image.LANCZOS).point(lambda v: round(v * 0.1)))
+    return border
+
+def _cover(screenshot: Image.Image, width: int, height: int, crop: bool) -> Image.Image:
+    """Fill the screen area: crop the sides (centred) or the bottom (top stays), then scale"""
+    if crop:
+        target = width / height
+        if screenshot.width / screenshot.height > target:
+            sw = screenshot.height * target
+            sx = (screenshot.width - sw) / 2
+            screenshot = screenshot.crop((round(sx), 0, round(sx + sw), screenshot.height))
+        else:
+            screenshot = screenshot.crop((0, 0, screenshot.width, round(screenshot.width / target)))
+    return screenshot.convert("RGBA").resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+@lru_cache(maxsize=16)
+def _shadow_layer(width: int, height: int, radius: float) -> Tuple[Image.Image, Image.Image]:
+    pad = SHADOW_SIGMA * 3
+    mask = Image.new("L", (width + pad * 2, height + pad * 2), 0)
+    mask.paste(_rounded_mask(width, height, radius), (pad, pad))
+    shadow = Image.new("RGBA", mask.size, (0, 0, 0, 0))
+    shadow.putalpha(mask.filter(ImageFilter.GaussianBlur(SHADOW_SIGMA)).point(lambda v: round(v * SHADOW_ALPHA)))
+    rect = Image.new("RGBA", (width, height), "#888888")
+    rect.putalpha(_rounded_mask(width, height, radius))
+    return shadow, rect
+
+def _shadow(canvas: Image.Image, box: Tuple[int, int, int, int], radius: float):
+    """Solid #888 rounded rect casting a soft drop shadow (the frame is drawn over it)"""
+    x, y, width, height = box
+    pad = SHADOW_SIGMA * 3
+    shadow, rect = _shadow_layer(width, height, radius)
+    canvas.alpha_composite(shadow, (x - pad, y - pad + SHADOW_OFFSET_Y))
+    canvas.alpha_composite(rect, (x, y))
+
+def _draw_device(canvas: Image.Image, screenshot: Image.Image, device: Dict, assets_dir: str, customization: Dict):
+    x, y = round(device["x"]), round(device["y"])
+    width, height = round(device["width"]), round(device["height"])
+    radius = device.get("borderRadius", 0)
+    screen = _cover(screenshot, width, height, device.get("crop", True) is not False)
+    shadow = customization["enable_shadow"] and device.get("shadow")
+
+    if customization["enable_mockups"] and device.get("mockupImage"):
+        config = device.get("mockupConfig") or {}
+        if shadow:
+            _shadow(canvas, (x, y, width, height), radius)
+        frame = _frame(assets_dir, device["mockupImage"],
+                       round(config.get("width", width)), round(config.get("height", height)))
+        canvas.alpha_composite(frame, (round(config.get("x", x)), round(config.get("y", y))))
+        screen.putalpha(_rounded_mask(width, height, radius * 0.7))
+        canvas.alpha_composite(screen, (x, y))
+        return
+
+    # Plain rounded screenshot with a faint border. The editor clips before
+    # drawing, which clips its shadow away too, so none is drawn here either.
+    screen.putalpha(_rounded_mask(width, height, radius))
+    canvas.alpha_composite(screen, (x, y))
+    canvas.alpha_composite(_border(width, height, radius), (x, y))
+
+def _draw_text(canvas: Image.Image, element: Dict, content: str, assets_dir: str, customization: Dict, canvas_width: int):
+    if not content or not content.strip():
+        return
+    weight = "bold" if element.get("fontWeight") == "bold" else "normal"
+    font = _font(assets_dir, customization["font_family"], weight, int(element["fontSize"]))
+    fallback = _fallback_font(weight, int(element["fontSize"]))
+    draw = ImageDraw.Draw(canvas)
+    line_height = element["fontSize"] * 1.2
+    max_width = element.get("maxWidth") or canvas_width
+
+    # Greedy word wrap, same as the editor
+    lines, line = [], ""
+    for index, word in enumerate(content.split(" ")):
+        test_line = line + word + " "
+        if _text_length(test_line, font, fallback) > max_width and index > 0:
+            lines.append(line)
+            line = word + " "
+        else:
+            line = test_line
+    lines.append(line)
+    for number, text in enumerate(lines):
+        x = element["x"]
+        if element.get("textAlign") in ("center", "right"):
+            width = _text_length(text, font, fallback)
+            x -= width / 2 if element["textAlign"] == "center" else width
+        y = element["y"] + number * line_height
+        for run, run_font in _runs(text, font, fallback):
+            # "la": left/ascender, the closest match to textBaseline = 'top'
+            draw.text((x, y), run, font=run_font, fill=customization["text_color"], anchor="la")
+            x += run_font.getlength(run)
+
+def render_mockup(assets_dir: str, template_id: str, screenshots: Dict[str, Optional[Source]],
+                  customization: Dict, image_format: str, quality: int) -> Dict:
+    """
+    Composite the screenshots into a template. Runs in a worker process;
+    returns {data, hash, ms}.
+    """
+    started = time.perf_counter()
+    template = load_template(assets_dir, template_id)
+    customization = {**DEFAULT_CUSTOMIZATION, **customization}
+    width, height = template["canvas"]["width"], template["canvas"]["height"]
+    canvas = _background(width, height, customization)
+
+    decoded: Dict[str, Image.Image] = {}
+    for name, device in _devices(template):
+        source = screenshots.get(name)
+        if not device.get("enabled", True) or source is None:
+            continue
+        if name not in decoded:
+            decoded[name] = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        _draw_device(canvas, decoded[name], device, assets_dir, customization)
+
+    texts = customization["texts"]
+    for element in template.get("elements") or []:
+        if element.get("type") == "text":
+            _draw_text(canvas, element, texts.get(element["id"], element.get("content", "")),
+                       assets_dir, customization, width)
+
+    buffer = io.BytesIO()
+    if image_format == "png":
+        canvas.save(buffer, "PNG", compress_level=6)
+    else:
+        canvas.convert("RGB").save(buffer, MOCKUP_FORMATS[image_format], quality=quality)
+    data = buffer.getvalue()
+    return {
+        "data": data,
+        "hash": hashlib.sha256(data).hexdigest(),
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+class MockupRenderer:
+    """
+    Process pool that composites mockups. Each worker decodes the frames
+    and fonts of every template once at start-up and keeps them.
+    """
+    def __init__(self, assets_dir: str, workers: int):
+        self.assets_dir = os.path.abspath(assets_dir)
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.rendered = 0
+        self.render_time_total = 0.0
+
+    def available(self) -> bool:
+        return bool(template_ids(self.assets_dir))
+
+    def start(self):
+        if not self.available():
+            log.warning("Mockup templates not found in %s, /mockup disabled", self.assets_dir)
+            return
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up,
+            initargs=(self.assets_dir,)
+        )
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def template(self, template_id: str) -> Dict:
+        return load_template(self.assets_dir, template_id)
+
+    async def render(self, template_id: str, screenshots: Dict[str, Optional[Source]],
+                     customization: Dict, image_format: str, quality: int) -> Dict:
+        if self._executor is None:
+            self.start()
+        if self._executor is None:
+            raise RuntimeError("Mockup templates are not available")
+        rendered = await asyncio.get_running_loop().run_in_executor(
+            self._executor, render_mockup,
+            self.assets_dir, template_id, screenshots, customization, image_format, quality
+        )
+        self.rendered += 1
+        self.render_time_total += rendered["ms"] / 1000
+        return rendered
+
+    def stats(self) -> Dict:
+        return {
+            "assets_dir": self.assets_dir,
+            "templates": template_ids(self.assets_dir),
+            "workers": self.workers if self._executor else 0,
+            "rendered": self.rendered,
+            "avg_render_ms": round(self.render_time_total / self.rendered * 1000, 1) if self.rendered else 0.0,
+        }
@@ -0,0 +1,126 @@
+import os
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit
+from playwright.async_api import Page, Route
+
+BLOCKLIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blocklists")
+
+# none: load everything, trackers: drop analytics and ads,
+# aggressive: also chat widgets, video embeds and streaming/beacon traffic
+BLOCK_PROFILES = ("none", "trackers", "aggressive")
+
+# Resource types that never affect a static screenshot
+AGGRESSIVE_RESOURCE_TYPES = {"media", "websocket", "eventsource", "ping", "manifest", "texttrack"}
+
+# Typical transfer sizes used to estimate the bytes a block saved (the
+# response is never fetched, so the real size is unknown)
+ESTIMATED_BYTES = {
+    "script": 40_000,
+    "image": 15_000,
+    "media": 500_000,
+    "xhr": 2_000,
+    "fetch": 2_000,
+    "ping": 500,
+    "document": 30_000,
+    "stylesheet": 10_000,
+    "font": 30_000,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+class Blocklist:
+    """Domain list where an entry also matches its subdomains; "host/path" entries match a path prefix"""
+    def __init__(self, entries: List[str]):
+        self.domains: Set[str] = set()
+        self.paths: Dict[str, List[str]] = {}
+        for entry in entries:
+            host, _, path = entry.partition("/")
+            if path:
+                self.paths.setdefault(host, []).append("/" + path)
+            else:
+                self.domains.add(host)
+
+    @classmethod
+    def load(cls, *names: str) -> "Blocklist":
+        entries = []
+        for name in names:
+            with open(os.path.join(BLOCKLIST_DIR, name), encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip().lower()
+                    if line and not line.startswith("#"):
+                        entries.append(line)
+        return cls(entries)
+
+    def matches(self, host: str, path: str = "/") -> bool:
+        # Walk up the labels: a.b.example.com, b.example.com, example.com, com
+        labels = host.split(".")
+        for i in range(len(labels)):
+            suffix = ".".join(labels[i:])
+            if suffix in self.domains:
+                return True
+            prefixes = self.paths.get(suffix)
+            if prefixes and any(path.startswith(p) for p in prefixes):
+                return True
+        return False
+
+_blocklists: Dict[str, Blocklist] = {}
+
+def get_blocklist(profile: str) -> Optional[Blocklist]:
+    """Parsed once per profile and shared by every page"""
+    if profile == "none":
+        return None
+    if profile not in _blocklists:
+        files = ("trackers.txt",) if profile == "trackers" else ("trackers.txt", "widgets.txt")
+        _blocklists[profile] = Blocklist.load(*files)
+    return _blocklists[profile]
+
+class RequestBlocker:
+    """Aborts unwanted requests of one page and keeps count of what it blocked"""
+    def __init__(self, profile: str):
+        if profile not in BLOCK_PROFILES:
+            raise ValueError(f"Unknown block profile: {profile}")
+        self.profile = profile
+        self.blocklist = get_blocklist(profile)
+        self.blocked = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.estimated_bytes_saved = 0
+
+    async def install(self, page: Page):
+        if self.profile != "none":
+            await page.route("**/*", self.handle)
+
+    def should_block(self, url: str, resource_type: str, is_main_document: bool) -> bool:
+        if is_main_document:
+            return False
+        if self.profile == "aggressive" and resource_type in AGGRESSIVE_RESOURCE_TYPES:
+            return True
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        return self.blocklist.matches((parts.hostname or "").lower(), parts.path or "/")
+
+    def check(self, route: Route) -> bool:
+        """Count and return True when the route should be aborted"""
+        request = route.request
+        is_main_document = request.is_navigation_request() and request.frame.parent_frame is None
+        if not self.should_block(request.url, request.resource_type, is_main_document):
+            return False
+        self.blocked += 1
+        self.blocked_by_type[request.resource_type] = self.blocked_by_type.get(request.resource_type, 0) + 1
+        self.estimated_bytes_saved += ESTIMATED_BYTES.get(request.resource_type, DEFAULT_ESTIMATED_BYTES)
+        return True
+
+    async def handle(self, route: Route):
+        if self.check(route):
+            await route.abort("blockedbyclient")
+        else:
+            # Hand over to handlers registered before this one (e.g. the
+            # resource cache); with none left the request goes to the network
+            await route.fallback()
+
+    def stats(self) -> Dict:
+        return {
+            "profile": self.profile,
+            "blocked_requests": self.blocked,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+        }
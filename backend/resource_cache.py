@@ -0,0 +1,182 @@
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Set
+from playwright.async_api import Page, Route
+from memory_cache import MemoryCache
+
+# Subresources worth serving from the cache; documents, XHR and the rest go to the network
+CACHEABLE_TYPES = {"script", "stylesheet", "font", "image"}
+
+# Headers that describe the transfer rather than the body (bodies are stored decoded)
+HOP_BY_HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+# Lifetime of an entry in a job-scoped cache; it is thrown away with the job anyway
+JOB_SCOPED_TTL = 600
+
+class CachedResource:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+def freshness_lifetime(headers: Dict[str, str], shared: bool) -> Optional[float]:
+    """
+    Seconds a response may be reused, or None if it must not be cached.
+
+    A job-scoped cache only serves the desktop and mobile loads of one job,
+    seconds apart, so anything that is not no-store may be reused. The
+    process-wide cache follows Cache-Control / Expires like a shared cache.
+    """
+    cache_control = parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cache_control:
+        return None
+    # Vary on anything but encoding/origin means desktop and mobile may get different bodies
+    vary = headers.get("vary", "")
+    if vary and any(v.strip().lower() not in ("accept-encoding", "origin") for v in vary.split(",")):
+        return None
+    if not shared:
+        return JOB_SCOPED_TTL
+
+    if "private" in cache_control or "no-cache" in cache_control or "set-cookie" in headers:
+        return None
+    for directive in ("s-maxage", "max-age"):
+        if cache_control.get(directive):
+            try:
+                seconds = int(cache_control[directive])
+            except ValueError:
+                return None
+            return seconds if seconds > 0 else None
+    if headers.get("expires"):
+        try:
+            seconds = parsedate_to_datetime(headers["expires"]).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+        return seconds if seconds > 0 else None
+    return None
+
+class ResourceBudget:
+    """
+    Byte ceiling shared by every job-scoped cache alive at the same time.
+    A cache only stores a response while the caches together stay under
+    max_bytes, and gives its bytes back when it is closed.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._caches: Set["ResourceCache"] = set()
+
+    def bytes_used(self) -> int:
+        return sum(cache.store.bytes_used for cache in self._caches)
+
+    def fits(self, size: int) -> bool:
+        return self.bytes_used() + size <= self.max_bytes
+
+    def stats(self) -> Dict:
+        return {
+            "live_caches": len(self._caches),
+            "bytes_used": self.bytes_used(),
+            "max_bytes": self.max_bytes,
+        }
+
+class ResourceCache:
+    """
+    In-memory HTTP subresource cache shared by the pages of one job (or,
+    with shared=True, by every page in the process). Pages attach through
+    page.route; concurrent misses for the same URL wait for a single fetch.
+    Job caches draw on a ResourceBudget and must be closed when the job ends.
+    """
+    def __init__(self, max_bytes: int, max_entry_bytes: int, shared: bool = False,
+                 budget: Optional[ResourceBudget] = None):
+        self.store = MemoryCache(max_bytes, JOB_SCOPED_TTL)
+        self.max_entry_bytes = max_entry_bytes
+        self.shared = shared
+        self.budget = budget
+        self._pending: Dict[str, asyncio.Future] = {}
+        if budget is not None:
+            budget._caches.add(self)
+
+    def fits(self, size: int) -> bool:
+        return self.budget is None or self.budget.fits(size)
+
+    def close(self):
+        """Drop every entry and hand the bytes back to the budget"""
+        if self.budget is not None:
+            self.budget._caches.discard(self)
+        self.store.clear()
+
+    async def attach(self, page: Page) -> "ResourceCacheSession":
+        session = ResourceCacheSession(self)
+        await page.route("**/*", session.handle)
+        return session
+
+    def stats(self) -> Dict:
+        return self.store.stats()
+
+class ResourceCacheSession:
+    """Route handler for one page, counts what that page got from the cache"""
+    def __init__(self, cache: ResourceCache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+
+    async def handle(self, route: Route):
+        request = route.request
+        if request.method != "GET" or request.resource_type not in CACHEABLE_TYPES:
+            await route.fallback()
+            return
+
+        url = request.url
+        cached = self.cache.store.get(url)
+        if cached is None and url in self.cache._pending:
+            # The other viewport is fetching it right now
+            cached = await asyncio.shield(self.cache._pending[url])
+            if cached is None:
+                await route.fallback()
+                return
+
+        if cached is not None:
+            self.hits += 1
+            self.bytes_from_cache += len(cached.body)
+            await route.fulfill(status=cached.status, headers=cached.headers, body=cached.body)
+            return
+
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self.cache._pending[url] = pending
+        entry = None
+        try:
+            response = await route.fetch()
+            body = await response.body()
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+            ttl = freshness_lifetime({k.lower(): v for k, v in response.headers.items()}, self.cache.shared)
+            size = len(body) + 256
+            if response.status == 200 and ttl and len(body) <= self.cache.max_entry_bytes and self.cache.fits(size):
+                entry = CachedResource(response.status, headers, body)
+                self.cache.store.put(url, entry, size, ttl)
+            await route.fulfill(status=response.status, headers=headers, body=body)
+        except Exception:
+            # Let the browser load it the normal way
+            try:
+                await route.fallback()
+            except Exception:
+                pass
+        finally:
+            self.cache._pending.pop(url, None)
+            if not pending.done():
+                pending.set_result(entry)
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_from_cache": self.bytes_from_cache,
+        }
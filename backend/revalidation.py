@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import logging
+import urllib.error
+import urllib.request
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+async def document_validators(response) -> Dict:
+    """ETag, Last-Modified and body hash of the main document a capture loaded (page.goto's response)"""
+    if response is None:
+        return {}
+    validators = {}
+    headers = response.headers
+    if headers.get("etag"):
+        validators["etag"] = headers["etag"]
+    if headers.get("last-modified"):
+        validators["last_modified"] = headers["last-modified"]
+    try:
+        validators["body_sha256"] = hashlib.sha256(await response.body()).hexdigest()
+    except Exception as e:
+        # Redirect responses and some navigations have no body to read
+        log.debug("No document body to hash: %s", e)
+    return validators
+
+class Revalidator:
+    """
+    Decides without a browser whether a page changed since it was captured.
+
+    One conditional GET with the validators the capture recorded
+    (If-None-Match / If-Modified-Since): 304, or the same ETag, means
+    unchanged. If the origin answers 200 anyway, the HTML is hashed and
+    compared with the document the browser loaded. Pages that render
+    something different into every response (nonces, timestamps) never
+    match and are simply recaptured. Requests run in a thread (urllib).
+    """
+    def __init__(self, user_agent: str, timeout: float = 10, max_bytes: int = 5 * 1024 * 1024):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # Stats
+        self.stale_served = 0
+        self.unchanged = 0
+        self.recaptured = 0
+        self.failed = 0
+
+    async def is_unchanged(self, url: str, validators: Dict) -> bool:
+        if not validators:
+            return False
+        return await asyncio.to_thread(self._check, url, validators)
+
+    def _check(self, url: str, validators: Dict) -> bool:
+        headers = {"User-Agent": self.user_agent, "Accept": "text/html,application/xhtml+xml,*/*;q=0.8"}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                etag = response.headers.get("ETag")
+                if etag and etag == validators.get("etag"):
+                    return True
+                body = response.read(self.max_bytes + 1)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return True
+            raise
+        if len(body) > self.max_bytes or "body_sha256" not in validators:
+            return False
+        return hashlib.sha256(body).hexdigest() == validators["body_sha256"]
+
+    def stats(self) -> Dict:
+        return {
+            "stale_served": self.stale_served,
+            "revalidated_unchanged": self.unchanged,
+            "recaptured": self.recaptured,
+            "failed": self.failed,
+        }
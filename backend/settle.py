@@ -0,0 +1,164 @@
+import time
+import asyncio
+from typing import Dict, Optional
+from playwright.async_api import Page, Request
+
+# Installed in every pooled context. Records when the DOM last changed and
+# when the layout last shifted so the settle loop can tell a page that is
+# still building itself from one that is visually stable.
+SETTLE_SCRIPT = """
+    (() => {
+        const state = { lastMutation: performance.now(), lastShift: 0 };
+        Object.defineProperty(window, '__settle', { value: state, enumerable: false });
+        new MutationObserver(() => { state.lastMutation = performance.now(); })
+            .observe(document, { childList: true, subtree: true });
+        try {
+            new PerformanceObserver((list) => {
+                for (const entry of list.getEntries()) {
+                    if (!entry.hadRecentInput) state.lastShift = performance.now();
+                }
+            }).observe({ type: 'layout-shift', buffered: true });
+        } catch (e) {}
+    })();
+"""
+
+# One sample of the page: height, unfinished images near the viewport and
+# milliseconds since the last DOM mutation / layout shift
+_SAMPLE_JS = """
+    () => {
+        const state = window.__settle || { lastMutation: 0, lastShift: 0 };
+        const now = performance.now();
+        const reach = window.innerHeight * 2;
+        let pendingImages = 0;
+        for (const img of document.images) {
+            if (img.complete) continue;
+            const rect = img.getBoundingClientRect();
+            if (rect.bottom > 0 && rect.top < reach && rect.width > 0) pendingImages++;
+        }
+        return {
+            height: document.documentElement.scrollHeight,
+            pendingImages,
+            quietFor: now - Math.max(state.lastMutation, state.lastShift),
+            fontsLoading: document.fonts ? document.fonts.status !== 'loaded' : false,
+        };
+    }
+"""
+
+# Resolves after two animation frames, i.e. once scroll-triggered
+# IntersectionObserver callbacks have had a chance to start their requests
+_FRAMES_JS = "() => new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r)))"
+
+class NetworkTracker:
+    """Counts in-flight requests of a page (attach before page.goto)"""
+    # Requests open longer than this (long-polling, analytics beacons, streams)
+    # are ignored so they cannot hold the page "busy" forever
+    STUCK_AFTER = 2.0
+
+    def __init__(self, page: Page):
+        self._pending: Dict[Request, float] = {}
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _on_request(self, request: Request):
+        self._pending[request] = time.monotonic()
+
+    def _on_done(self, request: Request):
+        self._pending.pop(request, None)
+
+    def pending(self) -> int:
+        cutoff = time.monotonic() - self.STUCK_AFTER
+        return sum(1 for started in self._pending.values() if started > cutoff)
+
+class SettleTimer:
+    """Shared deadline plus per-phase timings for one page"""
+    def __init__(self, budget_ms: int):
+        self.deadline = time.monotonic() + budget_ms / 1000
+        self.phases: Dict[str, float] = {}
+        self.steps = 0
+        self.budget_exhausted = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def record(self, phase: str, started: float):
+        self.phases[phase] = round((time.perf_counter() - started) * 1000, 1)
+
+    def report(self) -> Dict:
+        return {
+            **{f"{phase}_ms": ms for phase, ms in self.phases.items()},
+            "scroll_steps": self.steps,
+            "budget_exhausted": self.budget_exhausted,
+        }
+
+async def _is_quiet(page: Page, tracker: Optional[NetworkTracker], quiet_ms: int, last_height: Optional[int]):
+    sample = await page.evaluate(_SAMPLE_JS)
+    quiet = (
+        (tracker is None or tracker.pending() == 0)
+        and sample["pendingImages"] == 0
+        and not sample["fontsLoading"]
+        and sample["quietFor"] >= quiet_ms
+        and sample["height"] == last_height
+    )
+    return quiet, sample["height"]
+
+async def wait_until_stable(page: Page, tracker: Optional[NetworkTracker], timer: SettleTimer,
+                            quiet_ms: int, max_wait: Optional[float] = None) -> bool:
+    """
+    Poll until there are no pending requests or unfinished nearby images,
+    fonts are loaded, the DOM has been quiet for quiet_ms and the page
+    height stopped changing. Returns False if the time ran out first.
+    """
+    limit = timer.remaining() if max_wait is None else min(max_wait, timer.remaining())
+    give_up = time.monotonic() + limit
+    last_height = None
+    while True:
+        quiet, last_height = await _is_quiet(page, tracker, quiet_ms, last_height)
+        if quiet:
+            return True
+        if time.monotonic() >= give_up:
+            if timer.remaining() == 0:
+                timer.budget_exhausted = True
+            return False
+        await asyncio.sleep(0.05)
+
+async def settle_page(page: Page, tracker: Optional[NetworkTracker], budget_ms: int, quiet_ms: int) -> Dict:
+    """Wait for a page that is not scrolled to become visually stable"""
+    timer = SettleTimer(budget_ms)
+    started = time.perf_counter()
+    await wait_until_stable(page, tracker, timer, quiet_ms)
+    timer.record("settle", started)
+    return timer.report()
+
+async def scroll_and_settle(page: Page, tracker: Optional[NetworkTracker], percentage: float,
+                            budget_ms: int, quiet_ms: int, step_max_ms: int) -> Dict:
+    """
+    Scroll down to a percentage of the page one viewport at a time so
+    lazy content loads, moving on from each step as soon as the requests
+    it triggered are done (at most step_max_ms), then scroll back to the
+    top and wait for the page to settle. Everything shares budget_ms.
+    """
+    timer = SettleTimer(budget_ms)
+
+    started = time.perf_counter()
+    total_height = await page.evaluate("document.body.scrollHeight")
+    step = max(200, await page.evaluate("window.innerHeight"))
+    target_height = int(total_height * percentage)
+
+    position = 0
+    while position < target_height and timer.remaining() > 0:
+        position = min(position + step, target_height)
+        await page.evaluate(f"window.scrollTo(0, {position})")
+        await page.evaluate(_FRAMES_JS)
+        await wait_until_stable(page, tracker, timer, quiet_ms=0, max_wait=step_max_ms / 1000)
+        timer.steps += 1
+    if position < target_height:
+        timer.budget_exhausted = True
+    timer.record("scroll", started)
+
+    # Scroll back to top for screenshot
+    started = time.perf_counter()
+    await page.evaluate("window.scrollTo(0, 0)")
+    await wait_until_stable(page, tracker, timer, quiet_ms)
+    timer.record("settle", started)
+    return timer.report()
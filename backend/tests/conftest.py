@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the app modules the way uvicorn does, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the persistent cache tier out of test runs
+os.environ.setdefault("DISK_CACHE_DIR", "")
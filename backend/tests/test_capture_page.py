@@ -0,0 +1,119 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import main
+from device_profiles import BUILTIN_PROFILES, DeviceProfile
+
+LAPTOP = DeviceProfile("laptop", 1366, 768, 1)
+DESKTOP_HD = DeviceProfile("desktop-hd", 2560, 1440, 2)
+
+class FakeCDP:
+    def __init__(self, page):
+        self.page = page
+
+    async def send(self, method, params):
+        if method == "Emulation.setDeviceMetricsOverride":
+            self.page.width = params["width"]
+            self.page.scale = params["deviceScaleFactor"]
+
+class FakePage:
+    """Responsive page whose content gets taller as the viewport narrows"""
+    def __init__(self, profile):
+        self.width = profile.width
+        self.scale = profile.device_scale_factor
+        self.scroll_y = 0
+        self.clips = []
+
+    def on(self, *args):
+        pass
+
+    async def route(self, *args):
+        pass
+
+    async def goto(self, url, **kwargs):
+        return None
+
+    async def title(self):
+        return "Example"
+
+    async def evaluate(self, expression):
+        if expression == "window.scrollTo(0, 0)":
+            self.scroll_y = 0
+        elif expression == "window.devicePixelRatio":
+            return self.scale
+        elif expression == "document.documentElement.scrollHeight":
+            return 12_000_000 // self.width
+
+    async def screenshot(self, **kwargs):
+        self.clips.append((self.width, self.scroll_y, kwargs["clip"]))
+        return b"image"
+
+class FakeContext:
+    def __init__(self, profile):
+        self.profile = profile
+        self.pages = []
+
+    async def new_page(self):
+        self.pages.append(FakePage(self.profile))
+        return self.pages[-1]
+
+    async def new_cdp_session(self, page):
+        return FakeCDP(page)
+
+def capture(monkeypatch, profiles, scroll_to_bottom=True):
+    contexts = []
+    settled = []
+
+    @asynccontextmanager
+    async def checkout(pool):
+        contexts.append(FakeContext(main.POOL_PROFILES[pool]))
+        yield contexts[-1]
+
+    async def settle(page, *args, **kwargs):
+        # Note where the page was, then leave it scrolled like a real scroll pass might
+        settled.append((page.width, page.scroll_y))
+        page.scroll_y = 2000
+        return {}
+
+    monkeypatch.setattr(main.browsers, "checkout", checkout)
+    monkeypatch.setattr(main, "scroll_to_percentage", settle)
+    monkeypatch.setattr(main, "wait_for_settle", settle)
+    options = main.CaptureOptions.from_request(main.CaptureRequest(url="https://example.com", scroll_to_bottom=scroll_to_bottom))
+    title, _, shots = asyncio.run(main.capture_page("https://example.com", options, profiles))
+    assert title == "Example"
+    return contexts, settled, shots
+
+def test_profile_switch_scrolls_back_to_the_top(monkeypatch):
+    for scroll_to_bottom in (True, False):
+        contexts, settled, shots = capture(monkeypatch, [BUILTIN_PROFILES["desktop"], LAPTOP, DESKTOP_HD], scroll_to_bottom)
+        assert len(contexts) == 1
+        assert settled == [(1920, 0), (1366, 0), (2560, 0)]
+        assert shots["laptop"][1]["emulated_from"] == "desktop"
+
+def test_profile_switch_clips_the_new_layout(monkeypatch):
+    contexts, _, shots = capture(monkeypatch, [BUILTIN_PROFILES["desktop"], LAPTOP, DESKTOP_HD])
+    clips = [(width, clip["y"], clip["width"], clip["height"]) for width, _, clip in contexts[0].pages[0].clips]
+    assert clips == [
+        # 6250px page: first half in one shot
+        (1920, 0, 1920, 3125),
+        # 8784px page: 4392 CSS px, split at CAPTURE_TILE_HEIGHT (4096)
+        (1366, 0, 1366, 4096),
+        (1366, 4096, 1366, 296),
+        # 4687px page at 2x: 2343 CSS px, strips of 4096 / 2 CSS px
+        (2560, 0, 2560, 2048),
+        (2560, 2048, 2560, 295),
+    ]
+    assert shots["desktop"][0] == b"image"
+    assert shots["laptop"][1]["strips"] == 2
+
+def test_devices_with_another_user_agent_get_their_own_page_load(monkeypatch):
+    profiles = [BUILTIN_PROFILES["desktop"], BUILTIN_PROFILES["mobile"], BUILTIN_PROFILES["tablet"], LAPTOP]
+    groups = main.navigation_groups(profiles)
+    assert [[profile.name for profile in group] for group in groups] == [["desktop", "laptop"], ["mobile"], ["tablet"]]
+
+    contexts, _, _ = capture(monkeypatch, [BUILTIN_PROFILES["mobile"]])
+    # The mobile pool's context is already an iPhone: navigated as is, no emulation
+    assert contexts[0].profile.name == "mobile"
+
+    monkeypatch.setattr(main.config, "DEVICE_EMULATION", False)
+    assert len(main.navigation_groups(profiles)) == 4
@@ -0,0 +1,77 @@
+import os
+import time
+
+from disk_cache import DiskCache
+
+def blob_files(cache):
+    return sorted(name for _, _, files in os.walk(cache.blob_dir) for name in files)
+
+def test_identical_images_are_stored_once(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60)
+    first = cache.put("a", {"desktop": b"same", "mobile": b"other"}, page_title="A")
+    second = cache.put("b", {"desktop": b"same"})
+    assert first.hashes["desktop"] == second.hashes["desktop"]
+    assert len(blob_files(cache)) == 2
+    assert cache.stats()["bytes_used"] == len(b"same") + len(b"other")
+
+    entry = cache.get("a")
+    assert entry.page_title == "A"
+    with open(entry.paths["mobile"], "rb") as f:
+        assert f.read() == b"other"
+
+def test_blobs_are_removed_once_nothing_references_them(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60)
+    cache.put("a", {"desktop": b"shared", "mobile": b"only-a"})
+    cache.put("b", {"desktop": b"shared"})
+
+    # Replacing an entry drops its old blob but keeps the shared one
+    cache.put("a", {"desktop": b"shared", "mobile": b"new-a"})
+    assert len(blob_files(cache)) == 2
+    cache.delete("a")
+    assert len(blob_files(cache)) == 1
+    assert cache.get("b") is not None
+    cache.delete("b")
+    assert blob_files(cache) == []
+    assert cache.stats()["blobs"] == 0
+
+def test_expired_entries_are_served_stale_then_purged(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60, stale_seconds=60)
+    cache.put("fresh", {"desktop": b"1"})
+    cache.put("stale", {"desktop": b"2"}, ttl_seconds=-30)
+    cache.put("gone", {"desktop": b"3"}, ttl_seconds=-90)
+
+    assert cache.get("stale") is None
+    assert cache.get("stale", allow_stale=True) is not None
+    assert cache.purge_expired() == 1
+    assert cache.get("gone", allow_stale=True) is None
+    assert cache.get("fresh") is not None
+    assert len(blob_files(cache)) == 2
+
+    assert cache.refresh("stale")
+    assert cache.get("stale").expires_at > time.time()
+
+def test_least_recently_used_entries_are_evicted_to_fit(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=25, ttl_seconds=60)
+    cache.put("a", {"desktop": b"a" * 10})
+    cache.put("b", {"desktop": b"b" * 10})
+    time.sleep(0.01)
+    cache.get("a")
+    cache.put("c", {"desktop": b"c" * 10})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes_used"] == 20
+
+def test_missing_blob_counts_as_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60)
+    entry = cache.put("a", {"desktop": b"image"})
+    os.remove(entry.paths["desktop"])
+    assert cache.get("a") is None
+    assert cache.stats()["total_entries"] == 0
+    assert cache.stats()["misses"] == 1
+
+def test_index_survives_a_restart(tmp_path):
+    DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60).put("a", {"desktop": b"image"}, image_format="png")
+    entry = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60).get("a")
+    assert entry.image_format == "png"
+    assert entry.sizes == {"desktop": 5}
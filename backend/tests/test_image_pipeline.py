@@ -0,0 +1,125 @@
+import io
+import time
+import random
+import asyncio
+import hashlib
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+from image_pipeline import ImagePipeline, OutputOptions, MIN_QUALITY, encode_variants, stitch_strips, supported_formats
+
+def screenshot(width=400, height=300, image_format="PNG") -> bytes:
+    """A noisy image, so that quality actually changes the encoded size"""
+    rng = random.Random(width * height)
+    image = Image.frombytes("RGB", (width, height), bytes(rng.getrandbits(8) for _ in range(width * height * 3)))
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+def test_browser_output_is_stored_as_is():
+    output = OutputOptions("jpeg")
+    assert not output.needs_transcode()
+    assert output.screenshot_args() == {"type": "jpeg", "quality": 85}
+    assert output.key() == ""
+
+    data = screenshot(image_format="JPEG")
+    variants = encode_variants(data, "jpeg", 85, None, (), transcode=False)
+    assert variants[""]["data"] is data
+
+@pytest.mark.parametrize("image_format", supported_formats())
+def test_formats(image_format):
+    output = OutputOptions(image_format, quality=70)
+    # What the browser would hand over for these options
+    raw = screenshot(image_format=output.screenshot_args()["type"].upper())
+    variants = asyncio.run(ImagePipeline(1).process(raw, output))
+    image = decode(variants[""]["data"])
+    assert image.format == {"jpeg": "JPEG", "webp": "WEBP", "avif": "AVIF", "png": "PNG"}[image_format]
+    assert image.size == (400, 300)
+    assert variants[""]["quality"] == (None if image_format == "png" else 70)
+
+def test_byte_budget_lowers_quality_until_it_fits():
+    data = screenshot()
+    target = len(encode_variants(data, "webp", 50, None, (), transcode=True)[""]["data"])
+    bounded = encode_variants(data, "webp", 85, target, (), transcode=True)[""]
+    assert len(bounded["data"]) <= target
+    assert 50 <= bounded["quality"] < 85
+    # The next quality up would not have fitted
+    above = encode_variants(data, "webp", bounded["quality"] + 1, None, (), transcode=True)[""]
+    assert len(above["data"]) > target
+
+def test_impossible_budget_returns_the_smallest_attempt():
+    variants = encode_variants(screenshot(), "jpeg", 85, 100, (), transcode=True)
+    assert variants[""]["quality"] == MIN_QUALITY
+
+def test_budget_is_ignored_for_png():
+    output = OutputOptions("png", target_bytes=100)
+    assert output.target_bytes is None
+    assert not output.needs_transcode()
+
+def test_previews_are_downscaled_with_the_same_quality():
+    output = OutputOptions("webp", quality=60, previews=[800, 200, 100, 200])
+    assert output.key() == "webp,q60,p100-200-800"
+    variants = asyncio.run(ImagePipeline(1).process(screenshot(), output))
+    # Previews at least as wide as the screenshot are skipped
+    assert sorted(variants) == ["", "100", "200"]
+    assert decode(variants["200"]["data"]).size == (200, 150)
+    assert variants["100"]["quality"] == 60
+    assert len({variant["hash"] for variant in variants.values()}) == 3
+
+def strips(width=64, heights=(40, 40, 17)):
+    """PNG strips of one page, each filled with its own colour"""
+    result = []
+    for i, height in enumerate(heights):
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), (i * 100, 0, 0)).save(buffer, "PNG")
+        result.append(buffer.getvalue())
+    return result
+
+def test_stitch_strips_stacks_them_top_to_bottom():
+    result = stitch_strips(strips(), "png", 85)
+    image = decode(result["data"])
+    assert image.size == (64, 97) == (result["width"], result["height"])
+    assert [image.getpixel((0, y))[0] for y in (0, 39, 40, 79, 80, 96)] == [0, 0, 100, 100, 200, 200]
+    assert result["bytes"] == len(result["data"])
+    assert result["hash"] == hashlib.sha256(result["data"]).hexdigest()
+
+def test_stitch_streams_the_encoder_output():
+    pipeline = ImagePipeline(1)
+
+    async def run():
+        return [chunk async for chunk in pipeline.stitch(strips(), "jpeg", 85)]
+
+    chunks = asyncio.run(run())
+    assert decode(b"".join(chunks)).size == (64, 97)
+    assert pipeline.stats()["images_processed"] == 1
+    pipeline.shutdown()
+
+def test_stitch_stops_the_worker_when_the_consumer_goes_away():
+    pipeline = ImagePipeline(1)
+    writes = []
+
+    def slow_stitch(strips, image_format, quality, write):
+        for _ in range(100):
+            write(b"chunk")
+            writes.append(time.monotonic())
+            time.sleep(0.01)
+        return {"ms": 0}
+
+    async def run():
+        stream = pipeline.stitch(strips(), "png", 85)
+        assert await stream.__anext__() == b"chunk"
+        await stream.aclose()
+        # Keep the loop running, a closed loop would stop the worker anyway
+        await asyncio.sleep(0.3)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(image_pipeline, "stitch_strips", slow_stitch)
+        asyncio.run(run())
+    pipeline.shutdown()
+    # The worker raised StitchAborted at its next write instead of encoding to the end
+    assert len(writes) < 5
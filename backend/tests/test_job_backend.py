@@ -0,0 +1,155 @@
+import time
+import random
+import asyncio
+from enum import Enum
+
+from job_backend import FairQueue, SQLiteJobBackend
+
+class Job:
+    def __init__(self, name, priority="interactive", client_id="anonymous"):
+        self.job_id = name
+        self.priority = priority
+        self.client_id = client_id
+        self.status = "queued"
+
+    def __repr__(self):
+        return self.job_id
+
+def drain(queue):
+    order = []
+    while len(queue):
+        order.append(queue.pop().job_id)
+    return order
+
+def test_higher_classes_are_served_first():
+    queue = FairQueue()
+    for job in (Job("p1", "prewarm"), Job("b1", "batch"), Job("i1"), Job("b2", "batch"), Job("i2")):
+        queue.push(job)
+    assert queue.counts() == {"interactive": 2, "batch": 2, "prewarm": 1}
+    assert drain(queue) == ["i1", "i2", "b1", "b2", "p1"]
+    assert queue.pop() is None
+
+def test_clients_of_a_class_take_turns():
+    queue = FairQueue()
+    for i in range(3):
+        queue.push(Job(f"a{i}", "batch", "a"))
+    queue.push(Job("b0", "batch", "b"))
+    queue.push(Job("c0", "batch", "c"))
+    queue.push(Job("b1", "batch", "b"))
+    assert queue.client_count() == 3
+    assert drain(queue) == ["a0", "b0", "c0", "a1", "b1", "a2"]
+
+def test_positions_match_the_pop_order():
+    rng = random.Random(7)
+    queue = FairQueue()
+    jobs = [Job(f"job{i}", rng.choice(["interactive", "batch", "prewarm"]), rng.choice("abcd")) for i in range(60)]
+    for job in jobs:
+        queue.push(job)
+    # Take a few out of the middle, as withdrawn jobs would be
+    for job in jobs[5:60:7]:
+        assert queue.remove(job)
+    assert not queue.remove(jobs[5])
+
+    positions = {job.job_id: queue.position(job) for job in jobs}
+    order = drain(queue)
+    assert {job_id: positions[job_id] for job_id in order} == {job_id: i + 1 for i, job_id in enumerate(order)}
+    assert all(positions[job.job_id] == 0 for job in jobs[5:60:7])
+
+class Status(str, Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+
+class RecordJob(Job):
+    """What SQLiteJobBackend needs from a job: a status enum and a JSON record"""
+    def __init__(self, name, priority="interactive", client_id="anonymous"):
+        super().__init__(name, priority, client_id)
+        self.status = Status.QUEUED
+        self.subscribers = []
+
+    def to_record(self):
+        return {"job_id": self.job_id, "priority": self.priority, "client_id": self.client_id, "status": self.status.value}
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record["job_id"], record["priority"], record["client_id"])
+        job.apply_record(record)
+        return job
+
+    def apply_record(self, record):
+        self.status = Status(record["status"])
+
+def backends(tmp_path, lease_seconds=30, retention_seconds=60):
+    path = str(tmp_path / "jobs.db")
+    return [SQLiteJobBackend(path, retention_seconds, lease_seconds, RecordJob) for _ in range(2)]
+
+def test_a_claimed_job_is_leased_to_one_process(tmp_path):
+    first, second = backends(tmp_path)
+
+    async def run():
+        await first.add(RecordJob("job"))
+        claimed = await second.next_job()
+        assert claimed.job_id == "job" and claimed.status == Status.QUEUED
+        # Leased: nobody else gets it
+        assert first._claim() is None and second._claim() is None
+        owner, lease_expires = first._execute("SELECT owner, lease_expires FROM jobs")[0]
+        assert owner == second.owner and lease_expires > time.time()
+
+    asyncio.run(run())
+
+def test_an_expired_lease_is_reclaimed(tmp_path):
+    first, second = backends(tmp_path, lease_seconds=0.1)
+
+    async def run():
+        await first.add(RecordJob("job"))
+        await second.next_job()
+        await asyncio.sleep(0.2)
+        reclaimed = await first.next_job()
+        assert reclaimed.job_id == "job"
+        assert (first.reclaimed, second.reclaimed) == (1, 0)
+
+    asyncio.run(run())
+
+def test_higher_priority_and_waiting_clients_are_claimed_first(tmp_path):
+    first, second = backends(tmp_path)
+
+    async def run():
+        for job in (RecordJob("a1", "batch", "a"), RecordJob("a2", "batch", "a"), RecordJob("b1", "batch", "b"),
+                    RecordJob("p1", "prewarm", "a"), RecordJob("i1", "interactive", "b")):
+            await first.add(job)
+        return [(await backend.next_job()).job_id for backend in (second, first, second, first, second)]
+
+    assert asyncio.run(run()) == ["i1", "a1", "b1", "a2", "p1"]
+
+def test_jobs_finished_elsewhere_are_forgotten(tmp_path):
+    first, second = backends(tmp_path, retention_seconds=0)
+
+    async def run():
+        job = RecordJob("job")
+        await first.add(job)
+        running = await second.next_job()
+        running.status = Status.COMPLETED
+        await second.finish(running)
+
+        # Loaded by a process that did not run it: its live object must not stay forever
+        assert (await first.get("job")).status == Status.COMPLETED
+        assert "job" in first._jobs and "job" in first._forgetting
+        await asyncio.sleep(0.01)
+        assert await first.purge_expired() == 1
+        assert first._jobs == {} and not first._forgetting and not first._forget
+        assert await first.get("job") is None
+
+    asyncio.run(run())
+
+def test_active_and_queued_counts(tmp_path):
+    first, second = backends(tmp_path)
+
+    async def run():
+        await first.add(RecordJob("queued"))
+        await first.add(RecordJob("running"))
+        await second.next_job()
+        assert first._active_counts() == (2, 1)
+        stats = await first.stats()
+        assert (stats["active_jobs"], stats["queued_jobs"]) == (2, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from job_store import JobStore
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+def test_positions_follow_submission_order(clock):
+    store = JobStore(retention_seconds=60)
+    jobs = [Job(f"job-{i}") for i in range(5)]
+    assert [store.add(job) for job in jobs] == [1, 2, 3, 4, 5]
+
+    store.finish(jobs[1])
+    store.finish(jobs[3])
+    assert [store.position(job) for job in jobs] == [1, 0, 2, 0, 3]
+    assert store.active_count() == 3
+
+    # Finishing twice does not restart the retention clock
+    store.finish(jobs[1])
+    assert store.stats()["finished_jobs"] == 2
+
+def test_finished_jobs_are_forgotten_after_retention(clock):
+    store = JobStore(retention_seconds=60)
+    first, second, running = Job("first"), Job("second"), Job("running")
+    for job in (first, second, running):
+        store.add(job)
+    store.finish(first)
+    clock[0] += 30
+    store.finish(second)
+
+    clock[0] += 30
+    assert store.get("first") is None
+    assert store.get("second") is second
+    assert "running" in store
+    clock[0] += 30
+    assert "second" not in store
+    assert store.stats() == {
+        "total_jobs": 1,
+        "active_jobs": 1,
+        "finished_jobs": 0,
+        "evicted_jobs": 2,
+        "retention_seconds": 60,
+    }
@@ -0,0 +1,180 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi.testclient import TestClient
+
+import main
+from capture_result import CaptureResult
+from device_profiles import DeviceProfile
+from disk_cache import DiskCache
+from memory_cache import MemoryCache
+
+def test_screenshot_both_returns_inline_images(monkeypatch):
+    captured = []
+
+    async def fake_process_capture(url, options, use_cache=True, job=None, cache_ttl=None):
+        captured.append((url, options.devices))
+        return CaptureResult("key", "Example", images={"desktop": b"d", "mobile": b"m"}, image_format="png")
+
+    monkeypatch.setattr(main, "process_capture", fake_process_capture)
+    response = TestClient(main.app).get("/screenshot-both", params={"url": "https://example.com"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["desktop"] and body["mobile"]
+    assert captured == [("https://example.com", ("desktop", "mobile"))]
+
+def test_is_cached_only_peeks(monkeypatch, tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1_000_000, ttl_seconds=60)
+    memory = MemoryCache(1_000_000, 60)
+    monkeypatch.setattr(main, "disk_cache", disk)
+    monkeypatch.setattr(main, "screenshot_cache", memory)
+    options = main.CaptureOptions.from_request(main.CaptureRequest(url="https://example.com"))
+    url = main.normalize_url("https://example.com")
+    desktop, mobile = (options.device_key(url, device) for device in ("desktop", "mobile"))
+
+    memory.put(desktop, CaptureResult(desktop, "Example", images={"desktop": b"d"}), 1)
+    assert not asyncio.run(main.is_cached(url, options))
+    disk.put(mobile, {"mobile": b"m"})
+    last_access = disk._db.execute("SELECT last_access FROM entries").fetchone()
+    assert asyncio.run(main.is_cached(url, options))
+
+    assert (memory.hits, memory.misses, disk.hits, disk.misses) == (0, 0, 0, 0)
+    assert disk._db.execute("SELECT last_access FROM entries").fetchone() == last_access
+    # Nothing was promoted into memory either
+    assert memory.get_entry(mobile) is None
+
+def cache_capture(url, options):
+    url = main.normalize_url(url)
+    for device in options.devices:
+        cache_key = options.device_key(url, device)
+        main.save_to_cache(url, CaptureResult(cache_key, url, images={device: device.encode()}, image_format="jpeg"))
+
+def test_batch_streams_one_line_per_distinct_url(monkeypatch):
+    monkeypatch.setattr(main, "screenshot_cache", MemoryCache(1_000_000, 60))
+    options = main.CaptureOptions.from_request(main.BatchRequest(urls=["https://example.com"]))
+    urls = ["https://example.com", "https://example.org/", "example.com"]
+    for url in urls[:2]:
+        cache_capture(url, options)
+
+    with TestClient(main.app).stream("POST", "/capture/batch", json={"urls": urls}) as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+
+    header, results, done = lines[0], lines[1:-1], lines[-1]
+    assert header["type"] == "batch" and header["total"] == 3
+    assert sorted(job["indexes"] for job in header["jobs"]) == [[0, 2], [1]]
+    assert response.headers["x-batch-id"] == header["batch_id"] == done["batch_id"]
+    assert sorted(result["indexes"] for result in results) == [[0, 2], [1]]
+    assert all(result["type"] == "result" and result["status"] == "completed" for result in results)
+    assert {result["result"]["title"] for result in results} == {"https://example.com", "https://example.org/"}
+    assert (done["type"], done["completed"], done["failed"], done["cancelled"]) == ("done", 2, 0, 0)
+
+def test_batch_validation():
+    client = TestClient(main.app)
+    assert client.post("/capture/batch", json={"urls": []}).status_code == 422
+    assert client.post("/capture/batch", json={"urls": ["https://example.com"] * (main.config.BATCH_MAX_URLS + 1)}).status_code == 422
+    response = client.post("/capture/batch", json={"urls": ["https://example.com"], "devices": ["desktop"], "mockup": {}})
+    assert response.status_code == 422
+
+def test_stale_devices_are_revalidated_together(monkeypatch):
+    memory = MemoryCache(1_000_000, 60, stale_seconds=3600)
+    monkeypatch.setattr(main, "screenshot_cache", memory)
+    monkeypatch.setattr(main, "revalidator", main.Revalidator("test"))
+    monkeypatch.setitem(main.DEVICE_PROFILES, "laptop", DeviceProfile("laptop", 1366, 768, 1))
+    checks, queued = [], []
+
+    async def is_unchanged(url, validators):
+        checks.append(validators["etag"])
+        return validators["etag"] == "tablet-v1"
+
+    async def enqueue_job(job, start_if_cached=False):
+        queued.append(job)
+        job.status = main.JobStatus.COMPLETED
+        job.publish("done", {})
+        return 0
+
+    monkeypatch.setattr(main.revalidator, "is_unchanged", is_unchanged)
+    monkeypatch.setattr(main, "enqueue_job", enqueue_job)
+    url = "https://example.com"
+    options = main.CaptureOptions.from_request(main.CaptureRequest(url=url, devices=["desktop", "laptop", "mobile", "tablet"]))
+    etags = {"desktop": "desktop-v1", "laptop": "desktop-v1", "mobile": "mobile-v1", "tablet": "tablet-v1"}
+    for device, etag in etags.items():
+        cache_key = options.device_key(url, device)
+        result = CaptureResult(cache_key, "Example", images={device: b"old"}, validators={"etag": etag})
+        memory.put(cache_key, result, 1, ttl=-10)
+
+    async def run():
+        assert main.get_cached_result(url, options) is not None
+        # A second request while the refresh is under way starts nothing new
+        assert main.get_cached_result(url, options) is not None
+        await asyncio.gather(*main.background_tasks)
+
+    asyncio.run(run())
+    # One conditional request per user agent, one recapture for every changed device
+    assert sorted(checks) == ["desktop-v1", "mobile-v1", "tablet-v1"]
+    assert len(queued) == 1
+    assert queued[0].options.devices == ("desktop", "laptop", "mobile")
+    assert queued[0].priority == "prewarm"
+    assert memory.get(options.device_key(url, "tablet")) is not None
+    assert main.revalidator.stats() == {"stale_served": 8, "revalidated_unchanged": 1, "recaptured": 3, "failed": 0}
+    assert not main.revalidating and not main.stale_devices
+
+class DisconnectedRequest:
+    headers = {}
+
+    async def is_disconnected(self):
+        return True
+
+def test_screenshot_runs_within_the_capture_budget(monkeypatch):
+    gotos = []
+
+    class Page:
+        async def route(self, *args):
+            pass
+
+        def on(self, *args):
+            pass
+
+        async def goto(self, url, **kwargs):
+            gotos.append(kwargs["timeout"])
+            await asyncio.sleep(10)
+
+    class Context:
+        async def new_page(self):
+            return Page()
+
+    @asynccontextmanager
+    async def checkout(pool):
+        yield Context()
+
+    monkeypatch.setattr(main.browsers, "started", True)
+    monkeypatch.setattr(main.browsers, "checkout", checkout)
+    monkeypatch.setattr(main.config, "CAPTURE_TIMEOUT_SECONDS", 0.3)
+    response = TestClient(main.app).get("/screenshot", params={"url": "https://example.com", "use_cache": False})
+    assert response.status_code == 500
+    assert "time budget" in response.json()["detail"]
+    assert 0 < gotos[0] <= 300
+
+def test_screenshot_is_abandoned_when_the_client_disconnects(monkeypatch):
+    cancelled = []
+
+    async def capture_fullpage(url, output, deadline):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+
+    monkeypatch.setattr(main.browsers, "started", True)
+    monkeypatch.setattr(main, "capture_fullpage", capture_fullpage)
+    monkeypatch.setattr(main, "DISCONNECT_POLL_SECONDS", 0.01)
+
+    async def run():
+        response = await main.screenshot("https://example.com", DisconnectedRequest(), use_cache=False)
+        await asyncio.sleep(0)
+        return response
+
+    assert asyncio.run(run()).status_code == 499
+    assert cancelled == ["https://example.com"]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from memory_cache import MemoryCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+def test_least_recently_used_entry_is_evicted_first(clock):
+    cache = MemoryCache(max_bytes=30, default_ttl=60)
+    cache.put("a", "A", 10)
+    cache.put("b", "B", 10)
+    cache.put("c", "C", 10)
+    assert cache.get("a") == "A"
+    cache.put("d", "D", 10)
+    assert "b" not in cache
+    assert [key for key in ("a", "c", "d") if key in cache] == ["a", "c", "d"]
+    assert cache.bytes_used == 30
+    assert cache.stats()["evictions"] == 1
+
+def test_byte_ceiling(clock):
+    cache = MemoryCache(max_bytes=100, default_ttl=60)
+    cache.put("small", "s", 40)
+    cache.put("big", "b", 101)
+    assert "big" not in cache
+    assert "small" in cache
+
+    cache.put("large", "l", 90)
+    assert "small" not in cache
+    assert cache.bytes_used == 90
+
+    cache.put("large", "l2", 20)
+    assert cache.bytes_used == 20
+    assert len(cache) == 1
+
+def test_expired_entries_are_purged_from_the_heap(clock):
+    cache = MemoryCache(max_bytes=1000, default_ttl=60)
+    cache.put("short", "s", 10, ttl=5)
+    cache.put("long", "l", 10)
+    clock[0] += 10
+    assert cache.get("short") is None
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 1
+
+    # A record left by an overwritten entry must not expire the new value
+    cache.put("long", "l2", 10, ttl=100)
+    clock[0] += 55
+    assert cache.purge_expired() == 0
+    assert cache.get("long") == "l2"
+
+def test_heap_is_rebuilt_when_replaced_records_pile_up(clock):
+    cache = MemoryCache(max_bytes=1000, default_ttl=60)
+    for i in range(200):
+        cache.put("key", i, 1)
+    assert len(cache._expiry_heap) <= 2 * len(cache) + 64
+    assert cache.get("key") == 199
+
+def test_stale_window(clock):
+    cache = MemoryCache(max_bytes=1000, default_ttl=10, stale_seconds=20)
+    cache.put("key", "value", 10)
+    clock[0] += 15
+    assert "key" not in cache
+    assert cache.get("key") is None
+    assert cache.get("key", allow_stale=True) == "value"
+    clock[0] += 15
+    assert cache.get("key", allow_stale=True) is None
+    assert cache.bytes_used == 0
+
+def test_stats(clock):
+    cache = MemoryCache(max_bytes=1000, default_ttl=60)
+    cache.put("key", "value", 10)
+    cache.get("key")
+    cache.get("missing")
+    cache.get("missing", record_stats=False)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+    assert cache.clear() == 1
+    assert cache.stats()["bytes_used"] == 0
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from request_blocking import Blocklist, RequestBlocker, ESTIMATED_BYTES, DEFAULT_ESTIMATED_BYTES
+
+class FakeFrame:
+    parent_frame = None
+
+class FakeRequest:
+    def __init__(self, url, resource_type, navigation=False):
+        self.url = url
+        self.resource_type = resource_type
+        self.frame = FakeFrame()
+        self._navigation = navigation
+
+    def is_navigation_request(self):
+        return self._navigation
+
+class FakeRoute:
+    def __init__(self, *args, **kwargs):
+        self.request = FakeRequest(*args, **kwargs)
+        self.outcome = None
+
+    async def abort(self, reason):
+        self.outcome = reason
+
+    async def fallback(self):
+        self.outcome = "fallback"
+
+def test_blocklist_matches_subdomains_and_path_prefixes():
+    blocklist = Blocklist(["doubleclick.net", "facebook.com/tr"])
+    assert blocklist.matches("doubleclick.net")
+    assert blocklist.matches("stats.g.doubleclick.net")
+    assert not blocklist.matches("notdoubleclick.net")
+    assert blocklist.matches("www.facebook.com", "/tr/")
+    assert not blocklist.matches("www.facebook.com", "/profile")
+
+def test_profiles():
+    page_script = ("https://example.com/app.js", "script", False)
+    tracker = ("https://www.google-analytics.com/analytics.js", "script", False)
+    widget = ("https://widget.intercom.io/widget/abc", "script", False)
+    video = ("https://example.com/intro.mp4", "media", False)
+    expected = {
+        "trackers": [tracker],
+        "aggressive": [tracker, widget, video],
+    }
+    for profile, blocked in expected.items():
+        blocker = RequestBlocker(profile)
+        requests = [page_script, tracker, widget, video]
+        assert [r for r in requests if blocker.should_block(*r)] == blocked
+    # "none" does not even install a route handler
+    assert RequestBlocker("none").blocklist is None
+
+def test_main_document_and_non_http_urls_are_never_blocked():
+    blocker = RequestBlocker("aggressive")
+    assert not blocker.should_block("https://doubleclick.net/", "document", True)
+    assert not blocker.should_block("data:text/javascript,1", "script", False)
+    # A tracker inside an iframe is still blocked
+    assert blocker.should_block("https://doubleclick.net/ad", "document", False)
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        RequestBlocker("everything")
+
+def test_handle_aborts_and_counts():
+    blocker = RequestBlocker("aggressive")
+    routes = [
+        FakeRoute("https://www.googletagmanager.com/gtm.js", "script"),
+        FakeRoute("https://example.com/live", "websocket"),
+        FakeRoute("https://example.com/style.css", "stylesheet"),
+    ]
+
+    async def run():
+        for route in routes:
+            await blocker.handle(route)
+
+    asyncio.run(run())
+    assert [route.outcome for route in routes] == ["blockedbyclient", "blockedbyclient", "fallback"]
+    assert blocker.stats()["blocked_requests"] == 2
+    assert blocker.stats()["blocked_by_type"] == {"script": 1, "websocket": 1}
+    assert blocker.stats()["estimated_bytes_saved"] == ESTIMATED_BYTES["script"] + DEFAULT_ESTIMATED_BYTES
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+from resource_cache import ResourceBudget, ResourceCache, ResourceCacheSession, freshness_lifetime, JOB_SCOPED_TTL
+
+class FakeRequest:
+    def __init__(self, url, resource_type="script", method="GET"):
+        self.url = url
+        self.resource_type = resource_type
+        self.method = method
+
+class FakeResponse:
+    def __init__(self, body, headers, status=200):
+        self._body = body
+        self.headers = headers
+        self.status = status
+
+    async def body(self):
+        return self._body
+
+class FakeRoute:
+    def __init__(self, url, origin, **kwargs):
+        self.request = FakeRequest(url, **kwargs)
+        self.origin = origin
+        self.fulfilled = None
+
+    async def fetch(self):
+        self.origin.fetches += 1
+        await asyncio.sleep(0)
+        return FakeResponse(self.origin.body, self.origin.headers)
+
+    async def fulfill(self, status, headers, body):
+        self.fulfilled = (status, headers, body)
+
+    async def fallback(self):
+        self.fulfilled = "fallback"
+
+class Origin:
+    def __init__(self, body=b"x" * 100, headers=None):
+        self.body = body
+        self.headers = headers or {"content-type": "text/javascript", "content-encoding": "gzip"}
+        self.fetches = 0
+
+def handle(cache, *routes):
+    """Run the routes concurrently through one page's session"""
+    session = ResourceCacheSession(cache)
+
+    async def run():
+        await asyncio.gather(*(session.handle(route) for route in routes))
+
+    asyncio.run(run())
+    return session
+
+def load(cache, origin, url, **kwargs):
+    route = FakeRoute(url, origin, **kwargs)
+    return route, handle(cache, route)
+
+def test_job_scoped_freshness_only_refuses_no_store_and_vary():
+    assert freshness_lifetime({}, shared=False) == JOB_SCOPED_TTL
+    assert freshness_lifetime({"cache-control": "private, max-age=0", "set-cookie": "a=b"}, shared=False) == JOB_SCOPED_TTL
+    assert freshness_lifetime({"cache-control": "no-store"}, shared=False) is None
+    assert freshness_lifetime({"vary": "User-Agent"}, shared=False) is None
+    assert freshness_lifetime({"vary": "Accept-Encoding, Origin"}, shared=False) == JOB_SCOPED_TTL
+
+def test_shared_freshness_follows_cache_control():
+    assert freshness_lifetime({"cache-control": "public, max-age=300"}, shared=True) == 300
+    assert freshness_lifetime({"cache-control": "max-age=300, s-maxage=60"}, shared=True) == 60
+    assert freshness_lifetime({"cache-control": "max-age=0"}, shared=True) is None
+    assert freshness_lifetime({"cache-control": "max-age=abc"}, shared=True) is None
+    assert freshness_lifetime({"cache-control": "private, max-age=300"}, shared=True) is None
+    assert freshness_lifetime({"cache-control": "no-cache"}, shared=True) is None
+    assert freshness_lifetime({"cache-control": "max-age=300", "set-cookie": "a=b"}, shared=True) is None
+    assert freshness_lifetime({}, shared=True) is None
+
+    expires = freshness_lifetime({"expires": formatdate(time.time() + 120, usegmt=True)}, shared=True)
+    assert 100 < expires <= 120
+    assert freshness_lifetime({"expires": formatdate(time.time() - 120, usegmt=True)}, shared=True) is None
+    assert freshness_lifetime({"expires": "0"}, shared=True) is None
+
+def test_second_load_is_served_from_the_cache():
+    cache = ResourceCache(1_000_000, 1_000)
+    origin = Origin()
+    first, session = load(cache, origin, "https://example.com/app.js")
+    second, session = load(cache, origin, "https://example.com/app.js")
+    assert origin.fetches == 1
+    assert second.fulfilled[2] == origin.body
+    # Bodies are stored decoded
+    assert "content-encoding" not in second.fulfilled[1]
+    assert session.stats() == {"hits": 1, "misses": 0, "bytes_from_cache": 100}
+
+def test_concurrent_misses_share_one_fetch():
+    cache = ResourceCache(1_000_000, 1_000)
+    origin = Origin()
+    routes = [FakeRoute("https://example.com/app.js", origin) for _ in range(3)]
+    session = handle(cache, *routes)
+    assert origin.fetches == 1
+    assert all(route.fulfilled[2] == origin.body for route in routes)
+    assert (session.hits, session.misses) == (2, 1)
+
+def test_uncacheable_requests_go_to_the_network():
+    cache = ResourceCache(1_000_000, 50)
+    origin = Origin()
+    route, _ = load(cache, origin, "https://example.com/api", resource_type="xhr")
+    assert route.fulfilled == "fallback"
+    route, _ = load(cache, origin, "https://example.com/form", method="POST")
+    assert route.fulfilled == "fallback"
+    # Larger than max_entry_bytes: fetched, passed through, not kept
+    load(cache, origin, "https://example.com/app.js")
+    load(cache, origin, "https://example.com/app.js")
+    assert origin.fetches == 2
+
+def test_job_caches_share_one_budget():
+    budget = ResourceBudget(700)
+    first = ResourceCache(1_000_000, 1_000, budget=budget)
+    second = ResourceCache(1_000_000, 1_000, budget=budget)
+    origin = Origin(body=b"x" * 44)  # 300 bytes stored with the entry overhead
+    load(first, origin, "https://example.com/a.js")
+    load(second, origin, "https://example.com/b.js")
+    assert budget.stats() == {"live_caches": 2, "bytes_used": 600, "max_bytes": 700}
+
+    # Over budget: fetched and served, but not kept
+    load(second, origin, "https://example.com/c.js")
+    load(second, origin, "https://example.com/c.js")
+    assert origin.fetches == 4
+
+    first.close()
+    assert budget.stats()["bytes_used"] == 300
+    load(second, origin, "https://example.com/c.js")
+    load(second, origin, "https://example.com/c.js")
+    assert origin.fetches == 5
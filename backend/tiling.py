@@ -0,0 +1,30 @@
+from typing import Dict, List
+from playwright.async_api import Page
+from image_pipeline import Screenshot
+
+def _clip(top: int, width: int, height: int) -> Dict:
+    return {"x": 0, "y": top, "width": width, "height": height}
+
+async def screenshot_region(page: Page, width: int, height: int, args: Dict,
+                            tile_height: int, max_height: int) -> Screenshot:
+    """
+    The top width x height CSS pixels of a page.
+
+    Chromium rasterises a screenshot into one bitmap, so a 30000px page is
+    hundreds of MB in the browser process. Regions up to tile_height output
+    pixels are still taken in one go (in the format of args); taller ones
+    are taken as strips of at most tile_height, each its own capture.
+    Output is cut off at max_height pixels. full_page=True is what lets a
+    clip reach below the viewport; without it Playwright trims the clip to
+    the visible area.
+    """
+    scale = await page.evaluate("window.devicePixelRatio") or 1
+    height = max(1, min(height, int(max_height / scale)))
+    strip = max(1, int(tile_height / scale))
+    if height <= strip:
+        return await page.screenshot(**args, full_page=True, clip=_clip(0, width, height))
+    strips: List[bytes] = []
+    for top in range(0, height, strip):
+        # Lossless: the strips are decoded and encoded once more when stitched
+        strips.append(await page.screenshot(type="png", full_page=True, clip=_clip(top, width, min(strip, height - top))))
+    return strips
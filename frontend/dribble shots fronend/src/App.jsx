@@ -336,63 +336,108 @@ function App() {
       setLoadingMessage(`Queued at position ${initialPosition}...`);
       setLoadingProgress(10);
 
-      // Poll for job status
-      const pollInterval = setInterval(async () => {
-        try {
-          const statusResponse = await fetch(`${API_BASE}/capture/status/${currentJobId}`);
-          
-          if (!statusResponse.ok) {
-            throw new Error('Failed to check job status');
+      // Apply a status update to the UI; returns true once the job has completed,
+      // throws once it has failed or been cancelled
+      const handleStatus = (statusData) => {
+        // Update queue position
+        if (statusData.queue_position > 0) {
+          setQueuePosition(statusData.queue_position);
+          setLoadingMessage(`Waiting in queue... Position: ${statusData.queue_position}`);
+          setLoadingProgress(10 + (statusData.queue_position === 1 ? 20 : 0));
+        } else if (statusData.status === 'processing') {
+          setQueuePosition(0);
+          setLoadingMessage('Processing your request...');
+          setLoadingProgress(30);
+        } else if (statusData.status === 'completed') {
+          setLoadingMessage('Processing screenshots...');
+          setLoadingProgress(70);
+
+          // Result carries image URLs (raw JPEG served with ETag caching)
+          setDesktopSrc(`${API_BASE}${statusData.result.desktop_url}`);
+          setMobileSrc(`${API_BASE}${statusData.result.mobile_url}`);
+          // Store website title from backend
+          if (statusData.result.title) {
+            setWebsiteTitle(statusData.result.title);
           }
 
-          const statusData = await statusResponse.json();
-          
-          // Update queue position
-          if (statusData.queue_position > 0) {
-            setQueuePosition(statusData.queue_position);
-            setLoadingMessage(`Waiting in queue... Position: ${statusData.queue_position}`);
-            setLoadingProgress(10 + (statusData.queue_position === 1 ? 20 : 0));
-          } else if (statusData.status === 'processing') {
-            setQueuePosition(0);
-            setLoadingMessage('Processing your request...');
-            setLoadingProgress(30);
-          } else if (statusData.status === 'completed') {
-            clearInterval(pollInterval);
-            
-            setLoadingMessage('Processing screenshots...');
-                            setLoadingProgress(70);
-                            
-                            setDesktopSrc(`data:image/png;base64,${statusData.result.desktop}`);
-                            setMobileSrc(`data:image/png;base64,${statusData.result.mobile}`);
-                            // Store website title from backend
-                            if (statusData.result.title) {
-                              setWebsiteTitle(statusData.result.title);
-                            }
-            
-            setLoadingProgress(100);
-            setLoadingMessage('Complete!');
-            setQueuePosition(0);
-            
-            // Small delay to show completion
-            setTimeout(() => {
-              setCurrentStep(2); // Move to template selection
-              setLoading(false);
-              setJobId(null);
-            }, 300);
-            
-          } else if (statusData.status === 'failed') {
+          setLoadingProgress(100);
+          setLoadingMessage('Complete!');
+          setQueuePosition(0);
+
+          // Small delay to show completion
+          setTimeout(() => {
+            setCurrentStep(2); // Move to template selection
+            setLoading(false);
+            setJobId(null);
+          }, 300);
+          return true;
+        } else if (statusData.status === 'failed') {
+          throw new Error(statusData.error || 'Job failed');
+        } else if (statusData.status === 'cancelled') {
+          // DELETE /capture/{job_id}: terminal, nothing more will arrive
+          throw new Error('Capture was cancelled');
+        }
+        return false;
+      };
+
+      const handleJobError = (err) => {
+        setError(err.message);
+        setLoading(false);
+        setLoadingProgress(0);
+        setQueuePosition(0);
+        setJobId(null);
+      };
+
+      // Fallback: poll for job status
+      const startPolling = () => {
+        const pollInterval = setInterval(async () => {
+          try {
+            const statusResponse = await fetch(`${API_BASE}/capture/status/${currentJobId}`);
+
+            if (!statusResponse.ok) {
+              throw new Error('Failed to check job status');
+            }
+
+            if (handleStatus(await statusResponse.json())) {
+              clearInterval(pollInterval);
+            }
+          } catch (err) {
             clearInterval(pollInterval);
-            throw new Error(statusData.error || 'Job failed');
+            handleJobError(err);
+          }
+        }, 10000); // Poll every 10 seconds
+      };
+
+      if (typeof EventSource === 'undefined') {
+        startPolling();
+        return;
+      }
+
+      // Server pushes queue position, capture phases and the final result
+      const events = new EventSource(`${API_BASE}/capture/events/${currentJobId}`);
+      const onEvent = (e) => {
+        try {
+          if (handleStatus(JSON.parse(e.data))) {
+            events.close();
           }
         } catch (err) {
-          clearInterval(pollInterval);
-          setError(err.message);
-          setLoading(false);
-          setLoadingProgress(0);
-          setQueuePosition(0);
-          setJobId(null);
+          events.close();
+          handleJobError(err);
         }
-      }, 10000); // Poll every 10 seconds
+      };
+      events.addEventListener('status', onEvent);
+      events.addEventListener('position', onEvent);
+      events.addEventListener('done', onEvent);
+      events.addEventListener('phase', (e) => {
+        const { viewport, phase } = JSON.parse(e.data);
+        setLoadingMessage(`Capturing ${viewport}: ${phase}...`);
+        setLoadingProgress((progress) => Math.min(progress + 5, 65));
+      });
+      events.onerror = () => {
+        // Stream unavailable (proxy, old backend): fall back to polling
+        events.close();
+        startPolling();
+      };
       
     } catch (err) {
       setError(err.message);